@@ -1,10 +1,24 @@
-from calphy.input import Calculation
-from calphy.liquid import Liquid
-from calphy.solid import Solid
-from calphy.alchemy import Alchemy
-from calphy.routines import MeltingTemp
-
 __version__ = "1.4.10"
 
+# the classes are imported only when first accessed, so that the command
+# line tools do not pay for importing LAMMPS, pyscal3 and so on
+_lazy_imports = {
+    "Calculation": "calphy.input",
+    "Liquid": "calphy.liquid",
+    "Solid": "calphy.solid",
+    "Alchemy": "calphy.alchemy",
+    "MeltingTemp": "calphy.routines",
+}
+
+def __getattr__(name):
+    if name in _lazy_imports:
+        import importlib
+        module = importlib.import_module(_lazy_imports[name])
+        return getattr(module, name)
+    raise AttributeError(f"module 'calphy' has no attribute '{name}'")
+
+def __dir__():
+    return sorted(list(globals().keys()) + list(_lazy_imports.keys()))
+
 def addtest(a,b):
     return a+b
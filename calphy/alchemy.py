@@ -115,7 +115,7 @@ class Alchemy(cph.Phase):
 
         #check for melting
         self.dump_current_snapshot(lmp, "traj.equilibration_stage2.dat")
-        self.check_if_melted(lmp, "traj.equilibration_stage2.dat")
+        self.check_if_melted(lmp)
 
         #close object and process traj
         lmp = ph.write_data(lmp, "conf.equilibration.data")
@@ -258,11 +258,11 @@ class Alchemy(cph.Phase):
 
         
         #save the necessary items to a file: first step
-        lmp.command("fix             f2 all print 1 \"${dU1} ${dU2} ${flambda}\" screen no file forward_%d.dat"%iteration)
+        self.start_data_collection(lmp, "f2", ["dU1", "dU2", "flambda"], "forward_%d.dat"%iteration)
         lmp.command("run             %d"%self.calc._n_switching_steps)            
 
         #now equilibrate at the second potential
-        lmp.command("unfix           f2")
+        self.stop_data_collection(lmp, "f2", ["dU1", "dU2", "flambda"], "forward_%d.dat"%iteration)
         lmp.command("uncompute       c1")
         lmp.command("uncompute       c2")
 
@@ -342,12 +342,12 @@ class Alchemy(cph.Phase):
 
         
         #save the necessary items to a file: first step
-        lmp.command("fix             f2 all print 1 \"${dU1} ${dU2} ${flambda}\" screen no file backward_%d.dat"%iteration)
+        self.start_data_collection(lmp, "f2", ["dU1", "dU2", "flambda"], "backward_%d.dat"%iteration)
         lmp.command("run             %d"%self.calc._n_switching_steps)
 
 
         #now equilibrate at the second potential
-        lmp.command("unfix           f2")
+        self.stop_data_collection(lmp, "f2", ["dU1", "dU2", "flambda"], "backward_%d.dat"%iteration)
         lmp.command("uncompute       c1")
         lmp.command("uncompute       c2")
 
@@ -375,7 +375,8 @@ class Alchemy(cph.Phase):
         the calculated free energy is the same as the work.
         """
         w, q, qerr = find_w(self.simfolder, self.calc,
-            full=True, solid=False)
+            full=True, solid=False, data=self.data,
+            iterations=self.get_iterations())
 
         self.w = w
         self.ferr = qerr
@@ -383,7 +384,8 @@ class Alchemy(cph.Phase):
         
         if self.calc.mode == "composition_scaling":
             w_arr, q_arr, qerr_arr, flambda_arr = find_w(self.simfolder, self.calc,
-                full=True, solid=False, composition_integration=True)
+                full=True, solid=False, composition_integration=True, data=self.data,
+                iterations=self.get_iterations())
 
             #now we need to process the comp scaling
             return flambda_arr, w_arr, q_arr, qerr_arr
@@ -7,13 +7,13 @@ import yaml
 import time
 import datetime
 
-from calphy.input import read_inputfile, load_job, save_job, _convert_legacy_inputfile
-from calphy.liquid import Liquid
-from calphy.solid import Solid
-from calphy.alchemy import Alchemy
-from calphy.phase_diagram import prepare_inputs_for_phase_diagram
+from calphy.input import read_calculation, load_state, save_job, _convert_legacy_inputfile
 
 def _generate_job(calc, simfolder):
+    from calphy.liquid import Liquid
+    from calphy.solid import Solid
+    from calphy.alchemy import Alchemy
+
     if calc.mode == "alchemy" or calc.mode == "composition_scaling":
         job = Alchemy(calculation=calc, simfolder=simfolder)
         return job
@@ -26,6 +26,12 @@ def _generate_job(calc, simfolder):
             return job
 
 
+def _load_job(calc):
+    job = _generate_job(calc, calc.get_folder_name())
+    job.set_state(load_state(calc.savefile))
+    return job
+
+
 def run_averaging():
     arg = ap.ArgumentParser()
     arg.add_argument("-i", "--input", required=True, type=str,
@@ -34,8 +40,7 @@ def run_averaging():
     help="kernel number of the calculation to be run.")
     args = vars(arg.parse_args())
     kernel = args["kernel"]
-    calculations = read_inputfile(args["input"])
-    calc = calculations[kernel]
+    calc = read_calculation(args["input"], kernel)
 
     simfolder = calc.create_folders()
     job = _generate_job(calc, simfolder)
@@ -54,10 +59,9 @@ def process_averaging():
     help="kernel number of the calculation to be run.")
     args = vars(arg.parse_args())
     kernel = args["kernel"]
-    calculations = read_inputfile(args["input"])
-    calc = calculations[kernel]
+    calc = read_calculation(args["input"], kernel)
 
-    job = load_job(calc.savefile)
+    job = _load_job(calc)
     job.process_averaging_results()
     save_job(job)
 
@@ -69,10 +73,9 @@ def run_integration():
     help="kernel number of the calculation to be run.")
     args = vars(arg.parse_args())
     kernel = args["kernel"]
-    calculations = read_inputfile(args["input"])
-    calc = calculations[kernel]
+    calc = read_calculation(args["input"], kernel)
 
-    job = load_job(calc.savefile)
+    job = _load_job(calc)
     job.run_integration()
     save_job(job)
 
@@ -84,10 +87,9 @@ def process_integration():
     help="kernel number of the calculation to be run.")
     args = vars(arg.parse_args())
     kernel = args["kernel"]
-    calculations = read_inputfile(args["input"])
-    calc = calculations[kernel]
+    calc = read_calculation(args["input"], kernel)
 
-    job = load_job(calc.savefile)
+    job = _load_job(calc)
     job.thermodynamic_integration()
     job.submit_report()
     save_job(job)
@@ -126,4 +128,5 @@ def phase_diagram():
     arg.add_argument("-i", "--input", required=True, type=str,
     help="name of the input file")
     args = vars(arg.parse_args())
+    from calphy.phase_diagram import prepare_inputs_for_phase_diagram
     prepare_inputs_for_phase_diagram(args['input'])
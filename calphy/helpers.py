@@ -48,6 +48,59 @@ class LammpsScript:
                 fout.write(f"{line}\n")
 
 
+class LammpsBatch:
+    """
+    Collect LAMMPS commands and send them together
+
+    Parameters
+    ----------
+    lmp : LammpsLibrary or lammps object
+
+    Notes
+    -----
+    With `LammpsLibrary`, each command is a round trip to the MPI processes.
+    Commands are kept until one which runs the system, writes output or closes
+    a fix writing to a file, and then sent in a single call, so that files read
+    afterwards are complete. Any other method, such as `extract_box` or
+    `close`, sends the collected commands before it is called.
+    """
+    flush_commands = [
+        "run",
+        "minimize",
+        "write_data",
+        "write_dump",
+        "write_restart",
+        "unfix",
+        "undump",
+        "print",
+        "shell",
+    ]
+
+    def __init__(self, lmp):
+        self.lmp = lmp
+        self.commands = []
+
+    def command(self, command_str):
+        self.commands.append(command_str)
+        raw = command_str.split()
+        if (len(raw) > 0) and (raw[0] in self.flush_commands):
+            self.flush()
+
+    def flush(self):
+        if len(self.commands) == 0:
+            return
+        commands = self.commands
+        self.commands = []
+        if isinstance(self.lmp, lammps):
+            self.lmp.commands_list(commands)
+        else:
+            self.lmp.command(commands)
+
+    def __getattr__(self, name):
+        self.flush()
+        return getattr(self.lmp, name)
+
+
 def create_object(
     cores, directory, timestep, cmdargs="", init_commands=(), script_mode=False
 ):
@@ -76,7 +129,9 @@ def create_object(
             cmdargs = None
         elif isinstance(cmdargs, str):
             cmdargs = cmdargs.split()
-        lmp = LammpsLibrary(cores=cores, working_directory=directory, cmdargs=cmdargs)
+        lmp = LammpsBatch(
+            LammpsLibrary(cores=cores, working_directory=directory, cmdargs=cmdargs)
+        )
 
     commands = [
         ["units", "metal"],
@@ -216,11 +271,57 @@ PYSCAL helper routines
 def find_solid_fraction(file):
     sys = pc.System(file)
     try:
-        sys.find.neighbors(method="cutoff", cutoff=0)
+        solids = count_solids(sys, cutoff=0)
     except RuntimeError:
-        sys.find.neighbors(
-            method="cutoff", cutoff=5.0
+        solids = count_solids(
+            sys, cutoff=5.0
         )  # Maybe add value as convergence param?
+    return solids
+
+
+def get_system(lmp):
+    """
+    Create a pyscal System from the current configuration in LAMMPS
+
+    Parameters
+    ----------
+    lmp : LammpsLibrary object
+
+    Returns
+    -------
+    sys : pyscal System
+
+    Notes
+    -----
+    Positions and box are gathered through the library interface, so that no
+    snapshot has to be written and read back.
+    """
+    x = np.array(lmp.gather_atoms("x", 1, 3), dtype=float).reshape(-1, 3)
+    boxlo, boxhi, xy, yz, xz = lmp.extract_box()[:5]
+    boxlo = np.array(boxlo, dtype=float)
+    boxhi = np.array(boxhi, dtype=float)
+    lx, ly, lz = boxhi - boxlo
+    box = [[lx, 0, 0], [xy, ly, 0], [xz, yz, lz]]
+    return pc.System(atoms={"positions": x - boxlo}, box=box)
+
+
+def count_solids(sys, cutoff=0):
+    """
+    Count the solid atoms with the Steinhardt bond order criterion
+
+    Parameters
+    ----------
+    sys : pyscal System
+
+    cutoff : float, optional
+        neighbor cutoff, 0 selects an adaptive cutoff
+
+    Returns
+    -------
+    solids : int
+        number of solid atoms
+    """
+    sys.find.neighbors(method="cutoff", cutoff=cutoff)
     sys.find.solids(cluster=False)
     solids = np.sum(sys.atoms.solid)
     return solids
@@ -327,3 +428,153 @@ def validate_spring_constants(data, klo=0.0001, khi=1000.0, logger=None):
                 )
 
     return data
+
+
+class DataFileTail:
+    """
+    Read a growing data file, such as the output of `fix ave/time`, incrementally
+
+    Parameters
+    ----------
+    filename : string
+        name of the data file
+
+    usecols : list of ints
+        columns to be read
+
+    Notes
+    -----
+    Only the complete lines written since the last call to `read` are parsed,
+    so that the cost of each read is proportional to the number of new rows.
+    """
+
+    def __init__(self, filename, usecols):
+        self.filename = filename
+        self.usecols = list(usecols)
+        self.offset = 0
+
+    def read(self):
+        """
+        Read the rows added since the last call
+
+        Returns
+        -------
+        data : ndarray
+            array of shape (len(usecols), nrows), the same layout as
+            `np.loadtxt(filename, usecols=usecols, unpack=True)`
+        """
+        if not os.path.exists(self.filename):
+            return np.zeros((len(self.usecols), 0))
+
+        with open(self.filename, "rb") as fin:
+            fin.seek(self.offset)
+            chunk = fin.read()
+
+        # an incomplete last line is read again next time
+        end = chunk.rfind(b"\n") + 1
+        self.offset += end
+
+        rows = []
+        for line in chunk[:end].decode().splitlines():
+            raw = line.split()
+            if (len(raw) == 0) or raw[0].startswith("#"):
+                continue
+            rows.append([float(raw[col]) for col in self.usecols])
+        return np.array(rows, dtype=float).reshape(-1, len(self.usecols)).T
+
+
+class RunningAverage:
+    """
+    Streaming mean and statistical error of a correlated time series
+
+    Parameters
+    ----------
+    min_blocks : int, optional
+        minimum number of blocks needed to use a blocking level for the error
+
+    Notes
+    -----
+    Samples are accumulated in the blocking scheme of Flyvbjerg and Petersen,
+    J. Chem. Phys. 91, 461 (1989). Level `n` holds the sums of blocks of size
+    `2**n`, which are updated as samples arrive, so that adding a sample is
+    O(1) on average and the memory is O(log(nsamples)). The error of the mean
+    is the largest standard error over the blocking levels, which accounts for
+    the correlation between consecutive samples.
+    """
+
+    def __init__(self, min_blocks=16):
+        self.min_blocks = min_blocks
+        self._count = []
+        self._sum = []
+        self._sumsq = []
+        self._pending = []
+
+    def add(self, values):
+        """
+        Add samples
+
+        Parameters
+        ----------
+        values : float or array of floats
+            new samples
+
+        Returns
+        -------
+        None
+        """
+        for value in np.atleast_1d(values):
+            value = float(value)
+            level = 0
+            while True:
+                if level == len(self._count):
+                    self._count.append(0)
+                    self._sum.append(0.0)
+                    self._sumsq.append(0.0)
+                    self._pending.append(None)
+                self._count[level] += 1
+                self._sum[level] += value
+                self._sumsq[level] += value * value
+                if self._pending[level] is None:
+                    self._pending[level] = value
+                    break
+                # two blocks complete a block of the next level
+                value = 0.5 * (self._pending[level] + value)
+                self._pending[level] = None
+                level += 1
+
+    def _variance(self, level):
+        n = self._count[level]
+        mean = self._sum[level] / n
+        return max(self._sumsq[level] / n - mean * mean, 0.0)
+
+    @property
+    def count(self):
+        return self._count[0] if len(self._count) > 0 else 0
+
+    @property
+    def mean(self):
+        if self.count == 0:
+            return np.nan
+        return self._sum[0] / self._count[0]
+
+    @property
+    def std(self):
+        if self.count == 0:
+            return np.nan
+        return np.sqrt(self._variance(0))
+
+    @property
+    def error(self):
+        """
+        Standard error of the mean, `np.inf` if there are too few samples
+        """
+        if self.count < 2:
+            return np.inf
+        errors = [
+            np.sqrt(self._variance(level) / (n - 1))
+            for level, n in enumerate(self._count)
+            if n >= self.min_blocks
+        ]
+        if len(errors) == 0:
+            errors = [np.sqrt(self._variance(0) / (self.count - 1))]
+        return np.max(errors)
@@ -34,23 +34,25 @@ from pydantic import (
 )
 from pydantic.functional_validators import AfterValidator, BeforeValidator
 from annotated_types import Len
-import mendeleev
-from tqdm import tqdm
 
-import yaml
+import calphy.yamlio as yamlio
 import numpy as np
 import copy
 import datetime
 import itertools
 import os
 import warnings
-from pyscal3 import System
-from pyscal3.core import structure_dict, element_dict, _make_crystal
-from ase.io import read, write
+import hashlib
+import pickle
+import json
+from ase.data import atomic_numbers
 import shutil
 
 __version__ = "1.4.10"
 
+# version of the job state file written by `save_job`
+STATE_VERSION = 1
+
 
 def _check_equal(val):
     if not (val[0] == val[1] == val[2]):
@@ -121,16 +123,14 @@ def _extract_elements_from_pair_coeff(pair_coeff_string):
         # Check if this looks like an element symbol
         # Element symbols are 1-2 characters, start with uppercase
         if len(p) <= 2 and p[0].isupper():
-            try:
-                # Verify it's a valid element using mendeleev
-                _ = mendeleev.element(p)
+            # Verify it's a valid element; ase.data is much cheaper
+            # to import than mendeleev
+            if atomic_numbers.get(p, 0) > 0:
                 elements.append(p)
                 started = True
-            except:
-                # Not a valid element, might be done collecting
-                if started:
-                    # We already started collecting elements and hit a non-element
-                    break
+            elif started:
+                # We already started collecting elements and hit a non-element
+                break
 
     return elements if len(elements) > 0 else None
 
@@ -202,6 +202,9 @@ class Berendsen(BaseModel, title="Specific input options for Berendsen thermosta
 class Queue(BaseModel, title="Options for configuring queue"):
     scheduler: Annotated[str, Field(default="local")]
     cores: Annotated[int, Field(default=1, gt=0)]
+    max_cores: Annotated[int, Field(default=0, ge=0)]
+    job_array: Annotated[bool, Field(default=False)]
+    array_pack: Annotated[int, Field(default=1, ge=1)]
     jobname: Annotated[str, Field(default="calphy")]
     walltime: Annotated[str, Field(default="23:59:00")]
     queuename: Annotated[str, Field(default="")]
@@ -222,6 +225,16 @@ class MeltingTemperature(BaseModel, title="Input options for melting temperature
     guess: Annotated[Union[float, None], Field(default=None, gt=0)]
     step: Annotated[int, Field(default=200, ge=20)]
     attempts: Annotated[int, Field(default=5, ge=1)]
+    concurrent: Annotated[bool, Field(default=False)]
+
+
+class AdaptiveSwitching(BaseModel, title="Input options for adaptive switching length"):
+    active: Annotated[bool, Field(default=False)]
+    target_dissipation: Annotated[float, Field(default=0.001, gt=0)]
+    initial_steps: Annotated[int, Field(default=10000, ge=1)]
+    min_steps: Annotated[int, Field(default=5000, ge=1)]
+    max_steps: Annotated[int, Field(default=200000, ge=1)]
+    max_rounds: Annotated[int, Field(default=5, ge=1)]
 
 
 class MaterialsProject(BaseModel, title="Input options for materials project"):
@@ -258,6 +271,7 @@ class Calculation(BaseModel, title="Main input class"):
     tolerance: Optional[Tolerance] = Tolerance()
     uhlenbeck_ford_model: Optional[UFMP] = UFMP()
     melting_temperature: Optional[MeltingTemperature] = MeltingTemperature()
+    adaptive_switching: Optional[AdaptiveSwitching] = AdaptiveSwitching()
     materials_project: Optional[MaterialsProject] = MaterialsProject()
 
     element: Annotated[List[str], BeforeValidator(to_list), Field(default=[])]
@@ -331,7 +345,14 @@ class Calculation(BaseModel, title="Main input class"):
     _n_switching_steps: int = PrivateAttr(default=50000)
     _n_sweep_steps: int = PrivateAttr(default=50000)
     n_print_steps: Annotated[int, Field(default=0)]
+    in_memory_data: Annotated[bool, Field(default=False)]
+    persistent_session: Annotated[bool, Field(default=False)]
+    warm_start_sweeps: Annotated[bool, Field(default=False)]
+    n_decorrelation_steps: Annotated[int, Field(default=5000, ge=0)]
+    restart: Annotated[bool, Field(default=False)]
     n_iterations: Annotated[int, Field(default=1)]
+    n_parallel_iterations: Annotated[int, Field(default=1, ge=1)]
+    target_error: Annotated[Union[float, None], Field(default=None, gt=0)]
     equilibration_control: Annotated[Union[str, None], Field(default=None)]
     folder_prefix: Annotated[Union[str, None], Field(default=None)]
 
@@ -432,13 +453,17 @@ class Calculation(BaseModel, title="Main input class"):
 
         self._temperature_input = copy.copy(self.temperature)
         # guess a melting temp of the system, this will be mostly ignored
-        # chem = mendeleev.element(self.element[0])
-        # self._melting_temperature = chem.melting_point
-        try:
-            chem = mendeleev.element(self.element[0])
-            self._melting_temperature = chem.melting_point
-        except:
-            self._melting_temperature = None
+        # it is only needed for melting temperature calculations, or if no
+        # temperature is given; mendeleev is slow to import, so skip otherwise
+        self._melting_temperature = None
+        if (self.temperature == 0) or (self.mode == "melting_temperature"):
+            try:
+                import mendeleev
+
+                chem = mendeleev.element(self.element[0])
+                self._melting_temperature = chem.melting_point
+            except:
+                self._melting_temperature = None
 
         if self.temperature == 0:
             # the only situation in which it can be None is if mode is melting temp
@@ -508,9 +533,12 @@ class Calculation(BaseModel, title="Main input class"):
             self._element_dict[element]["mass"] = self.mass[count]
             self._element_dict[element]["count"] = 0
             self._element_dict[element]["composition"] = 0.0
-            self._element_dict[element]["atomic_number"] = mendeleev.element(
-                element
-            ).atomic_number
+            self._element_dict[element]["atomic_number"] = atomic_numbers[element]
+
+        # structure handling needs pyscal3 and ase.io, import them here
+        # to keep the import of this module light
+        from pyscal3.core import structure_dict, element_dict, _make_crystal
+        from ase.io import read, write
 
         # generate temporary filename if needed
         write_structure_file = False
@@ -831,6 +859,9 @@ class Calculation(BaseModel, title="Main input class"):
 
         # if folder exists, delete it -> then create
         if os.path.exists(simfolder):
+            # the completed stages are read in by the job
+            if self.restart:
+                return simfolder
             raise ValueError(
                 f"Simulation folder {simfolder} exists. Please remove and run again!"
             )
@@ -841,15 +872,72 @@ class Calculation(BaseModel, title="Main input class"):
     @property
     def savefile(self):
         simfolder = self.get_folder_name()
-        return os.path.join(simfolder, "job.npy")
+        return os.path.join(simfolder, "job_state.json")
 
 
 def save_job(job):
-    filename = os.path.join(job.simfolder, "job.npy")
-    np.save(filename, job)
+    """
+    Save the numeric state of a job
+
+    Parameters
+    ----------
+    job: Phase class
+        job to be saved
+
+    Returns
+    -------
+    None
+
+    Notes
+    -----
+    Only the state returned by `Phase.get_state` is written, as json, to
+    `job_state.json` in the simulation folder. The job is recreated from
+    the input file and this state with `load_state`.
+    """
+    data = {
+        "state_version": STATE_VERSION,
+        "calphy_version": __version__,
+        "state": job.get_state(),
+    }
+    filename = os.path.join(job.simfolder, "job_state.json")
+    tmpfile = filename + ".tmp"
+    with open(tmpfile, "w") as fout:
+        json.dump(data, fout, indent=2)
+    os.replace(tmpfile, filename)
+
+
+def load_state(filename):
+    """
+    Read a job state written by `save_job`
+
+    Parameters
+    ----------
+    filename: string
+        state file
+
+    Returns
+    -------
+    state: dict
+        state to be passed to `Phase.set_state`
+    """
+    with open(filename, "r") as fin:
+        data = json.load(fin)
+    version = data.get("state_version", None)
+    if version != STATE_VERSION:
+        raise ValueError(
+            f"State file {filename} has version {version}, expected {STATE_VERSION}"
+        )
+    return data["state"]
 
 
 def load_job(filename):
+    """
+    Load a pickled job written by calphy versions before the state file
+    """
+    warnings.warn(
+        "Loading pickled jobs is deprecated, use save_job and load_state instead",
+        DeprecationWarning,
+    )
     job = np.load(filename, allow_pickle=True).flatten()[0]
     return job
 
@@ -859,7 +947,7 @@ def read_inputfile(file):
         raise FileNotFoundError(f"Input file {file} not found.")
 
     with open(file, "r") as fin:
-        data = yaml.safe_load(fin)
+        data = yamlio.safe_load(fin)
 
     if "element" in data.keys():
         # old format
@@ -871,21 +959,158 @@ def read_inputfile(file):
 
 
 def _read_inputfile(file):
+    from tqdm import tqdm
+
     with open(file, "r") as fin:
-        data = yaml.safe_load(fin)
+        data = yamlio.safe_load(fin)
     calculations = []
     for count, calc in enumerate(tqdm(data["calculations"])):
-        calc["kernel"] = count
-        calc["inputfile"] = file
-        if "pressure" in calc.keys():
-            calc["pressure"] = _to_none(calc["pressure"])
-        calculations.append(Calculation(**calc))
+        calculations.append(_validate_calculation(calc, count, file))
     return calculations
 
 
+def _validate_calculation(calc, kernel, file):
+    calc["kernel"] = kernel
+    calc["inputfile"] = file
+    if "pressure" in calc.keys():
+        calc["pressure"] = _to_none(calc["pressure"])
+    return Calculation(**calc)
+
+
+def _get_referenced_files(calc):
+    """
+    Get the files a calculation in an input file refers to
+
+    These are the structure file, the potential file, and the files
+    in `pair_coeff`, such as the potential parameters.
+    """
+    candidates = []
+    for key in ["lattice", "potential_file"]:
+        if isinstance(calc.get(key), str):
+            candidates.append(calc[key])
+    pair_coeff = calc.get("pair_coeff", [])
+    if isinstance(pair_coeff, str):
+        pair_coeff = [pair_coeff]
+    for pc in pair_coeff:
+        if isinstance(pc, str):
+            candidates.extend(pc.split())
+    return [x for x in candidates if os.path.isfile(x)]
+
+
+def _get_cache_file(file, kernel, calc):
+    """
+    Get the cache file for a calculation in an input file
+
+    The key includes the file contents, the working directory, since
+    relative paths are resolved against it, and the calphy version.
+    The modification time and size of the files the calculation refers
+    to are included as well, so that editing them gives a new entry.
+    """
+    with open(file, "rb") as fin:
+        content = fin.read()
+    hasher = hashlib.sha256(content)
+    hasher.update(os.getcwd().encode())
+    hasher.update(__version__.encode())
+    for reffile in _get_referenced_files(calc):
+        stat = os.stat(reffile)
+        key = "%s:%d:%d" % (os.path.abspath(reffile), stat.st_mtime_ns, stat.st_size)
+        hasher.update(key.encode())
+    filename = ".".join(
+        [os.path.basename(file), hasher.hexdigest()[:16], str(kernel), "pkl"]
+    )
+    return os.path.join(
+        os.path.dirname(os.path.abspath(file)), ".calphy_cache", filename
+    )
+
+
+def _read_cached_calculation(cachefile):
+    if not os.path.exists(cachefile):
+        return None
+    try:
+        with open(cachefile, "rb") as fin:
+            calc = pickle.load(fin)
+    except Exception:
+        return None
+    # validation writes out the structure file, which could have been removed
+    if not os.path.isfile(calc.lattice):
+        return None
+    return calc
+
+
+def _write_cached_calculation(cachefile, calc):
+    try:
+        os.makedirs(os.path.dirname(cachefile), exist_ok=True)
+        # write and rename, so that concurrent tasks never see partial files
+        tmpfile = ".".join([cachefile, str(os.getpid()), "tmp"])
+        with open(tmpfile, "wb") as fout:
+            pickle.dump(calc, fout)
+        os.replace(tmpfile, cachefile)
+    except OSError:
+        warnings.warn(f"Could not write input cache {cachefile}")
+
+
+def read_calculation(file, kernel, cache=True):
+    """
+    Read and validate a single calculation from an input file
+
+    Parameters
+    ----------
+    file: string
+        input file
+
+    kernel: int
+        index of the calculation in the input file
+
+    cache: bool, optional
+        If True, the validated calculation is stored in a `.calphy_cache`
+        folder next to the input file, and reused as long as the input
+        file, the files it refers to and the working directory do not
+        change. Default True.
+
+    Returns
+    -------
+    calc: Calculation
+        the validated calculation
+
+    Notes
+    -----
+    Only the selected calculation is validated, which keeps the startup
+    of array jobs independent of the number of calculations in the file.
+    """
+    if not os.path.exists(file):
+        raise FileNotFoundError(f"Input file {file} not found.")
+
+    with open(file, "r") as fin:
+        data = yamlio.safe_load(fin)
+
+    if "element" in data.keys():
+        # old format
+        file = _convert_legacy_inputfile(file)
+        with open(file, "r") as fin:
+            data = yamlio.safe_load(fin)
+
+    ncalcs = len(data["calculations"])
+    if not (0 <= kernel < ncalcs):
+        raise IndexError(
+            f"Kernel {kernel} not found, {file} has {ncalcs} calculations"
+        )
+
+    if cache:
+        cachefile = _get_cache_file(file, kernel, data["calculations"][kernel])
+        calc = _read_cached_calculation(cachefile)
+        if calc is not None:
+            return calc
+
+    calc = _validate_calculation(data["calculations"][kernel], kernel, file)
+
+    if cache:
+        _write_cached_calculation(cachefile, calc)
+    return calc
+
+
 def _convert_legacy_inputfile(file, return_calcs=False):
     with open(file, "r") as fin:
-        data = yaml.safe_load(fin)
+        data = yamlio.safe_load(fin)
     if not "element" in data.keys():
         # new format
         raise ValueError("Not old format, exiting..")
@@ -1045,7 +1270,7 @@ def _convert_legacy_inputfile(file, return_calcs=False):
             f"Old style input file calphy < v2 found. Converted input in {outfile}. Please check!"
         )
         with open(outfile, "w") as fout:
-            yaml.safe_dump(newdata, fout)
+            yamlio.safe_dump(newdata, fout)
         return outfile
 
 
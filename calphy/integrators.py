@@ -32,6 +32,10 @@ try:
     from scipy.integrate import cumtrapz
 except ImportError:
     from scipy.integrate import cumulative_trapezoid as cumtrapz
+try:
+    from numpy import trapz
+except ImportError:
+    from numpy import trapezoid as trapz
 from tqdm import tqdm
 import pyscal3.core as pc
 from ase.io import read
@@ -46,10 +50,149 @@ Na = const.physical_constants["Avogadro constant"][0]
 eV2J = const.eV
 J2eV = 6.242E18
 
+#UF spline tables as arrays, for evaluation over many x at once
+_spline_arrays = {p: np.ascontiguousarray(table, dtype=float) for p, table in splines.items()}
+_sum_spline_arrays = {p: np.ascontiguousarray(table, dtype=float) for p, table in 
+    zip([1, 25, 50, 75, 100], [sum_spline1, sum_spline25, sum_spline50, sum_spline75, sum_spline100])}
+
 #--------------------------------------------------------------------
 #             TI PATH INTEGRATION ROUTINES
 #--------------------------------------------------------------------
 
+def convert_data(filename):
+    """
+    Convert a switching data file to the binary `.npy` format
+
+    Parameters
+    ----------
+    filename: string
+        name of the text data file
+
+    Returns
+    -------
+    data: ndarray
+        array of shape (ncolumns, nsteps)
+
+    Notes
+    -----
+    The array is saved next to `filename` with the extension `.npy`,
+    which is read by `read_data` in place of the text file.
+    """
+    data = np.loadtxt(filename, unpack=True, comments="#")
+    binfile = os.path.splitext(filename)[0] + ".npy"
+    try:
+        np.save(binfile, data)
+    except OSError:
+        warnings.warn("could not write %s" % binfile)
+    return data
+
+
+def read_data(source):
+    """
+    Read the columns of a switching data file
+
+    Parameters
+    ----------
+    source: string or ndarray
+        name of the data file, or an array of shape (ncolumns, nsteps)
+        already held in memory
+
+    Returns
+    -------
+    data: ndarray
+        array of shape (ncolumns, nsteps)
+
+    Notes
+    -----
+    The binary `.npy` file with the same name is preferred, and is
+    memory mapped, if it is not older than the text file. Otherwise
+    the text file is read and converted once using `convert_data`.
+    """
+    if isinstance(source, np.ndarray):
+        return source
+    binfile = os.path.splitext(source)[0] + ".npy"
+    if os.path.exists(binfile):
+        if (not os.path.exists(source)) or (os.path.getmtime(binfile) >= os.path.getmtime(source)):
+            return np.load(binfile, mmap_mode="r")
+    return convert_data(source)
+
+
+def _get_data(data, folder, filename):
+    """
+    Return the array for filename from data if available, else the path
+    """
+    key = os.path.splitext(filename)[0]
+    if (data is not None) and (key in data.keys()):
+        return data[key]
+    return os.path.join(folder, filename)
+
+
+def _get_weights(calc):
+    """
+    Get the weight of each spring term, composition divided by number of atoms
+    """
+    natoms = np.array([calc._element_dict[x]['count'] for x in calc.element], dtype=float)
+    concentration = np.array([calc._element_dict[x]['composition'] for x in calc.element], dtype=float)
+    return np.divide(concentration, natoms, out=np.zeros(len(natoms)), where=natoms>0)
+
+
+def _get_du(calc, data, solid, weights):
+    """
+    Get energy difference and lambda from the columns of a switching data file
+    """
+    if solid:
+        dur = np.dot(weights, data[1:calc.n_elements+1])
+        lam = data[calc.n_elements+1]
+    else:
+        dur = data[1]
+        lam = data[2]
+    return data[0] - dur, lam
+
+
+def _resample(x, y, grid):
+    """
+    Linear interpolation of y(x) onto grid, x can be decreasing
+    """
+    if x[0] > x[-1]:
+        return np.interp(grid, x[::-1], y[::-1])
+    return np.interp(grid, x, y)
+
+
+def stack_iterations(lambdas, *values):
+    """
+    Stack the data from independent iterations into 2D arrays
+
+    Parameters
+    ----------
+    lambdas: list of ndarrays
+        switching parameter of each iteration
+
+    values: lists of ndarrays
+        quantities of each iteration, recorded at the corresponding lambdas
+
+    Returns
+    -------
+    lambdas: ndarray
+        array of shape (niterations, npoints)
+
+    values: list of ndarrays
+        one array of shape (niterations, npoints) for each input list
+
+    Notes
+    -----
+    If the iterations have different lengths, all of them are resampled
+    by linear interpolation onto the lambda grid of the longest iteration.
+    """
+    lengths = [len(x) for x in lambdas]
+    if len(set(lengths)) == 1:
+        return np.array(lambdas), [np.array(value) for value in values]
+
+    grid = np.asarray(lambdas[int(np.argmax(lengths))])
+    stacked = [np.array([_resample(x, y, grid) for x, y in zip(lambdas, value)])
+        for value in values]
+    return np.tile(grid, (len(lambdas), 1)), stacked
+
+
 def integrate_path(calc,
     fwdfilename, 
     bkdfilename,  
@@ -60,11 +203,11 @@ def integrate_path(calc,
 
     Parameters
     ----------
-    fwdfilename: string
-        name of fwd integration file
+    fwdfilename: string or ndarray
+        name of fwd integration file, or its data as an array
 
-    bkdfilename: string
-        name of bkd integration file
+    bkdfilename: string or ndarray
+        name of bkd integration file, or its data as an array
 
     usecols : list
         column numbers to be used from input file
@@ -77,46 +220,16 @@ def integrate_path(calc,
     q : float
         heat dissipation during switching of system
     """
-    natoms = np.array([calc._element_dict[x]['count'] for x in calc.element])
-    concentration = np.array([calc._element_dict[x]['composition'] for x in calc.element])
-    fdata = np.loadtxt(fwdfilename, unpack=True, comments="#")
-    bdata = np.loadtxt(bkdfilename, unpack=True, comments="#")
-
-    if solid:
-        fdui = fdata[0]
-        bdui = bdata[0]
-
-        fdur = np.zeros(len(fdui))
-        bdur = np.zeros(len(bdui))
-
-        for i in range(calc.n_elements):
-            if natoms[i] > 0:
-                fdur += concentration[i]*fdata[i+1]/natoms[i]
-                bdur += concentration[i]*bdata[i+1]/natoms[i]
-
-        flambda = fdata[calc.n_elements+1]
-        blambda = bdata[calc.n_elements+1]
-
-    else:
-        fdui = fdata[0]
-        bdui = bdata[0]
-
-        fdur = fdata[1]
-        bdur = bdata[1]
-
-        flambda = fdata[2]
-        blambda = bdata[2]
-
-
-    fdu = fdui - fdur
-    bdu = bdui - bdur
+    weights = _get_weights(calc)
+    fdu, flambda = _get_du(calc, read_data(fwdfilename), solid, weights)
+    bdu, blambda = _get_du(calc, read_data(bkdfilename), solid, weights)
     
     if composition_integration:
         fw = cumtrapz(fdu, flambda, initial=0)
         bw = cumtrapz(bdu, blambda, initial=0)
     else:
-        fw = np.trapz(fdu, flambda)
-        bw = np.trapz(bdu, blambda)
+        fw = trapz(fdu, flambda)
+        bw = trapz(bdu, blambda)
 
     w = 0.5*(fw - bw)
     q = 0.5*(fw + bw)
@@ -128,7 +241,9 @@ def find_w(mainfolder,
     calc, 
     full=False, 
     solid=True,
-    composition_integration=False):
+    composition_integration=False,
+    data=None,
+    iterations=None):
     """
     Integrate the irreversible work and dissipation for independent simulations
 
@@ -146,6 +261,13 @@ def find_w(mainfolder,
     usecols : tuple, optional
         Columns to read in from data file. Default (0, 1)
 
+    data : dict, optional
+        arrays held in memory, keyed by the data file name without extension.
+        Files not found in `data` are read from `mainfolder`
+
+    iterations : list of ints, optional
+        iterations to be integrated, default all `calc.n_iterations`
+
     Returns
     -------
     ws : float
@@ -156,31 +278,50 @@ def find_w(mainfolder,
 
     err : float
         Error in free energy, only returned if full is True
+
+    Notes
+    -----
+    All iterations are stacked and integrated together, see `stack_iterations`.
     """
-    ws = []
-    qs = []
+    weights = _get_weights(calc)
+    fdus, flambdas = [], []
+    bdus, blambdas = [], []
 
-    for i in range(calc.n_iterations):
-        fwdfilestring = 'forward_%d.dat' % (i+1)
-        fwdfilename = os.path.join(mainfolder,fwdfilestring)
-        
-        bkdfilestring = 'backward_%d.dat' % (i+1)
-        bkdfilename = os.path.join(mainfolder,bkdfilestring)
-        
-        w, q, flambda = integrate_path(calc,
-            fwdfilename, 
-            bkdfilename, 
-            solid=solid,
-            composition_integration=composition_integration)
+    if iterations is None:
+        iterations = range(1, calc.n_iterations+1)
+
+    for i in iterations:
+        fwdfilestring = 'forward_%d.dat' % i
+        fdata = read_data(_get_data(data, mainfolder, fwdfilestring))
         
-        ws.append(w)
-        qs.append(q)
+        bkdfilestring = 'backward_%d.dat' % i
+        bdata = read_data(_get_data(data, mainfolder, bkdfilestring))
+
+        fdu, flambda = _get_du(calc, fdata, solid, weights)
+        bdu, blambda = _get_du(calc, bdata, solid, weights)
+        fdus.append(fdu)
+        flambdas.append(flambda)
+        bdus.append(bdu)
+        blambdas.append(blambda)
+
+    flambda, (fdu,) = stack_iterations(flambdas, fdus)
+    blambda, (bdu,) = stack_iterations(blambdas, bdus)
+
+    if composition_integration:
+        fw = cumtrapz(fdu, flambda, axis=1, initial=0)
+        bw = cumtrapz(bdu, blambda, axis=1, initial=0)
+    else:
+        fw = trapz(fdu, flambda, axis=1)
+        bw = trapz(bdu, blambda, axis=1)
+
+    ws = 0.5*(fw - bw)
+    qs = 0.5*(fw + bw)
     
     if composition_integration:
         wsmean = np.mean(ws, axis=0)
         qsmean = np.mean(qs, axis=0)
         wsstd = np.std(ws, axis=0)
-        return wsmean, qsmean, wsstd, flambda
+        return wsmean, qsmean, wsstd, flambda[-1]
 
     wsmean = np.mean(ws)
     qsmean = np.mean(qs)
@@ -195,7 +336,8 @@ def find_w(mainfolder,
 def integrate_rs(simfolder, f0, t, 
     natoms, p=0, nsims=5, 
     scale_energy=False, 
-    return_values=False):
+    return_values=False,
+    data=None):
     """
     Carry out the reversible scaling integration
 
@@ -216,6 +358,10 @@ def integrate_rs(simfolder, f0, t,
     scale_energy: bool, optional
         if True, scale energy with switching parameter
 
+    data : dict, optional
+        arrays held in memory, keyed by the data file name without extension.
+        Files not found in `data` are read from `simfolder`
+
     Returns
     -------
     None
@@ -225,35 +371,38 @@ def integrate_rs(simfolder, f0, t,
     Writes the output in a file reversible_scaling.dat
     
     """
-    ws = []
-    es = []
     p = p/(10000*160.21766208)
+
+    #backward sweeps are reversed to run along the forward lambda
+    lambdas, dxs, vols = [], [], []
+    for direction in ["forward", "backward"]:
+        for i in range(1, nsims+1):
+            dx, _, vol, lam = read_data(_get_data(data, simfolder, "ts.%s_%d.dat"%(direction, i)))
+            if direction == "backward":
+                dx, vol, lam = dx[::-1], vol[::-1], lam[::-1]
+            lambdas.append(lam)
+            dxs.append(dx)
+            vols.append(vol)
+
+    lambdas, (dxs, vols) = stack_iterations(lambdas, dxs, vols)
     
-    for i in range(1, nsims+1):
-        fdx, fp, fvol, flambda = np.loadtxt(os.path.join(simfolder, "ts.forward_%d.dat"%i), unpack=True, comments="#")
-        bdx, bp, bvol, blambda = np.loadtxt(os.path.join(simfolder, "ts.backward_%d.dat"%i), unpack=True, comments="#")
-        
-        if scale_energy:
-            fdx /= flambda
-            bdx /= blambda
+    if scale_energy:
+        dxs = dxs/lambdas
 
-        #add pressure contribution
-        fvol = fvol/natoms
-        bvol = bvol/natoms
-        fdx = fdx + p*fvol
-        bdx = bdx + p*bvol
-        
-        wf = cumtrapz(fdx, flambda,initial=0)
-        wb = cumtrapz(bdx[::-1], blambda[::-1],initial=0)
-        w = (wf + wb) / (2*flambda)
-        e = np.max(np.abs((wf - wb)/(2*flambda)))
+    #add pressure contribution
+    dxs = dxs + p*vols/natoms
+    
+    works = cumtrapz(dxs, lambdas, axis=1, initial=0)
+    wf, wb = works[:nsims], works[nsims:]
+    flambda = lambdas[:nsims]
 
-        ws.append(w)
-        es.append(e)
+    ws = (wf + wb) / (2*flambda)
+    es = np.max(np.abs((wf - wb)/(2*flambda)), axis=1)
 
     e_diss = np.min(es)
     wmean = np.mean(ws, axis=0)
     werr = np.std(ws, axis=0)
+    flambda = flambda[-1]
     temp = t/flambda
 
     f = f0/flambda + 1.5*kb*temp*np.log(flambda) + wmean
@@ -267,7 +416,7 @@ def integrate_rs(simfolder, f0, t,
 
 
 def integrate_ps(simfolder, f0, natoms, pi, pf, nsims=1, 
-    return_values=False):
+    return_values=False, data=None):
     """
     Carry out the reversible scaling integration
     
@@ -279,6 +428,8 @@ def integrate_ps(simfolder, f0, natoms, pi, pf, nsims=1,
         initial free energy for integration
     nsims : int, optional
         number of independent switching
+    data : dict, optional
+        arrays held in memory, keyed by the data file name without extension
     
     Returns
     -------
@@ -293,8 +444,8 @@ def integrate_ps(simfolder, f0, natoms, pi, pf, nsims=1,
     ws = []
 
     for i in range(1, nsims+1):
-        _, fp, fvol, _ = np.loadtxt(os.path.join(simfolder, "ps.forward_%d.dat"%i), unpack=True, comments="#")
-        _, bp, bvol, _ = np.loadtxt(os.path.join(simfolder, "ps.backward_%d.dat"%i), unpack=True, comments="#")
+        _, fp, fvol, _ = read_data(_get_data(data, simfolder, "ps.forward_%d.dat"%i))
+        _, bp, bvol, _ = read_data(_get_data(data, simfolder, "ps.backward_%d.dat"%i))
         
         fvol = fvol/natoms
         bvol = bvol/natoms
@@ -405,10 +556,10 @@ def integrate_dcc(folder1, folder2, nsims=1, scale_energy=True,
 
     ws = []
     for i in range(nsims):
-        fsu, fsp, fsv, fsl = np.loadtxt(os.path.join(folder1, "ts.forward_%d.dat"%(i+1)), unpack=True)
-        bsu, bsp, bsv, bsl = np.loadtxt(os.path.join(folder1, "ts.backward_%d.dat"%(i+1)), unpack=True)
-        flu, flp, flv, fll = np.loadtxt(os.path.join(folder2, "ts.forward_%d.dat"%(i+1)), unpack=True)
-        blu, blp, blv, bll = np.loadtxt(os.path.join(folder2, "ts.backward_%d.dat"%(i+1)), unpack=True)
+        fsu, fsp, fsv, fsl = read_data(os.path.join(folder1, "ts.forward_%d.dat"%(i+1)))
+        bsu, bsp, bsv, bsl = read_data(os.path.join(folder1, "ts.backward_%d.dat"%(i+1)))
+        flu, flp, flv, fll = read_data(os.path.join(folder2, "ts.forward_%d.dat"%(i+1)))
+        blu, blp, blv, bll = read_data(os.path.join(folder2, "ts.backward_%d.dat"%(i+1)))
 
         if scale_energy:
             fsu = fsu/fsl
@@ -513,48 +664,91 @@ def get_einstein_crystal_fe(
     The equations for free energy of Einstein crystal and centre of mass correction are from https://doi.org/10.1063/5.0044833.
 
     """
-    #temperature
-    temp = calc._temperature
+    #per species counts and masses
+    counts = [calc._element_dict[x]['count'] for x in calc.element]
+    mass = [calc._element_dict[x]['mass'] for x in calc.element]
+
+    return get_einstein_crystal_fe_array(calc._temperature, vol, counts, mass, k,
+        cm_correction=cm_correction, return_contributions=return_contributions)
+
+def get_einstein_crystal_fe_array(
+    temp,
+    vol,
+    counts,
+    mass,
+    k,
+    cm_correction=True,
+    return_contributions=False):
+    """
+    Get the free energy of einstein crystal for many temperatures and volumes
+
+    Parameters
+    ----------
+    temp : float or array of floats
+        temperature, units - K
+
+    vol : float or array of floats
+        converged volume per atom
+
+    counts : list of ints
+        number of atoms of each species
+
+    mass : list of floats
+        mass of each species, units - g/mol
+
+    k : list of floats
+        spring constant of each species, units - eV/Angstrom^2
+
+    cm_correction : bool, optional, default - True
+        add the centre of mass correction to free energy
+
+    return_contributions: bool, optional, default - True
+        If True, return individual contributions to the reference free energy.
+
+    Returns
+    -------
+    F_tot : float or array of floats
+        total free energy of reference crystal
+
+    F_e : float or array of floats
+        Free energy of Einstein crystal without centre of mass correction. Only if `return_contributions` is True.
+
+    F_cm : float or array of floats
+        centre of mass correction. Only if `return_contributions` is True.
+
+    Notes
+    -----
+    All atoms of a species contribute the same terms, so that the sums over atoms
+    are evaluated as sums over species weighted by their counts. `temp` and `vol`
+    are broadcast against each other.
+    """
+    temp = np.asarray(temp, dtype=float)
+    counts = np.asarray(counts, dtype=float)
 
     #natoms
-    natoms = np.sum([calc._element_dict[x]['count'] for x in calc.element])
+    natoms = np.sum(counts)
 
     #convert a to m3
-    vol = vol*1E-30
+    vol = np.asarray(vol, dtype=float)*1E-30
 
     #whats the beta
     beta = (1/(kbJ*temp))   
 
-    #create an array of mass
-    mass = []
-    for x in calc.element:
-        for count in range(calc._element_dict[x]['count']):
-            mass.append(calc._element_dict[x]['mass'])
-    mass = np.array(mass)
-    
     #convert mass to kg
-    mass = (mass/Na)*1E-3
-
-    #create an array of k as well
-    karr = []
-    for c, x in enumerate(calc.element):
-        for count in range(calc._element_dict[x]['count']):
-            karr.append(k[c])
-    k = np.array(karr)
+    mass = (np.asarray(mass, dtype=float)/Na)*1E-3
+
     #convert k from ev/A2 to J/m2
-    k = k*(eV2J/1E-20)
+    k = np.asarray(k, dtype=float)*(eV2J/1E-20)
 
     #fe of Einstein crystal
-    Z_e = ((beta**2*k*hJ**2)/(4*np.pi**2*mass))**1.5
-    F_e = np.log(Z_e)
-    F_e = kb*temp*np.sum(F_e)/natoms #*J2eV #convert back to eV
+    F_e = 1.5*np.sum(counts*np.log(k*hJ**2/(4*np.pi**2*mass))) + 3*natoms*np.log(beta)
+    F_e = kb*temp*F_e/natoms #*J2eV #convert back to eV
 
     #now get the cm correction
     if cm_correction:
-        mass_sum = np.sum(mass)
+        mass_sum = np.sum(counts*mass)
         mu = mass/mass_sum
-        mu2_over_k = mu**2/k
-        mu2_over_k_sum = np.sum(mu2_over_k) 
+        mu2_over_k_sum = np.sum(counts*mu**2/k)
         prefactor = vol
         F_cm = np.log(prefactor*(beta/(2*np.pi*mu2_over_k_sum))**1.5)
         F_cm = kb*temp*F_cm/natoms #convert to eV
@@ -627,10 +821,10 @@ def get_uhlenbeck_ford_fe(temp, rho, p, sigma):
 
     Parameters
     ----------
-    temp : temperature, float
+    temp : temperature, float or array of floats
         units - K
 
-    rho : density, float
+    rho : density, float or array of floats
         units - no of atoms/ angstrom^3
 
     p : uf scale, float
@@ -638,12 +832,19 @@ def get_uhlenbeck_ford_fe(temp, rho, p, sigma):
 
     Returns
     -------
-    fe : float
+    fe : float or array of floats
         excess free energy/atom of uf system
+
+    Notes
+    -----
+    If `temp` or `rho` are arrays, they are broadcast against each other
+    and the free energy is evaluated for all of them at once.
     """
-    x = (0.5*(np.pi*sigma*sigma)**1.5)*rho
+    x = (0.5*(np.pi*sigma*sigma)**1.5)*np.asarray(rho, dtype=float)
+    if (np.ndim(temp) == 0) and (np.ndim(rho) == 0):
+        x = float(x)
     _, fe = find_fe(p, x)
-    beta = (1/(kb*temp))
+    beta = (1/(kb*np.asarray(temp, dtype=float)))
     fe = fe/beta
     return fe
 
@@ -706,7 +907,7 @@ def find_fe(p, x):
 
     Parameters
     ----------
-    x : float
+    x : float or array of floats
         x value of system
 
     coef : list of floats
@@ -714,13 +915,19 @@ def find_fe(p, x):
 
     Returns
     -------
-    fe : float
+    pressure : float or array of floats
+        pressure of UF system
+
+    fe : float or array of floats
         free energy of UF system
 
     """
     if not p in splines:
         raise ValueError('Invalid p. Valid numbers are: 1, 25, 50, 75, and 100.')
 
+    if np.ndim(x) > 0:
+        return _find_fe_array(p, np.asarray(x, dtype=float))
+
     if (x <= 0.0) or (x > 4.0):
         raise ValueError('Invalid x. Valid numbers are 0.0 < x <= 4.0')
 
@@ -754,6 +961,54 @@ def find_fe(p, x):
 
     return pressure, free_energy
 
+def _find_fe_array(p, x):
+    """
+    Find pressure and free energy of UF system for an array of x
+
+    The same piecewise evaluation as `find_fe` and `fe`, with each branch
+    applied to all x values at once.
+    """
+    if np.any(x <= 0.0) or np.any(x > 4.0):
+        raise ValueError('Invalid x. Valid numbers are 0.0 < x <= 4.0')
+
+    table = _spline_arrays[p]
+    sum_spline = _sum_spline_arrays[p]
+    shape = x.shape
+    x = x.ravel()
+
+    low = x < 0.1
+    mid = (x >= 0.1) & (x < 1)
+    high = (x >= 1) & (x < 4)
+    top = x >= 4
+
+    #interval index and its lower bound, as in find_fe and fe
+    index = np.full(x.shape, 105)
+    index[low] = np.trunc(x[low]*400)
+    index[mid] = 40 + np.trunc(x[mid]*40 - 4)
+    index[high] = 76 + np.trunc(x[high]*10 - 10)
+
+    x_0 = np.ones(x.shape)
+    x_0[low] = 0.0025*np.trunc(x[low]*400)
+    x_0[mid] = 0.025*np.trunc(x[mid]*40)
+    x_0[high] = 0.1*np.trunc(x[high]*10)
+
+    #values on the grid are taken from the table
+    ongrid = (low & (x*10000%25 == 0)) | (mid & (x*1000%25 == 0)) | (high & (x*100%10 == 0))
+
+    coef = table[index].T
+    pressure = press(x, coef)
+
+    #x_0 is zero in the first interval, it is not used there
+    first = x < 0.0025
+    x_0[first] = 1.0
+    previous = sum_spline[index-1]
+    free_energy = previous + coef[0]*(x**2.0 - x_0**2.0)/2.0 + coef[1]*(x - x_0) + (coef[2] - 1.0)*np.log(x/x_0) - coef[3]*(1.0/x - 1.0/x_0)
+    free_energy = np.where(ongrid, previous, free_energy)
+    free_energy = np.where(top, sum_spline[index], free_energy)
+    free_energy = np.where(first, coef[0]*(x**2)/2.0 + coef[1]*x, free_energy)
+
+    return pressure.reshape(shape), free_energy.reshape(shape)
+
 #--------------------------------------------------------------------
 #             PHASE DIAGRAM ROUTINES
 #--------------------------------------------------------------------
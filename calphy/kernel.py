@@ -55,6 +55,13 @@ def run_jobs(inputfile):
     calculations = read_inputfile(inputfile)
     print("Total number of %d calculations found" % len(calculations))
 
+    #local calculations are run through a bounded pool
+    max_cores = max([calc.queue.max_cores for calc in calculations], default=0)
+    pool = pq.LocalPool(max_cores=max_cores)
+
+    #calculations with identical queue options are grouped into job arrays
+    arrays = {}
+
     for count, calc in enumerate(calculations):
         if calc.script_mode:
             identistring = calc.create_identifier()
@@ -113,6 +120,14 @@ def run_jobs(inputfile):
             scriptpath = os.path.join(os.getcwd(), ".".join([identistring, "sub"]))
             errfile = os.path.join(os.getcwd(), ".".join([identistring, "err"]))
 
+            if calc.queue.job_array and calc.queue.scheduler in ["slurm", "sge"]:
+                key = calc.queue.model_dump_json()
+                if key not in arrays.keys():
+                    arrays[key] = {"queue": calc.queue, "indices": [], "logfiles": []}
+                arrays[key]["indices"].append(count)
+                arrays[key]["logfiles"].append(scriptpath)
+                continue
+
             #the below part assigns the schedulers
             #now we have to write the submission scripts for the job
             #parse Queue and import module
@@ -131,7 +146,27 @@ def run_jobs(inputfile):
             scheduler.maincommand = "calphy_kernel -i %s -k %d"%(inputfile, 
                 count)
             scheduler.write_script(scriptpath)
-            _ = scheduler.submit()
+            if calc.queue.scheduler == "local":
+                pool.add(scheduler)
+            else:
+                _ = scheduler.submit()
+
+    for count, array in enumerate(arrays.values()):
+        queue = array["queue"]
+        if queue.scheduler == "slurm":
+            scheduler = pq.SLURM(queue.__dict__, cores=queue.cores)
+        else:
+            scheduler = pq.SGE(queue.__dict__, cores=queue.cores)
+        scriptpath = os.path.join(os.getcwd(), "%s-array-%d.sub"%(queue.jobname, count))
+        command = "calphy_kernel -i %s -k ${index}"%inputfile
+        scheduler.write_array_script(scriptpath, command, array["indices"],
+            array["logfiles"], pack=queue.array_pack)
+        print("Submitting %d calculations as job array %s" % (len(array["indices"]), scriptpath))
+        _ = scheduler.submit()
+
+    if len(pool.jobs) > 0:
+        print("Running %d local calculations on %d cores" % (len(pool.jobs), pool.max_cores))
+        _ = pool.run()
 
 
 
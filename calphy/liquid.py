@@ -48,6 +48,10 @@ class Liquid(cph.Phase):
 
     """
 
+    # largest multiplier and the step range of the multiplier for thigh in the melting cycle
+    max_melting_multiplier = 2.0
+    melting_multiplier_steps = (0.1, 0.5)
+
     def __init__(self, calculation=None, simfolder=None, log_to_screen=False):
         """
         Set up class
@@ -58,7 +62,25 @@ class Liquid(cph.Phase):
         )
 
     def melt_structure(self, lmp):
-        """ """
+        """
+        Melt the structure at a multiple of the high temperature
+
+        Parameters
+        ----------
+        lmp : LammpsLibrary object
+
+        Returns
+        -------
+        None
+
+        Notes
+        -----
+        Each melting cycle is run in chunks, and the solid fraction is checked
+        after every chunk, so that the cycle stops as soon as the system melts.
+        If it does not melt, the multiplier for the high temperature in the next
+        cycle is extrapolated from the change of the solid fraction with the
+        multiplier in the previous cycles.
+        """
         if self.calc._fix_lattice and self.calc.melting_cycle:
 
             raise ValueError(
@@ -66,13 +88,15 @@ class Liquid(cph.Phase):
             )
 
         melted = False
+        target = self.calc.tolerance.liquid_fraction
+        n_chunks = 5
+        chunk = max(int(self.calc.md.n_small_steps) // n_chunks, 1)
 
-        # this is the multiplier for thigh to try melting routines
-        for thmult in np.arange(1.0, 2.0, 0.1):
+        # multiplier for thigh and the solid fraction reached with it
+        thmult = 1.0
+        history = []
 
-            trajfile = os.path.join(self.simfolder, "traj.melt")
-            if os.path.exists(trajfile):
-                os.remove(trajfile)
+        while True:
 
             self.logger.info(
                 "Starting melting cycle with thigh temp %f, factor %f"
@@ -85,17 +109,23 @@ class Liquid(cph.Phase):
                 np.random.randint(1, 10000),
             )
             self.fix_nose_hoover(lmp, temp_start_factor=factor, temp_end_factor=factor)
-            lmp.run(int(self.calc.md.n_small_steps))
+            for i in range(n_chunks):
+                lmp.run(chunk)
+                # we have to check if the structure melted
+                fraction = self.find_solid_fraction(lmp)
+                self.logger.info("fraction of solids found: %f", fraction)
+                if fraction < target:
+                    melted = True
+                    break
             self.unfix_nose_hoover(lmp)
 
-            self.dump_current_snapshot(lmp, "traj.melt")
+            if melted:
+                break
 
-            # we have to check if the structure melted
-            solids = ph.find_solid_fraction(os.path.join(self.simfolder, "traj.melt"))
-            self.logger.info("fraction of solids found: %f", solids / self.natoms)
-            if solids / self.natoms < self.calc.tolerance.liquid_fraction:
-                melted = True
+            history.append((thmult, fraction))
+            if thmult >= self.max_melting_multiplier:
                 break
+            thmult = self._next_melting_multiplier(history, target)
 
         # if melting cycle is over and still not melted, raise error
         if not melted:
@@ -104,6 +134,37 @@ class Liquid(cph.Phase):
                 "Liquid system did not melt, maybe try a higher thigh temperature."
             )
 
+    def _next_melting_multiplier(self, history, target):
+        """
+        Get the next multiplier for thigh from the solid fractions seen so far
+
+        Parameters
+        ----------
+        history : list of tuples
+            multiplier and the final solid fraction of each melting cycle
+
+        target : float
+            solid fraction below which the system is melted
+
+        Returns
+        -------
+        thmult : float
+        """
+        minstep, maxstep = self.melting_multiplier_steps
+        thmult, fraction = history[-1]
+        step = minstep
+        if len(history) > 1:
+            # extrapolate the solid fraction linearly to the target
+            lastmult, lastfraction = history[-2]
+            slope = (fraction - lastfraction) / (thmult - lastmult)
+            if slope < 0:
+                step = (target - fraction) / slope
+            else:
+                # no progress, take a large step
+                step = maxstep
+        step = min(max(step, minstep), maxstep)
+        return min(np.round(thmult + step, decimals=3), self.max_melting_multiplier)
+
     def run_averaging(self):
         """
         Run averaging routine
@@ -171,7 +232,7 @@ class Liquid(cph.Phase):
 
         # check melted error
         self.dump_current_snapshot(lmp, "traj.equilibration_stage1.dat")
-        self.check_if_solidfied(lmp, "traj.equilibration_stage1.dat")
+        self.check_if_solidfied(lmp)
         self.dump_current_snapshot(lmp, "traj.equilibration_stage2.dat")
         lmp = ph.write_data(lmp, "conf.equilibration.data")
         lmp.close()
@@ -294,15 +355,16 @@ class Liquid(cph.Phase):
         lmp.command("compute          Tcm all temp/com")
         lmp.command("fix_modify       f2 temp Tcm")
 
-        lmp.command(
-            'fix              f3 all print 1 "${dU1} ${dU2} ${flambda}" screen no file forward_%d.dat'
-            % iteration
+        self.start_data_collection(
+            lmp, "f3", ["dU1", "dU2", "flambda"], "forward_%d.dat" % iteration
         )
         lmp.command("run               %d" % self.calc._n_switching_steps)
 
         lmp.command("unfix            f1")
         lmp.command("unfix            f2")
-        lmp.command("unfix            f3")
+        self.stop_data_collection(
+            lmp, "f3", ["dU1", "dU2", "flambda"], "forward_%d.dat" % iteration
+        )
         lmp.command("uncompute        c1")
         lmp.command("uncompute        c2")
 
@@ -376,15 +438,16 @@ class Liquid(cph.Phase):
         )
         lmp.command("fix_modify       f2 temp Tcm")
 
-        lmp.command(
-            'fix              f3 all print 1 "${dU1} ${dU2} ${flambda}" screen no file backward_%d.dat'
-            % iteration
+        self.start_data_collection(
+            lmp, "f3", ["dU1", "dU2", "flambda"], "backward_%d.dat" % iteration
         )
         lmp.command("run               %d" % self.calc._n_switching_steps)
 
         lmp.command("unfix            f1")
         lmp.command("unfix            f2")
-        lmp.command("unfix            f3")
+        self.stop_data_collection(
+            lmp, "f3", ["dU1", "dU2", "flambda"], "backward_%d.dat" % iteration
+        )
         lmp.command("uncompute        c1")
         lmp.command("uncompute        c2")
 
@@ -408,7 +471,14 @@ class Liquid(cph.Phase):
         Calculates the final work, energy dissipation and free energy by
         matching with UFM model
         """
-        w, q, qerr = find_w(self.simfolder, self.calc, full=True, solid=False)
+        w, q, qerr = find_w(
+            self.simfolder,
+            self.calc,
+            full=True,
+            solid=False,
+            data=self.data,
+            iterations=self.get_iterations(),
+        )
 
         # TODO: Hardcoded UFM parameters - enable option to change
         f1 = get_uhlenbeck_ford_fe(
@@ -26,7 +26,7 @@ sarath.menon@ruhr-uni-bochum.de/yury.lysogorskiy@icams.rub.de
 """
 
 import numpy as np
-import yaml
+import calphy.yamlio as yamlio
 import copy
 import os
 import shutil
@@ -35,7 +35,7 @@ import pyscal3.traj_process as ptp
 from calphy.integrators import *
 import calphy.helpers as ph
 from calphy.errors import *
-from calphy.input import generate_metadata
+from calphy.input import generate_metadata, save_job, load_state
 
 
 class Phase:
@@ -52,6 +52,30 @@ class Phase:
 
     """
 
+    # whether the switching data has one spring term per species, see `find_w`
+    _spring_reference = False
+
+    # attributes stored in the state file between script mode steps
+    _state_keys = [
+        "lx",
+        "ly",
+        "lz",
+        "vol",
+        "volatom",
+        "rho",
+        "k",
+        "fe",
+        "ferr",
+        "fref",
+        "feinstein",
+        "fcm",
+        "fideal",
+        "w",
+        "pv",
+        "publications",
+        "n_cycles_run",
+    ]
+
     def __init__(self, calculation=None, simfolder=None, log_to_screen=False):
 
         self.calc = copy.deepcopy(calculation)
@@ -59,7 +83,7 @@ class Phase:
         # serialise input
         indict = {"calculations": [self.calc.dict()]}
         with open(os.path.join(simfolder, "input_file.yaml"), "w") as fout:
-            yaml.safe_dump(indict, fout)
+            yamlio.safe_dump(indict, fout)
 
         self.simfolder = simfolder
         self.log_to_screen = log_to_screen
@@ -209,6 +233,35 @@ class Phase:
         self.ly = None
         self.lz = None
 
+        # switching data collected in memory, keyed by file name
+        self.in_memory = self.calc.in_memory_data and (not self.calc.script_mode)
+        self.data = {}
+
+        # number of cycles run when they are added until `target_error` is
+        # reached, None if all `n_iterations` cycles are run
+        self.n_cycles_run = None
+
+        # LAMMPS object kept open between stages, see `save_session`
+        self.persistent = (
+            self.calc.persistent_session
+            and (not self.calc.script_mode)
+            and (self.calc.n_parallel_iterations == 1)
+        )
+        self.lmp = None
+        self._snapshot_box = None
+
+        # sweeps start from the state equilibrated by the first iteration
+        self.warm_start = self.calc.warm_start_sweeps and (not self.calc.script_mode)
+
+        # neighbor cutoff for solid detection, 0 is adaptive
+        self._solid_cutoff = 0
+
+        # temperature at which reversible scaling starts, None is the temperature
+        self.sweep_start = None
+
+        # stages completed so far, written to job_state.json after each one
+        self.stages = []
+
         # now manually tune pair styles
         if self.calc.pair_style is not None:
             self.logger.info("pair_style: %s" % self.calc._pair_style_with_options[0])
@@ -225,6 +278,9 @@ class Phase:
             if self.calc.potential_file is not None:
                 self.logger.info("potential is being loaded from file instead")
 
+        if self.calc.restart:
+            self.load_checkpoint()
+
     def __repr__(self):
         """
         String of the class
@@ -232,6 +288,184 @@ class Phase:
         data = self.calc.__repr__()
         return data
 
+    def get_state(self):
+        """
+        Get the numeric state of the calculation
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        state : dict
+            state made of built-in types, which can be written as json
+
+        Notes
+        -----
+        Together with the input, the state is all that is needed to continue
+        a calculation from one step of script mode to the next.
+        """
+        state = {}
+        for key in self._state_keys:
+            val = getattr(self, key)
+            state[key] = None if val is None else np.asarray(val).tolist()
+        # the pressure can be updated in the averaging step
+        pressure = self.calc._pressure
+        state["pressure"] = None if pressure is None else float(pressure)
+        state["stages"] = list(self.stages)
+        # the switching length can be adapted during the run
+        state["n_switching_steps"] = int(self.calc._n_switching_steps)
+        return state
+
+    def set_state(self, state):
+        """
+        Restore a state obtained from `get_state`
+
+        Parameters
+        ----------
+        state : dict
+            state of the calculation
+
+        Returns
+        -------
+        None
+        """
+        for key in self._state_keys:
+            if key in state.keys():
+                setattr(self, key, state[key])
+        if "pressure" in state.keys():
+            self.calc._pressure = state["pressure"]
+        if "stages" in state.keys():
+            self.stages = list(state["stages"])
+        if "n_switching_steps" in state.keys():
+            self.calc._n_switching_steps = state["n_switching_steps"]
+
+    def get_iterations(self):
+        """
+        Get the cycles which are run and integrated
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        iterations : list of ints
+            `n_cycles_run` cycles if they were run up to `target_error`,
+            otherwise all `n_iterations` cycles
+        """
+        n = self.calc.n_iterations if self.n_cycles_run is None else self.n_cycles_run
+        return list(range(1, n + 1))
+
+    def get_dissipation(self, iteration):
+        """
+        Get the work and dissipated energy of a single switching cycle
+
+        Parameters
+        ----------
+        iteration : int
+            iteration of the switching cycle
+
+        Returns
+        -------
+        w : float
+            reversible work, eV/atom
+
+        q : float
+            dissipated energy, eV/atom
+        """
+        w, q, qerr = find_w(
+            self.simfolder,
+            self.calc,
+            full=True,
+            solid=self._spring_reference,
+            data=self.data,
+            iterations=[iteration],
+        )
+        return w, q
+
+    def get_error(self, iterations):
+        """
+        Get the standard error of the mean work over switching cycles
+
+        Parameters
+        ----------
+        iterations : list of ints
+            iterations of the switching cycles
+
+        Returns
+        -------
+        w : float
+            mean reversible work, eV/atom
+
+        err : float
+            standard error of the mean, eV/atom
+        """
+        w, q, qerr = find_w(
+            self.simfolder,
+            self.calc,
+            full=True,
+            solid=self._spring_reference,
+            data=self.data,
+            iterations=iterations,
+        )
+        # qerr is the standard deviation of the individual works
+        err = qerr / np.sqrt(max(len(iterations) - 1, 1))
+        return w, err
+
+    def complete_stage(self, stage):
+        """
+        Record a completed stage and write out the state of the job
+
+        Parameters
+        ----------
+        stage : string
+            name of the stage, for example `averaging` or `run_integration_2`
+
+        Returns
+        -------
+        None
+        """
+        if stage not in self.stages:
+            self.stages.append(stage)
+        save_job(self)
+
+    def is_stage_complete(self, stage):
+        """
+        Check if a stage was completed, possibly before a restart
+
+        Parameters
+        ----------
+        stage : string
+            name of the stage
+
+        Returns
+        -------
+        bool
+        """
+        return stage in self.stages
+
+    def load_checkpoint(self):
+        """
+        Read the state and completed stages of an interrupted calculation
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        None
+        """
+        statefile = os.path.join(self.simfolder, "job_state.json")
+        if not os.path.exists(statefile):
+            return
+        self.set_state(load_state(statefile))
+        self.logger.info(
+            "Restarting calculation, completed stages: %s" % ", ".join(self.stages)
+        )
+
     def _from_dict(self, org_dict, indict):
         for key, val in indict.items():
             if isinstance(val, dict):
@@ -250,6 +484,227 @@ class Phase:
         lmp.command("run               0")
         lmp.command("undump            2")
 
+    def start_data_collection(self, lmp, fixid, values, filename):
+        """
+        Start collecting the given variables every step
+
+        Parameters
+        ----------
+        lmp : LammpsLibrary object
+
+        fixid : string
+            id of the fix used for collection
+
+        values : list of strings
+            names of equal-style variables to be collected
+
+        filename : string
+            name of the data file
+
+        Returns
+        -------
+        None
+
+        Notes
+        -----
+        If `in_memory_data` is used, the values are stored within LAMMPS using
+        `fix vector`, otherwise they are written to `filename` with `fix print`.
+        """
+        if self.in_memory:
+            for count, value in enumerate(values):
+                lmp.command(
+                    "fix               %s_%d all vector 1 v_%s" % (fixid, count, value)
+                )
+        else:
+            lmp.command(
+                'fix               %s all print 1 "%s" screen no file %s'
+                % (fixid, " ".join(["${%s}" % value for value in values]), filename)
+            )
+
+    def stop_data_collection(self, lmp, fixid, values, filename):
+        """
+        Stop collecting data started by `start_data_collection`
+
+        Parameters
+        ----------
+        lmp : LammpsLibrary object
+
+        fixid : string
+            id of the fix used for collection
+
+        values : list of strings
+            names of equal-style variables which were collected
+
+        filename : string
+            name of the data file
+
+        Returns
+        -------
+        None
+
+        Notes
+        -----
+        If `in_memory_data` is used, the collected values are gathered through
+        the library interface into an array of shape (len(values), nsteps+1),
+        the same layout as `np.loadtxt(filename, unpack=True)`. Otherwise the
+        text file is read once after the run. In both cases the array is stored
+        in `self.data` and saved in the `.npy` format next to `filename`.
+        """
+        if not self.in_memory:
+            lmp.command("unfix             %s" % fixid)
+            if not self.calc.script_mode:
+                self.data[os.path.splitext(filename)[0]] = convert_data(
+                    os.path.join(self.simfolder, filename)
+                )
+            return
+
+        data = []
+        for count, value in enumerate(values):
+            name = "%s_%d" % (fixid, count)
+            lmp.command("variable          %s vector f_%s" % (name, name))
+            data.append(lmp.extract_variable(name, None, 2))
+            lmp.command("variable          %s delete" % name)
+            lmp.command("unfix             %s" % name)
+
+        key = os.path.splitext(filename)[0]
+        self.data[key] = np.array(data, dtype=float)
+        np.save(os.path.join(self.simfolder, key + ".npy"), self.data[key])
+
+    def save_session(self, lmp):
+        """
+        Keep a LAMMPS object open for later stages
+
+        Parameters
+        ----------
+        lmp : LammpsLibrary object
+
+        Returns
+        -------
+        None
+
+        Notes
+        -----
+        The unwrapped positions and velocities of all atoms are stored within
+        LAMMPS using `fix store/state`, and the box is stored in the class, so
+        that the state can be recovered by `restore_session` without writing
+        or reading files. The potential stays loaded.
+        """
+        lmp.command(
+            "fix               calphy_snapshot all store/state 0 xu yu zu vx vy vz"
+        )
+        boxlo, boxhi, xy, yz, xz, periodicity, box_change = lmp.extract_box()
+        self._snapshot_box = [list(boxlo), list(boxhi), xy, xz, yz]
+        self.lmp = lmp
+
+    def restore_session(self):
+        """
+        Get the LAMMPS object kept by `save_session`, reset to the stored state
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        lmp : LammpsLibrary object
+        """
+        lmp = self.lmp
+        boxlo, boxhi, xy, xz, yz = self._snapshot_box
+        command = "change_box        all x final %.16g %.16g y final %.16g %.16g z final %.16g %.16g" % (
+            boxlo[0],
+            boxhi[0],
+            boxlo[1],
+            boxhi[1],
+            boxlo[2],
+            boxhi[2],
+        )
+        if (xy != 0) or (xz != 0) or (yz != 0):
+            command += " xy final %.16g xz final %.16g yz final %.16g" % (xy, xz, yz)
+        lmp.command(command + " units box")
+
+        # displace_atoms also moves atoms between processors as needed
+        lmp.command("compute           calphy_xu all property/atom xu yu zu")
+        lmp.command("variable          calphy_dx atom f_calphy_snapshot[1]-c_calphy_xu[1]")
+        lmp.command("variable          calphy_dy atom f_calphy_snapshot[2]-c_calphy_xu[2]")
+        lmp.command("variable          calphy_dz atom f_calphy_snapshot[3]-c_calphy_xu[3]")
+        lmp.command("variable          calphy_vx atom f_calphy_snapshot[4]")
+        lmp.command("variable          calphy_vy atom f_calphy_snapshot[5]")
+        lmp.command("variable          calphy_vz atom f_calphy_snapshot[6]")
+        lmp.command("run               0")
+        lmp.command(
+            "displace_atoms    all move v_calphy_dx v_calphy_dy v_calphy_dz units box"
+        )
+        lmp.command("velocity          all set v_calphy_vx v_calphy_vy v_calphy_vz")
+        for name in ["dx", "dy", "dz", "vx", "vy", "vz"]:
+            lmp.command("variable          calphy_%s delete" % name)
+        lmp.command("uncompute         calphy_xu")
+        lmp.command("reset_timestep    0")
+        return lmp
+
+    def close_session(self):
+        """
+        Close the LAMMPS object kept by `save_session`, if any
+        """
+        if self.lmp is not None:
+            self.lmp.close()
+            self.lmp = None
+
+    def get_sweep_start(self, name):
+        """
+        Get the structure written by `save_sweep_start`
+
+        Parameters
+        ----------
+        name : string
+            name of the sweep
+
+        Returns
+        -------
+        conf : string or None
+            data file to start the sweep from. None if warm starts are not used,
+            or if no structure was written after the last equilibration.
+        """
+        if not self.warm_start:
+            return None
+        conf = os.path.join(self.simfolder, "conf.%s.data" % name)
+        equilibrated = os.path.join(self.simfolder, "conf.equilibration.data")
+        if not os.path.exists(conf):
+            return None
+        if os.path.getmtime(conf) < os.path.getmtime(equilibrated):
+            return None
+        return conf
+
+    def save_sweep_start(self, lmp, name, iteration):
+        """
+        Write the equilibrated structure a sweep starts from, if warm starts are used
+
+        Parameters
+        ----------
+        lmp : LammpsLibrary object
+
+        name : string
+            name of the sweep
+
+        iteration : int
+            iteration of the calculation
+
+        Returns
+        -------
+        None
+
+        Notes
+        -----
+        The file is written under a name unique to the iteration and then
+        renamed, so that iterations running in parallel never read a
+        partially written file.
+        """
+        if not self.warm_start:
+            return
+        conf = os.path.join(self.simfolder, "conf.%s.data" % name)
+        tmpconf = os.path.join(self.simfolder, "conf.%s.%d.data" % (name, iteration))
+        lmp = ph.write_data(lmp, tmpconf)
+        os.replace(tmpconf, conf)
+
     def get_structures(self, stage="fe", direction="forward", n_iteration=1):
         """ """
         species = self.calc.element
@@ -273,19 +728,47 @@ class Phase:
 
         return structures
 
-    def check_if_melted(self, lmp, filename):
+    def find_solid_fraction(self, lmp, filename=None):
+        """
+        Find the fraction of solid atoms
+
+        Parameters
+        ----------
+        lmp : LammpsLibrary object
+
+        filename : string, optional
+            snapshot to be analysed. If None, the current configuration is
+            gathered from LAMMPS and analysed in memory.
+
+        Returns
+        -------
+        fraction : float
+            fraction of solid atoms
+        """
+        if filename is not None:
+            solids = ph.find_solid_fraction(os.path.join(self.simfolder, filename))
+            return solids / self.natoms
+
+        sys = ph.get_system(lmp)
+        try:
+            solids = ph.count_solids(sys, cutoff=self._solid_cutoff)
+        except RuntimeError:
+            # adaptive cutoff failed, keep the fixed cutoff for later checks
+            self._solid_cutoff = 5.0
+            solids = ph.count_solids(sys, cutoff=self._solid_cutoff)
+        return solids / self.natoms
+
+    def check_if_melted(self, lmp, filename=None):
         """ """
-        solids = ph.find_solid_fraction(os.path.join(self.simfolder, filename))
-        if solids / lmp.natoms < self.calc.tolerance.solid_fraction:
+        if self.find_solid_fraction(lmp, filename=filename) < self.calc.tolerance.solid_fraction:
             lmp.close()
             raise MeltedError(
                 "System melted, increase size or reduce temp!\n Solid detection algorithm only works with BCC/FCC/HCP/SC/DIA. Detection algorithm can be turned off by setting:\n tolerance.solid_fraction: 0"
             )
 
-    def check_if_solidfied(self, lmp, filename):
+    def check_if_solidfied(self, lmp, filename=None):
         """ """
-        solids = ph.find_solid_fraction(os.path.join(self.simfolder, filename))
-        if solids / lmp.natoms > self.calc.tolerance.liquid_fraction:
+        if self.find_solid_fraction(lmp, filename=filename) > self.calc.tolerance.liquid_fraction:
             lmp.close()
             raise SolidifiedError("System solidified, increase temperature")
 
@@ -550,28 +1033,36 @@ class Phase:
             )
         )
 
-        laststd = 0.00
         converged = False
 
+        # only the rows added in each cycle are read and accumulated
+        reader = ph.DataFileTail(
+            os.path.join(self.simfolder, "avg.dat"), usecols=(1, 2, 3, 4)
+        )
+        press = ph.RunningAverage()
+        vol = ph.RunningAverage()
+
         for i in range(int(self.calc.md.n_cycles)):
             lmp.command("run              %d" % int(self.calc.md.n_small_steps))
             ncount = int(self.calc.md.n_small_steps) // int(
                 self.calc.md.n_every_steps * self.calc.md.n_repeat_steps
             )
             # now we can check if it converted
-            file = os.path.join(self.simfolder, "avg.dat")
-            lx, ly, lz, ipress = np.loadtxt(file, usecols=(1, 2, 3, 4), unpack=True)
+            lx, ly, lz, ipress = reader.read()
+            press.add(ipress)
+            vol.add((lx * ly * lz) / self.natoms)
 
-            lxpc = ipress
-            mean = np.mean(lxpc)
-            std = np.std(lxpc)
-            volatom = np.mean((lx * ly * lz) / self.natoms)
+            mean = press.mean
+            volatom = vol.mean
             self.logger.info(
-                "At count %d mean pressure is %f with %f vol/atom"
-                % (i + 1, mean, volatom)
+                "At count %d mean pressure is %f +/- %f with %f vol/atom"
+                % (i + 1, mean, press.error, volatom)
             )
 
-            if (np.abs(mean - self.calc._pressure)) < self.calc.tolerance.pressure:
+            # the target has to be within the tolerance, and the error known
+            if np.isfinite(press.error) and (
+                np.abs(mean - self.calc._pressure) < self.calc.tolerance.pressure
+            ):
 
                 # process other means
                 self.lx = np.round(np.mean(lx[-ncount + 1 :]), decimals=3)
@@ -590,7 +1081,6 @@ class Phase:
                 )
                 converged = True
                 break
-            laststd = std
 
         if not converged:
             lmp.close()
@@ -684,24 +1174,44 @@ class Phase:
         )
 
         lastmean = 100000000
+        lasterror = 0.0
         converged = False
+
+        # only the rows added in each cycle are read
+        reader = ph.DataFileTail(
+            os.path.join(self.simfolder, "avg.dat"), usecols=(1, 2, 3, 4)
+        )
+
         for i in range(int(self.calc.md.n_cycles)):
             lmp.command("run              %d" % int(self.calc.md.n_small_steps))
 
             # now we can check if it converted
-            mean, std, volatom = self.process_pressure()
+            data = reader.read()
+            mean, error, volatom = self.process_pressure(data=data)
             self.logger.info(
-                "At count %d mean pressure is %f with %f vol/atom"
-                % (i + 1, mean, volatom)
+                "At count %d mean pressure is %f +/- %f with %f vol/atom"
+                % (i + 1, mean, error, volatom)
             )
 
-            if (np.abs(mean - lastmean)) < 50 * self.calc.tolerance.pressure:
+            # consecutive cycles agree within the tolerance, or the statistical error
+            # of both, which needs at least two cycles with a known error
+            if (
+                (i > 0)
+                and np.isfinite(error)
+                and np.isfinite(lasterror)
+                and (np.abs(mean - lastmean))
+                < max(
+                    50 * self.calc.tolerance.pressure,
+                    np.sqrt(error**2 + lasterror**2),
+                )
+            ):
                 # here we actually have to set the pressure
-                self.finalise_pressure()
+                self.finalise_pressure(data=data)
                 converged = True
                 break
 
             lastmean = mean
+            lasterror = error
 
         lmp.command("unfix            1")
         lmp.command("unfix            2")
@@ -710,9 +1220,20 @@ class Phase:
             lmp.close()
             raise ValueError("pressure did not converge")
 
-    def process_pressure(
-        self,
-    ):
+    def _read_pressure_block(self, data=None):
+        """
+        Get the box dimensions and pressure of the last averaging block
+
+        Parameters
+        ----------
+        data : ndarray, optional
+            rows of `avg.dat` of the last block, as returned by `ph.DataFileTail`.
+            If None, `avg.dat` is read.
+
+        Returns
+        -------
+        lx, ly, lz, press : ndarrays
+        """
         if self.calc.script_mode:
             ncount = int(self.calc.n_equilibration_steps) // int(
                 self.calc.md.n_every_steps * self.calc.md.n_repeat_steps
@@ -722,40 +1243,56 @@ class Phase:
                 self.calc.md.n_every_steps * self.calc.md.n_repeat_steps
             )
 
-        # now we can check if it converted
-        file = os.path.join(self.simfolder, "avg.dat")
+        if data is None:
+            file = os.path.join(self.simfolder, "avg.dat")
+            data = np.loadtxt(file, usecols=(1, 2, 3, 4), unpack=True)
+
         # we have to clean the data, so as just the last block is selected
-        lx, ly, lz, lxpc = np.loadtxt(file, usecols=(1, 2, 3, 4), unpack=True)
-        lx = lx[-ncount + 1 :]
-        ly = ly[-ncount + 1 :]
-        lz = lx[-ncount + 1 :]
-        lxpc = lxpc[-ncount + 1 :]
-        mean = np.mean(lxpc)
-        std = np.std(lxpc)
+        lx, ly, lz, lxpc = [np.atleast_1d(x)[-ncount + 1 :] for x in data]
+        return lx, ly, lz, lxpc
+
+    def process_pressure(self, data=None):
+        """
+        Get the mean pressure of the last averaging block
+
+        Parameters
+        ----------
+        data : ndarray, optional
+            rows of `avg.dat` of the last block. If None, `avg.dat` is read.
+
+        Returns
+        -------
+        mean : float
+            mean pressure
+
+        error : float
+            standard error of the mean pressure
+
+        volatom : float
+            mean volume per atom
+        """
+        lx, ly, lz, lxpc = self._read_pressure_block(data=data)
+        press = ph.RunningAverage()
+        press.add(lxpc)
         volatom = np.mean((lx * ly * lz) / self.natoms)
-        return mean, std, volatom
+        return press.mean, press.error, volatom
 
-    def finalise_pressure(
-        self,
-    ):
-        if self.calc.script_mode:
-            ncount = int(self.calc.n_equilibration_steps) // int(
-                self.calc.md.n_every_steps * self.calc.md.n_repeat_steps
-            )
-        else:
-            ncount = int(self.calc.md.n_small_steps) // int(
-                self.calc.md.n_every_steps * self.calc.md.n_repeat_steps
-            )
+    def finalise_pressure(self, data=None):
+        """
+        Set the pressure and box dimensions from the last averaging block
+
+        Parameters
+        ----------
+        data : ndarray, optional
+            rows of `avg.dat` of the last block. If None, `avg.dat` is read.
 
-        file = os.path.join(self.simfolder, "avg.dat")
-        lx, ly, lz, lxpc = np.loadtxt(file, usecols=(1, 2, 3, 4), unpack=True)
-        lx = lx[-ncount + 1 :]
-        ly = ly[-ncount + 1 :]
-        lz = lx[-ncount + 1 :]
-        lxpc = lxpc[-ncount + 1 :]
+        Returns
+        -------
+        None
+        """
+        lx, ly, lz, lxpc = self._read_pressure_block(data=data)
 
         mean = np.mean(lxpc)
-        std = np.std(lxpc)
         volatom = np.mean((lx * ly * lz) / self.natoms)
 
         self.calc._pressure = mean
@@ -858,8 +1395,7 @@ class Phase:
         self.report = report
 
         reportfile = os.path.join(self.simfolder, "report.yaml")
-        with open(reportfile, "w") as f:
-            yaml.dump(report, f)
+        yamlio.write_report(report, reportfile)
 
         self.logger.info("Report written in %s" % reportfile)
 
@@ -899,6 +1435,8 @@ class Phase:
         t0 = self.calc._temperature
         tf = self.calc._temperature_stop
         li = 1
+        if self.sweep_start is not None:
+            li = t0 / self.sweep_start
         lf = t0 / tf
         pi = self.calc._pressure
         pf = lf * pi
@@ -918,43 +1456,48 @@ class Phase:
 
         lmp.command(f"pair_style {self.calc._pair_style_with_options[0]}")
 
-        # read in conf file
+        # read in conf file, or the state equilibrated by an earlier iteration
         # conf = os.path.join(self.simfolder, "conf.equilibration.dump")
-        conf = os.path.join(self.simfolder, "conf.equilibration.data")
+        warmconf = self.get_sweep_start("reversible_scaling")
+        if warmconf is None:
+            conf = os.path.join(self.simfolder, "conf.equilibration.data")
+        else:
+            conf = warmconf
         lmp = ph.read_data(lmp, conf)
 
         # set up potential
         lmp.command(f"pair_coeff {self.calc.pair_coeff[0]}")
         lmp = ph.set_mass(lmp, self.calc)
 
-        # remap the box to get the correct pressure
-        lmp = ph.remap_box(lmp, self.lx, self.ly, self.lz)
-
-        # set thermostat and run equilibrium
-        if self.calc.npt:
-            lmp.command(
-                "fix               f1 all npt temp %f %f %f %s %f %f %f"
-                % (
-                    t0,
-                    t0,
-                    self.calc.md.thermostat_damping[1],
-                    self.iso,
-                    pi,
-                    pi,
-                    self.calc.md.barostat_damping[1],
+        if warmconf is None:
+            # remap the box to get the correct pressure
+            lmp = ph.remap_box(lmp, self.lx, self.ly, self.lz)
+
+            # set thermostat and run equilibrium
+            if self.calc.npt:
+                lmp.command(
+                    "fix               f1 all npt temp %f %f %f %s %f %f %f"
+                    % (
+                        t0,
+                        t0,
+                        self.calc.md.thermostat_damping[1],
+                        self.iso,
+                        pi,
+                        pi,
+                        self.calc.md.barostat_damping[1],
+                    )
+                )
+            else:
+                lmp.command(
+                    "fix               f1 all nvt temp %f %f %f"
+                    % (t0, t0, self.calc.md.thermostat_damping[1])
                 )
-            )
-        else:
-            lmp.command(
-                "fix               f1 all nvt temp %f %f %f"
-                % (t0, t0, self.calc.md.thermostat_damping[1])
-            )
 
-        self.logger.info(f"Starting equilibration: {iteration}")
-        lmp.command("run               %d" % self.calc.n_equilibration_steps)
-        self.logger.info(f"Finished equilibration: {iteration}")
+            self.logger.info(f"Starting equilibration: {iteration}")
+            lmp.command("run               %d" % self.calc.n_equilibration_steps)
+            self.logger.info(f"Finished equilibration: {iteration}")
 
-        lmp.command("unfix             f1")
+            lmp.command("unfix             f1")
 
         # now fix com
         lmp.command("variable         xcm equal xcm(all,x)")
@@ -986,6 +1529,8 @@ class Phase:
 
         lmp.command("variable          step    equal step")
         lmp.command("variable          dU      equal c_thermo_pe/atoms")
+        lmp.command("variable          vpress  equal press")
+        lmp.command("variable          vvol    equal vol")
         lmp.command("thermo_style      custom step pe c_tcm press vol")
         lmp.command("thermo            10000")
 
@@ -995,15 +1540,20 @@ class Phase:
             % (t0, np.random.randint(1, 10000))
         )
 
-        self.logger.info(f"Starting equilibration with constrained com: {iteration}")
-        lmp.command("run               %d" % self.calc.n_equilibration_steps)
-        self.logger.info(f"Finished equilibration with constrained com: {iteration}")
+        if warmconf is None:
+            self.logger.info(f"Starting equilibration with constrained com: {iteration}")
+            lmp.command("run               %d" % self.calc.n_equilibration_steps)
+            self.logger.info(f"Finished equilibration with constrained com: {iteration}")
+            self.save_sweep_start(lmp, "reversible_scaling", iteration)
+        else:
+            self.logger.info(f"Starting decorrelation from {warmconf}: {iteration}")
+            lmp.command("run               %d" % self.calc.n_decorrelation_steps)
+            self.logger.info(f"Finished decorrelation: {iteration}")
 
         lmp.command("variable         flambda equal ramp(${li},${lf})")
         lmp.command("variable         blambda equal ramp(${lf},${li})")
-        lmp.command("variable         fscale equal v_flambda-1.0")
-        lmp.command("variable         bscale equal v_blambda-1.0")
-        lmp.command("variable         one equal 1.0")
+        lmp.command("variable         fscale equal v_flambda")
+        lmp.command("variable         bscale equal v_blambda")
         lmp.command(
             f"variable        ftemp equal v_blambda*{self.calc._temperature_stop}"
         )
@@ -1011,43 +1561,36 @@ class Phase:
             f"variable        btemp equal v_flambda*{self.calc._temperature_stop}"
         )
 
-        # set up potential
+        # set up potential, it is evaluated once and scaled by lambda
         pc = self.calc.pair_coeff[0]
         pcraw = pc.split()
-        pcnew1 = " ".join(
+        pcnew = " ".join(
             [
                 *pcraw[:2],
                 *[
                     self.calc._pair_style_names[0],
                 ],
-                "1",
-                *pcraw[2:],
-            ]
-        )
-        pcnew2 = " ".join(
-            [
-                *pcraw[:2],
-                *[
-                    self.calc._pair_style_names[0],
-                ],
-                "2",
                 *pcraw[2:],
             ]
         )
 
         lmp.command(
-            "pair_style       hybrid/scaled v_one %s v_fscale %s"
-            % (
-                self.calc._pair_style_with_options[0],
-                self.calc._pair_style_with_options[0],
-            )
+            "pair_style       hybrid/scaled v_fscale %s"
+            % (self.calc._pair_style_with_options[0],)
         )
-        lmp.command("pair_coeff       %s" % pcnew1)
-        lmp.command("pair_coeff       %s" % pcnew2)
-
-        lmp.command(
-            'fix               f3 all print 1 "${dU} $(press) $(vol) ${flambda}" screen no file ts.forward_%d.dat'
-            % iteration
+        lmp.command("pair_coeff       %s" % pcnew)
+
+        # equilibrate with the scaled potential the sweep starts from
+        if li != 1:
+            lmp.command("variable         fscale equal %f" % li)
+            lmp.command("run               %d" % self.calc.n_equilibration_steps)
+            lmp.command("variable         fscale equal v_flambda")
+
+        self.start_data_collection(
+            lmp,
+            "f3",
+            ["dU", "vpress", "vvol", "flambda"],
+            "ts.forward_%d.dat" % iteration,
         )
 
         # add swaps if n_swap is > 0
@@ -1088,7 +1631,12 @@ class Phase:
             lmp.command("unfix swap2")
 
         # unfix
-        lmp.command("unfix             f3")
+        self.stop_data_collection(
+            lmp,
+            "f3",
+            ["dU", "vpress", "vvol", "flambda"],
+            "ts.forward_%d.dat" % iteration,
+        )
         # lmp.command("unfix             f1")
 
         if self.calc.n_print_steps > 0:
@@ -1099,20 +1647,18 @@ class Phase:
 
         # check melting or freezing
         if not self.calc.script_mode:
-            self.dump_current_snapshot(lmp, "traj.temp.dat")
             if solid:
-                self.check_if_melted(lmp, "traj.temp.dat")
+                self.check_if_melted(lmp)
             else:
-                self.check_if_solidfied(lmp, "traj.temp.dat")
+                self.check_if_solidfied(lmp)
 
         lmp = ph.set_potential(lmp, self.calc)
 
         # reverse scaling
         lmp.command("variable         flambda equal ramp(${li},${lf})")
         lmp.command("variable         blambda equal ramp(${lf},${li})")
-        lmp.command("variable         fscale equal v_flambda-1.0")
-        lmp.command("variable         bscale equal v_blambda-1.0")
-        lmp.command("variable         one equal 1.0")
+        lmp.command("variable         fscale equal v_flambda")
+        lmp.command("variable         bscale equal v_blambda")
         lmp.command(
             f"variable        ftemp equal v_blambda*{self.calc._temperature_stop}"
         )
@@ -1121,19 +1667,17 @@ class Phase:
         )
 
         lmp.command(
-            "pair_style       hybrid/scaled v_one %s v_bscale %s"
-            % (
-                self.calc._pair_style_with_options[0],
-                self.calc._pair_style_with_options[0],
-            )
+            "pair_style       hybrid/scaled v_bscale %s"
+            % (self.calc._pair_style_with_options[0],)
         )
-        lmp.command("pair_coeff       %s" % pcnew1)
-        lmp.command("pair_coeff       %s" % pcnew2)
+        lmp.command("pair_coeff       %s" % pcnew)
 
         # apply fix and perform switching
-        lmp.command(
-            'fix               f3 all print 1 "${dU} $(press) $(vol) ${blambda}" screen no file ts.backward_%d.dat'
-            % iteration
+        self.start_data_collection(
+            lmp,
+            "f3",
+            ["dU", "vpress", "vvol", "blambda"],
+            "ts.backward_%d.dat" % iteration,
         )
 
         if self.calc.n_print_steps > 0:
@@ -1173,7 +1717,12 @@ class Phase:
             lmp.command("unfix swap")
             lmp.command("unfix swap2")
 
-        lmp.command("unfix             f3")
+        self.stop_data_collection(
+            lmp,
+            "f3",
+            ["dU", "vpress", "vvol", "blambda"],
+            "ts.backward_%d.dat" % iteration,
+        )
 
         if self.calc.n_print_steps > 0:
             lmp.command("undump           d1")
@@ -1189,7 +1738,9 @@ class Phase:
             self.logger.info("- 10.1103/PhysRevLett.83.3973")
             self.publications.append("10.1103/PhysRevLett.83.3973")
 
-    def integrate_reversible_scaling(self, scale_energy=True, return_values=False):
+    def integrate_reversible_scaling(
+        self, scale_energy=True, return_values=False, fe_start=None
+    ):
         """
         Perform integration after reversible scaling
 
@@ -1201,20 +1752,32 @@ class Phase:
         return_values : bool, optional
             If True, return integrated values
 
+        fe_start : float, optional
+            free energy at `sweep_start`. Only needed if `sweep_start` is set,
+            otherwise `fe` is used.
+
         Returns
         -------
         res : list of lists of shape 1x3
             Only returned if `return_values` is True.
         """
+        f0 = self.fe
+        if self.sweep_start is not None:
+            # free energy of the scaled system at the temperature
+            ts = self.sweep_start
+            li = self.calc._temperature / ts
+            f0 = li * (fe_start - 1.5 * kb * ts * np.log(li))
+
         res, ediss = integrate_rs(
             self.simfolder,
-            self.fe,
+            f0,
             self.calc._temperature,
             self.natoms,
             p=self.calc._pressure,
-            nsims=self.calc.n_iterations,
+            nsims=len(self.get_iterations()),
             scale_energy=scale_energy,
             return_values=return_values,
+            data=self.data,
         )
 
         self.logger.info(f'Maximum energy dissipation along the temperature scaling part: {ediss} eV/atom')
@@ -1264,9 +1827,13 @@ class Phase:
 
         lmp.command(f"pair_style {self.calc._pair_style_with_options[0]}")
 
-        # read in conf
+        # read in conf, or the state equilibrated by an earlier iteration
         # conf = os.path.join(self.simfolder, "conf.equilibration.dump")
-        conf = os.path.join(self.simfolder, "conf.equilibration.data")
+        warmconf = self.get_sweep_start("temperature_scaling")
+        if warmconf is None:
+            conf = os.path.join(self.simfolder, "conf.equilibration.data")
+        else:
+            conf = warmconf
         lmp = ph.read_data(lmp, conf)
 
         # set up potential
@@ -1274,7 +1841,8 @@ class Phase:
         lmp = ph.set_mass(lmp, self.calc)
 
         # remap the box to get the correct pressure
-        lmp = ph.remap_box(lmp, self.lx, self.ly, self.lz)
+        if warmconf is None:
+            lmp = ph.remap_box(lmp, self.lx, self.ly, self.lz)
 
         # equilibrate first
         lmp.command(
@@ -1289,12 +1857,23 @@ class Phase:
                 self.calc.md.barostat_damping[1],
             )
         )
-        lmp.command("run               %d" % self.calc.n_equilibration_steps)
+        if warmconf is None:
+            lmp.command("run               %d" % self.calc.n_equilibration_steps)
+            self.save_sweep_start(lmp, "temperature_scaling", iteration)
+        else:
+            # new velocities, and a short run to decorrelate from earlier iterations
+            lmp.command(
+                "velocity          all create %f %d mom yes rot yes dist gaussian"
+                % (t0, np.random.randint(1, 10000))
+            )
+            lmp.command("run               %d" % self.calc.n_decorrelation_steps)
         lmp.command("unfix             1")
 
         # now scale system to final temp, thereby recording enerfy at every step
         lmp.command("variable          step    equal step")
         lmp.command("variable          dU      equal pe/atoms")
+        lmp.command("variable          vpress  equal press")
+        lmp.command("variable          vvol    equal vol")
         lmp.command("variable          lambda equal ramp(${li},${lf})")
 
         lmp.command(
@@ -1309,14 +1888,15 @@ class Phase:
                 self.calc.md.barostat_damping[1],
             )
         )
-        lmp.command(
-            'fix               f3 all print 1 "${dU} $(press) $(vol) ${lambda}" screen no file ts.forward_%d.dat'
-            % iteration
+        self.start_data_collection(
+            lmp, "f3", ["dU", "vpress", "vvol", "lambda"], "ts.forward_%d.dat" % iteration
         )
         lmp.command("run               %d" % self.calc._n_sweep_steps)
 
         lmp.command("unfix             f2")
-        lmp.command("unfix             f3")
+        self.stop_data_collection(
+            lmp, "f3", ["dU", "vpress", "vvol", "lambda"], "ts.forward_%d.dat" % iteration
+        )
 
         lmp.command(
             "fix               1 all npt temp %f %f %f %s %f %f %f"
@@ -1334,18 +1914,11 @@ class Phase:
         lmp.command("unfix             1")
 
         # check melting or freezing
-        lmp.command(
-            "dump              2 all custom 1 traj.temp.dat id type mass x y z vx vy vz"
-        )
-        lmp.command("run               0")
-        lmp.command("undump            2")
-
         if not self.calc.script_mode:
-            self.dump_current_snapshot(lmp, "traj.temp.dat")
             if solid:
-                self.check_if_melted(lmp, "traj.temp.dat")
+                self.check_if_melted(lmp)
             else:
-                self.check_if_solidfied(lmp, "traj.temp.dat")
+                self.check_if_solidfied(lmp)
 
         # start reverse loop
         lmp.command("variable          lambda equal ramp(${lf},${li})")
@@ -1362,11 +1935,13 @@ class Phase:
                 self.calc.md.barostat_damping[1],
             )
         )
-        lmp.command(
-            'fix               f3 all print 1 "${dU} $(press) $(vol) ${lambda}" screen no file ts.backward_%d.dat'
-            % iteration
+        self.start_data_collection(
+            lmp, "f3", ["dU", "vpress", "vvol", "lambda"], "ts.backward_%d.dat" % iteration
         )
         lmp.command("run               %d" % self.calc._n_sweep_steps)
+        self.stop_data_collection(
+            lmp, "f3", ["dU", "vpress", "vvol", "lambda"], "ts.backward_%d.dat" % iteration
+        )
 
         lmp.close()
 
@@ -1406,9 +1981,13 @@ class Phase:
 
         lmp.command(f"pair_style {self.calc._pair_style_with_options[0]}")
 
-        # read in conf
+        # read in conf, or the state equilibrated by an earlier iteration
         # conf = os.path.join(self.simfolder, "conf.dump")
-        conf = os.path.join(self.simfolder, "conf.equilibration.data")
+        warmconf = self.get_sweep_start("pressure_scaling")
+        if warmconf is None:
+            conf = os.path.join(self.simfolder, "conf.equilibration.data")
+        else:
+            conf = warmconf
         lmp = ph.read_data(lmp, conf)
 
         # set up potential
@@ -1416,7 +1995,8 @@ class Phase:
         lmp = ph.set_mass(lmp, self.calc)
 
         # remap the box to get the correct pressure
-        lmp = ph.remap_box(lmp, self.lx, self.ly, self.lz)
+        if warmconf is None:
+            lmp = ph.remap_box(lmp, self.lx, self.ly, self.lz)
 
         # equilibrate first
         lmp.command(
@@ -1431,12 +2011,22 @@ class Phase:
                 self.calc.md.barostat_damping[1],
             )
         )
-        lmp.command("run               %d" % self.calc.n_equilibration_steps)
+        if warmconf is None:
+            lmp.command("run               %d" % self.calc.n_equilibration_steps)
+            self.save_sweep_start(lmp, "pressure_scaling", iteration)
+        else:
+            # new velocities, and a short run to decorrelate from earlier iterations
+            lmp.command(
+                "velocity          all create %f %d mom yes rot yes dist gaussian"
+                % (t0, np.random.randint(1, 10000))
+            )
+            lmp.command("run               %d" % self.calc.n_decorrelation_steps)
         lmp.command("unfix             1")
 
         # now scale system to final temp, thereby recording enerfy at every step
         lmp.command("variable          step    equal step")
         lmp.command("variable          dU      equal pe/atoms")
+        lmp.command("variable          vvol    equal vol")
         lmp.command("variable          lambda equal ramp(${li},${lf})")
         lmp.command("variable          pp equal ramp(${p0},${pf})")
 
@@ -1452,14 +2042,15 @@ class Phase:
                 self.calc.md.barostat_damping[1],
             )
         )
-        lmp.command(
-            'fix               f3 all print 1 "${dU} ${pp} $(vol) ${lambda}" screen no file ps.forward_%d.dat'
-            % iteration
+        self.start_data_collection(
+            lmp, "f3", ["dU", "pp", "vvol", "lambda"], "ps.forward_%d.dat" % iteration
         )
         lmp.command("run               %d" % self.calc._n_sweep_steps)
 
         lmp.command("unfix             f2")
-        lmp.command("unfix             f3")
+        self.stop_data_collection(
+            lmp, "f3", ["dU", "pp", "vvol", "lambda"], "ps.forward_%d.dat" % iteration
+        )
 
         lmp.command(
             "fix               1 all npt temp %f %f %f %s %f %f %f"
@@ -1492,11 +2083,13 @@ class Phase:
                 self.calc.md.barostat_damping[1],
             )
         )
-        lmp.command(
-            'fix               f3 all print 1 "${dU} ${pp} $(vol) ${lambda}" screen no file ps.backward_%d.dat'
-            % iteration
+        self.start_data_collection(
+            lmp, "f3", ["dU", "pp", "vvol", "lambda"], "ps.backward_%d.dat" % iteration
         )
         lmp.command("run               %d" % self.calc._n_sweep_steps)
+        self.stop_data_collection(
+            lmp, "f3", ["dU", "pp", "vvol", "lambda"], "ps.backward_%d.dat" % iteration
+        )
 
         lmp.close()
 
@@ -1526,8 +2119,9 @@ class Phase:
             self.natoms,
             self.calc._pressure,
             self.calc._pressure_stop,
-            nsims=self.calc.n_iterations,
+            nsims=len(self.get_iterations()),
             return_values=return_values,
+            data=self.data,
         )
 
         if return_values:
@@ -1544,7 +2138,8 @@ class Phase:
 
         # write simple metadata
         metadata = generate_metadata()
-        metadata["publications"] = self.publications
+        # steps of script mode each add their citations
+        metadata["publications"] = list(dict.fromkeys(self.publications))
 
         with open(os.path.join(self.simfolder, "metadata.yaml"), "w") as fout:
-            yaml.safe_dump(metadata, fout)
+            yamlio.safe_dump(metadata, fout)
@@ -1,9 +1,10 @@
 import os
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import numpy as np
-import yaml
-import matplotlib.pyplot as plt
+import calphy.yamlio as yamlio
 import warnings
-import pandas as pd
 
 def read_report(folder):
     """
@@ -24,8 +25,7 @@ def read_report(folder):
     if not os.path.exists(repfile):
         raise FileNotFoundError(f"file {repfile} not found")
 
-    with open(repfile, 'r') as fin:
-        data = yaml.safe_load(fin)
+    data = yamlio.read_report(repfile)
     return data
 
 def _extract_error(errfile):
@@ -41,8 +41,185 @@ def _extract_error(errfile):
         pass
     return error_code
     
+def _parse_folder(mainfolder, folder):
+    """
+    Parse a single calculation folder for `gather_results`
+
+    Parameters
+    ----------
+    mainfolder: string
+        folder where calculations are stored
+
+    folder: string
+        name of the calculation folder
+
+    Returns
+    -------
+    record: dict
+        row of the results, None if the folder is not a calculation.
+        The key `elements` holds the species found in the report.
+    """
+    inpfile = os.path.join(mainfolder, folder, 'input_file.yaml')
+    if not os.path.exists(inpfile):
+        return None
+    
+    #ok, valid calculation, try to parse input file to get info
+    with open(inpfile, 'r') as fin:
+        inp = yamlio.safe_load(fin)
+    #grab the first calculation
+    inp = inp['calculations'][0]
+    #mode
+    mode = inp['mode']
+    record = {}
+    record['calculation_mode'] = mode
+    record['status'] = None
+    record['temperature'] = inp['temperature']
+    record['pressure'] = inp['pressure']
+    record['free_energy'] = np.nan
+    record['reference_phase'] = inp['reference_phase']
+    record['error_code'] = None
+    record['composition'] = None
+    record['calculation'] = folder
+    record['ideal_entropy'] = 0
+    record['phase_name'] = inp['phase_name']
+    record['reference_composition'] = inp['reference_composition']
+    record['elements'] = []
+
+    #check output file
+    outfile = os.path.join(mainfolder, folder, 'report.yaml')
+    errfile = os.path.join(os.getcwd(), mainfolder, folder+'.sub.err')
+    
+    if not os.path.exists(outfile):
+        record['status'] = 'False'
+        #check if error file is found
+        record['error_code'] = _extract_error(errfile)
+        return record
+
+    if mode in ['fe', 'alchemy', 'composition_scaling']:
+        record['status'] = 'True'
+    
+    #ok, valid calculation, try to parse input file to get info
+    out = yamlio.read_report(outfile)
+
+    record['free_energy'] = out['results']['free_energy']
+    
+    #add normal composition
+    el_arr = np.array(out['input']['element'].split(' ')).astype(str)
+    comp_arr = np.array(out['input']['concentration'].split(' ')).astype(float)
+    record['composition'] = {str(x):float(y) for x,y in zip(el_arr, comp_arr)}
+
+    if mode == 'composition_scaling':
+        #we need to update composition
+        compdict = inp['composition_scaling']['output_chemical_composition']
+        maxatoms = np.sum([val for key, val in compdict.items()])
+        for key, val in compdict.items():
+            compdict[key] = val/maxatoms
+        record['composition'] = compdict
+        el_arr = list(compdict.keys())
+
+        #we also need to update entropy
+        if 'entropy_contribution' in out['results'].keys():
+            record['ideal_entropy'] = -1*out['results']['entropy_contribution']
+
+    record['elements'] = [str(el) for el in el_arr]
+
+    #parse extra info
+    if mode in ['ts', 'tscale']:
+        datafile = os.path.join(os.getcwd(), mainfolder, folder, 'temperature_sweep.dat')
+        if os.path.exists(datafile):
+            record['status'] = 'True'
+            t, f = np.loadtxt(datafile, unpack=True, usecols=(0,1))
+            record['temperature'] = t
+            record['free_energy'] = f
+        else:
+            record['status'] = 'False'
+            record['error_code'] = _extract_error(errfile)
+    return record
+
+def _folder_signature(mainfolder, folder):
+    """
+    Modification times of all files read by `_parse_folder`
+    """
+    files = [os.path.join(mainfolder, folder, 'input_file.yaml'),
+        os.path.join(mainfolder, folder, 'report.yaml'),
+        os.path.join(mainfolder, folder, 'temperature_sweep.dat'),
+        os.path.join(os.getcwd(), mainfolder, folder+'.sub.err')]
+    mtimes = []
+    for file in files:
+        try:
+            mtimes.append(repr(os.path.getmtime(file)))
+        except OSError:
+            mtimes.append('0')
+    return ' '.join(mtimes)
+
+class ResultIndex:
+    """
+    On-disk index of parsed calculation folders
+
+    Parameters
+    ----------
+    filename: string
+        name of the SQLite database
+
+    Notes
+    -----
+    Each row is keyed by the calculation folder and stores the modification
+    times of the files it was parsed from, so that only new or changed
+    folders need to be parsed again.
+    """
+    version = 1
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.conn = sqlite3.connect(filename)
+        if self.conn.execute('PRAGMA user_version').fetchone()[0] != self.version:
+            self.conn.execute('DROP TABLE IF EXISTS results')
+            self.conn.execute('PRAGMA user_version = %d' % self.version)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS results '
+            '(folder TEXT PRIMARY KEY, signature TEXT, record TEXT)')
+        self.conn.commit()
+
+    def read(self):
+        """
+        Get all rows as a dict of folder: (signature, record)
+        """
+        rows = self.conn.execute('SELECT folder, signature, record FROM results')
+        return {folder: (signature, self._decode(record)) for folder, signature, record in rows}
+
+    def update(self, entries, remove=()):
+        """
+        Add or replace rows given as a dict of folder: (signature, record), remove others
+        """
+        self.conn.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?)',
+            [(folder, signature, self._encode(record)) for folder, (signature, record) in entries.items()])
+        self.conn.executemany('DELETE FROM results WHERE folder = ?', [(folder,) for folder in remove])
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    def _encode(self, record):
+        if record is None:
+            return None
+        record = dict(record)
+        record['arrays'] = []
+        for key, val in record.items():
+            if isinstance(val, np.ndarray):
+                record[key] = val.tolist()
+                record['arrays'].append(key)
+        return json.dumps(record)
+
+    def _decode(self, record):
+        if record is None:
+            return None
+        record = json.loads(record)
+        for key in record.pop('arrays'):
+            record[key] = np.array(record[key])
+        return record
+
 def gather_results(mainfolder, reduce_composition=True, 
-    extract_phase_prefix=False):
+    extract_phase_prefix=False, use_index=True, n_workers=None,
+    use_processes=False):
     """
     Gather results from all subfolders in a given folder into a Pandas DataFrame
 
@@ -58,6 +235,17 @@ def gather_results(mainfolder, reduce_composition=True,
     extract_phase_prefix: bool
         Should be used in conjuction with phase diagram mode. 
         Extracts the prefix and add it as a phase_name column.
+
+    use_index: bool
+        If True, parsed folders are stored in `calphy_index.sqlite` within
+        `mainfolder`, and only new or modified folders are parsed on later calls.
+        Default True.
+
+    n_workers: int
+        number of workers used to parse folders. If None, the number of cores is used.
+
+    use_processes: bool
+        If True, a process pool is used instead of threads. Default False.
     
     Returns
     -------
@@ -69,6 +257,47 @@ def gather_results(mainfolder, reduce_composition=True,
     except ImportError:
         raise ImportError('Please install pandas to use this function')
 
+    folders = []
+    for folder in next(os.walk(mainfolder))[1]:
+        #adjust for pyiron folder, see
+        if folder.split('_')[-1] == 'hdf5':
+            #this could be a pyiron calc
+            withouthdf = folder.split('_hdf5')[0]
+            folder = f'{folder}/{withouthdf}'
+        folders.append(folder)
+
+    signatures = {folder: _folder_signature(mainfolder, folder) for folder in folders}
+    index = None
+    indexed = {}
+    if use_index:
+        try:
+            index = ResultIndex(os.path.join(mainfolder, 'calphy_index.sqlite'))
+            indexed = index.read()
+        except sqlite3.Error:
+            warnings.warn('Could not open result index, all folders are parsed')
+            index = None
+
+    records = {folder: val[1] for folder, val in indexed.items()
+        if (folder in signatures.keys()) and (val[0] == signatures[folder])}
+    changed = [folder for folder in folders if folder not in records.keys()]
+
+    if len(changed) > 0:
+        if n_workers is None:
+            n_workers = os.cpu_count()
+        if (n_workers > 1) and (len(changed) > 1):
+            pool = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+            with pool(max_workers=n_workers) as executor:
+                parsed = list(executor.map(_parse_folder, [mainfolder]*len(changed), changed))
+        else:
+            parsed = [_parse_folder(mainfolder, folder) for folder in changed]
+        for folder, record in zip(changed, parsed):
+            records[folder] = record
+
+    if index is not None:
+        index.update({folder: (signatures[folder], records[folder]) for folder in changed},
+            remove=[folder for folder in indexed.keys() if folder not in signatures.keys()])
+        index.close()
+
     unique_elements = []
     datadict = {}
     datadict['calculation_mode'] = []
@@ -84,94 +313,18 @@ def gather_results(mainfolder, reduce_composition=True,
     datadict['phase_name'] = []
     datadict['reference_composition'] = []
     
-    folders = next(os.walk(mainfolder))[1]
     for folder in folders:
-        #adjust for pyiron folder, see
-        if folder.split('_')[-1] == 'hdf5':
-            #this could be a pyiron calc
-            withouthdf = folder.split('_hdf5')[0]
-            folder = f'{folder}/{withouthdf}'
-            
-        inpfile = os.path.join(mainfolder, folder, 'input_file.yaml')
-        #print(inpfile)
-        if not os.path.exists(inpfile):
-            continue;
-        
-        #ok, valid calculation, try to parse input file to get info
-        with open(inpfile, 'r') as fin:
-            inp = yaml.safe_load(fin)
-        #grab the first calculation
-        inp = inp['calculations'][0]
-        #mode
-        mode = inp['mode']
-        datadict['calculation_mode'].append(mode)
-        datadict['temperature'].append(inp['temperature'])
-        datadict['pressure'].append(inp['pressure'])
-        datadict['reference_phase'].append(inp['reference_phase'])
-        datadict['phase_name'].append(inp['phase_name'])
-        datadict['reference_composition'].append(inp['reference_composition'])
-        datadict['composition'].append(None)
-        datadict['ideal_entropy'].append(0)
-        datadict['calculation'].append(folder)
-    
-        #check output file
-        outfile = os.path.join(mainfolder, folder, 'report.yaml')
-        datadict['error_code'].append(None)
-        
-        #print(inpfile)
-        if not os.path.exists(outfile):
-            datadict['status'].append('False')
-            datadict['free_energy'].append(np.nan)
-            #check if error file is found
-            errfile = os.path.join(os.getcwd(), mainfolder, folder+'.sub.err')
-            datadict['error_code'][-1] = _extract_error(errfile)
-            continue;
-    
-        if mode in ['fe', 'alchemy', 'composition_scaling']:
-            datadict['status'].append('True')
-        
-        #ok, valid calculation, try to parse input file to get info
-        with open(outfile, 'r') as fin:
-            out = yaml.safe_load(fin)
-    
-        datadict['free_energy'].append(out['results']['free_energy'])
-        
-        #add normal composition
-        el_arr = np.array(out['input']['element'].split(' ')).astype(str)
-        comp_arr = np.array(out['input']['concentration'].split(' ')).astype(float)
-        composition = {x:y for x,y in zip(el_arr, comp_arr)}
-        datadict['composition'][-1] = composition
-
-        if mode == 'composition_scaling':
-            #we need to update composition
-            compdict = inp['composition_scaling']['output_chemical_composition']
-            maxatoms = np.sum([val for key, val in compdict.items()])
-            for key, val in compdict.items():
-                compdict[key] = val/maxatoms
-            datadict['composition'][-1] = compdict
-            el_arr = list(compdict.keys())
-
-            #we also need to update entropy
-            if 'entropy_contribution' in out['results'].keys():
-                datadict['ideal_entropy'][-1] = -1*out['results']['entropy_contribution']
-
-        for el in el_arr:
+        record = records[folder]
+        if record is None:
+            continue
+        for key in datadict.keys():
+            if (key == 'status') and (record[key] is None):
+                continue
+            datadict[key].append(record[key])
+        for el in record['elements']:
             if el not in unique_elements:
                 unique_elements.append(el)
 
-        #parse extra info
-        if mode in ['ts', 'tscale']:
-            datafile = os.path.join(os.getcwd(), mainfolder, folder, 'temperature_sweep.dat')
-            if os.path.exists(datafile):
-                datadict['status'].append('True')
-                t, f = np.loadtxt(datafile, unpack=True, usecols=(0,1))
-                datadict['temperature'][-1] = t
-                datadict['free_energy'][-1] = f
-            else:
-                datadict['status'].append('False')
-                errfile = os.path.join(os.getcwd(), mainfolder, folder+'.sub.err')
-                datadict['error_code'][-1] = _extract_error(errfile)
-
     if reduce_composition:
         unique_element_dict = {x: [] for x in unique_elements}
         for x in datadict['composition']:
@@ -305,6 +458,7 @@ def clean_df(df, reference_element, combine_direct_calculations=False, fit_order
                 mode_list.append(unique_mode)
             
             #replace df
+            import pandas as pd
             df = pd.DataFrame(data={'temperature':tes, 'free_energy': fes, 
                 'error':errors, reference_element:comps, 'ideal_entropy': entropies,
                 'calculation_mode': mode_list, "is_reference":is_refs})
@@ -401,6 +555,7 @@ def find_transition_temperature(folder1, folder2, fit_order=4, plot=True):
 
     #plot
     if plot:
+        import matplotlib.pyplot as plt
         c1lo = '#ef9a9a'
         c1hi = '#b71c1c'
         c2lo = '#90caf9'
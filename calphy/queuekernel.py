@@ -30,11 +30,7 @@ import yaml
 import time
 import datetime
 
-from calphy.input import read_inputfile
-from calphy.liquid import Liquid
-from calphy.solid import Solid
-from calphy.alchemy import Alchemy
-from calphy.routines import MeltingTemp, routine_fe, routine_ts, routine_only_ts, routine_pscale, routine_tscale, routine_alchemy, routine_composition_scaling
+from calphy.input import read_calculation
 
 
 def setup_calculation(calc):
@@ -54,6 +50,12 @@ def setup_calculation(calc):
     job: Phase class
         job class
     """
+    #the phase classes pull in LAMMPS, import only when needed
+    from calphy.liquid import Liquid
+    from calphy.solid import Solid
+    from calphy.alchemy import Alchemy
+    from calphy.routines import MeltingTemp
+
     #now we need to modify the routines
     if calc.mode == "melting_temperature":
         simfolder = None
@@ -82,6 +84,8 @@ def run_calculation(job):
     -------
     job : Phase class
     """
+    from calphy.routines import routine_fe, routine_ts, routine_only_ts, routine_pscale, routine_tscale, routine_alchemy, routine_composition_scaling
+
     if job.calc.mode == "fe":
         job = routine_fe(job)
     elif job.calc.mode == "ts":
@@ -121,9 +125,13 @@ def main():
     kernel = args["kernel"]
     log_to_screen = args["screen"]
 
-    calculations = read_inputfile(args["input"])
+    calc = read_calculation(args["input"], kernel)
 
-    calc = calculations[kernel]
+    #the phase classes pull in LAMMPS, import only when needed
+    from calphy.liquid import Liquid
+    from calphy.solid import Solid
+    from calphy.alchemy import Alchemy
+    from calphy.routines import MeltingTemp, routine_fe, routine_ts, routine_only_ts, routine_pscale, routine_tscale, routine_alchemy, routine_composition_scaling
     
     #format and parse the arguments
     simfolder = calc.create_folders()
@@ -25,8 +25,12 @@ import copy
 import numpy as np
 import os
 import time
+import signal
+import queue
+import traceback
+import multiprocessing as mp
 from mendeleev import element
-import yaml
+import calphy.yamlio as yamlio
 
 from calphy.input import read_inputfile
 #import calphy.queuekernel as cq
@@ -62,6 +66,10 @@ class MeltingTemp:
         self.attempts = 0
         self.calculations = []
 
+        #F(T) curves of both phases, kept between attempts
+        self.solcurve = None
+        self.lqdcurve = None
+
         self.get_trange()
         self.arg = None
         
@@ -88,7 +96,7 @@ class MeltingTemp:
         calculations = {"calculations": []}
         
         with open(self.calc.inputfile, 'r') as fin:
-            data = yaml.safe_load(fin)
+            data = yamlio.safe_load(fin)
         calc = data["calculations"][int(self.calc.kernel)]
 
         calc["mode"] = "ts"
@@ -100,7 +108,7 @@ class MeltingTemp:
         calculations["calculations"].append(calc)
 
         with open(self.calc.inputfile, 'r') as fin:
-            data = yaml.safe_load(fin)
+            data = yamlio.safe_load(fin)
         calc = data["calculations"][int(self.calc.kernel)]
         
         calc["mode"] = "ts"
@@ -113,7 +121,7 @@ class MeltingTemp:
 
         outfile = f'{self.calc.create_identifier()}.{self.attempts}.yaml'
         with open(outfile, "w") as fout:
-            yaml.safe_dump(calculations, fout)
+            yamlio.safe_dump(calculations, fout)
 
         #now read in again, which would allow for checking and so on
         #one could do this smartly, and simply create from here.
@@ -155,6 +163,13 @@ class MeltingTemp:
 
         self.prepare_calcs()
 
+        concurrent = self.calc.melting_temperature.concurrent
+        if concurrent:
+            #split the cores between the two phases
+            cores = self.calc.queue.cores
+            self.calculations[0].queue.cores = max(1, cores//2)
+            self.calculations[1].queue.cores = max(1, cores - cores//2)
+
         self.soljob = Solid(calculation=self.calculations[0], 
             simfolder=self.calculations[0].create_folders())
         self.lqdjob = Liquid(calculation=self.calculations[1], 
@@ -163,6 +178,10 @@ class MeltingTemp:
         self.logger.info("Free energy of %s and %s phases will be calculated"%(self.soljob.calc.lattice, self.lqdjob.calc.lattice))
         self.logger.info("Temperature range of %f-%f"%(self.tmin, self.tmax))
         self.logger.info("STATE: Temperature range of %f-%f K"%(self.tmin, self.tmax))
+
+        if concurrent:
+            return self.run_jobs_concurrently()
+
         self.logger.info('Starting solid fe calculation')
         
         try:
@@ -172,14 +191,13 @@ class MeltingTemp:
             return 2
         
         self.logger.info('Starting solid reversible scaling run')
-        for i in range(self.soljob.calc.n_iterations):
-            try:
-                self.soljob.reversible_scaling(iteration=(i+1))
-            except MeltedError:
-                self.logger.info('Solid system melted during reversible scaling run')
-                return 2
+        try:
+            run_iterations(self.soljob, "reversible_scaling", "TS integration")
+        except MeltedError:
+            self.logger.info('Solid system melted during reversible scaling run')
+            return 2
             
-            self.solres = self.soljob.integrate_reversible_scaling(scale_energy=True,
+        self.solres = self.soljob.integrate_reversible_scaling(scale_energy=True,
                                            return_values=True)
         
         self.logger.info('Starting liquid fe calculation')
@@ -190,15 +208,80 @@ class MeltingTemp:
             return 3
 
         self.logger.info('Starting liquid reversible scaling calculation')
-        for i in range(self.lqdjob.calc.n_iterations):
-            try:
-                self.lqdjob.reversible_scaling(iteration=(i+1))
-            except SolidifiedError:
-                self.logger.info('Liquid froze during reversible scaling calculation')
-                return 3
+        try:
+            run_iterations(self.lqdjob, "reversible_scaling", "TS integration")
+        except SolidifiedError:
+            self.logger.info('Liquid froze during reversible scaling calculation')
+            return 3
 
         self.lqdres = self.lqdjob.integrate_reversible_scaling(scale_energy=True,
                                            return_values=True)
+
+    def run_jobs_concurrently(self):
+        """
+        Run the solid and liquid calculations at the same time
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        returncode: int
+            None if both phases finished, 2 if the solid melted and
+            3 if the liquid solidified
+
+        Notes
+        -----
+        Each phase runs in its own process. As soon as one phase melts or
+        solidifies, the other process is stopped, since the temperature
+        range has to be changed anyway.
+        """
+        self.logger.info('Starting solid and liquid calculations concurrently')
+        ctx = mp.get_context()
+        results = ctx.Queue()
+        jobs = {"solid": self.soljob, "liquid": self.lqdjob}
+        processes = {}
+        for key, job in jobs.items():
+            processes[key] = ctx.Process(target=_run_melting_leg, args=(key, job, results))
+            processes[key].start()
+
+        returncode = None
+        finished = {}
+        try:
+            while len(finished) < len(jobs):
+                try:
+                    key, status, res, state = results.get(timeout=5)
+                except queue.Empty:
+                    #a process which died without reporting will never report
+                    for key, process in processes.items():
+                        if (key not in finished) and (not process.is_alive()):
+                            raise RuntimeError('%s calculation exited with code %s'%(key, process.exitcode))
+                    continue
+
+                if status == "melted":
+                    self.logger.info('Solid phase melted')
+                    returncode = 2
+                    break
+                elif status == "solidified":
+                    self.logger.info('Liquid froze')
+                    returncode = 3
+                    break
+                elif status == "error":
+                    raise RuntimeError('%s calculation failed:\n%s'%(key, res))
+                finished[key] = (res, state)
+                self.logger.info('%s calculation finished'%key)
+        finally:
+            for process in processes.values():
+                _stop_process(process)
+
+        if returncode is not None:
+            return returncode
+
+        self.solres = finished["solid"][0]
+        self.soljob.set_state(finished["solid"][1])
+        self.lqdres = finished["liquid"][0]
+        self.lqdjob.set_state(finished["liquid"][1])
     
     def start_calculation(self):
         """
@@ -215,6 +298,9 @@ class MeltingTemp:
 
         for i in range(100):
             returncode = self.run_jobs()
+            if returncode is None:
+                self.solcurve = _sort_curve(self.solres)
+                self.lqdcurve = _sort_curve(self.lqdres)
         
             if returncode == 3:
                 self.tmin = self.tmin + self.dtemp
@@ -234,6 +320,86 @@ class MeltingTemp:
                 raise ValueError('Maximum number of tries reached')
 
 
+    def extend_calculation(self):
+        """
+        Extend the free energy curves of both phases to the temperature range
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        extended : bool
+            False if a phase melted or solidified during the extension
+
+        Notes
+        -----
+        The reference free energies and F(T) curves of the earlier attempts
+        are kept. Only the part of [tmin, tmax] which is not covered yet is
+        swept, starting from the end of the known curve, so that each attempt
+        costs one reversible scaling run per phase.
+        """
+        self.logger.info('Extending calculation to temperature range of %f-%f'%(self.tmin, self.tmax))
+        self.logger.info("STATE: Temperature range of %f-%f K"%(self.tmin, self.tmax))
+        try:
+            self.solcurve = self.extend_curve(self.soljob, self.solcurve)
+            self.lqdcurve = self.extend_curve(self.lqdjob, self.lqdcurve)
+        except MeltedError:
+            self.logger.info('Solid phase melted during extension')
+            return False
+        except SolidifiedError:
+            self.logger.info('Liquid froze during extension')
+            return False
+
+        #both curves on the same temperature grid
+        tmin = max(self.solcurve[0][0], self.lqdcurve[0][0])
+        tmax = min(self.solcurve[0][-1], self.lqdcurve[0][-1])
+        npoints = max(len(self.solcurve[0]), len(self.lqdcurve[0]))
+        temp = np.linspace(tmin, tmax, npoints)
+        self.solres = [temp, *[np.interp(temp, self.solcurve[0], x) for x in self.solcurve[1:]]]
+        self.lqdres = [temp, *[np.interp(temp, self.lqdcurve[0], x) for x in self.lqdcurve[1:]]]
+        return True
+
+    def extend_curve(self, job, curve):
+        """
+        Sweep the temperatures in [tmin, tmax] missing from a F(T) curve
+
+        Parameters
+        ----------
+        job : Phase object
+
+        curve : list of ndarrays
+            temperature, free energy and error, sorted by temperature
+
+        Returns
+        -------
+        curve : list of ndarrays
+            extended curve
+        """
+        for index, tstop in ((-1, self.tmax), (0, self.tmin)):
+            tstart = curve[0][index]
+            if (index == -1 and tstop <= tstart) or (index == 0 and tstop >= tstart):
+                continue
+            job.logger.info('Extending reversible scaling from %f to %f'%(tstart, tstop))
+            job.calc._temperature_stop = tstop
+            job.sweep_start = tstart
+            #the sweeps of the earlier attempt are replaced
+            job.stages = [stage for stage in job.stages if not stage.startswith("reversible_scaling")]
+            try:
+                run_iterations(job, "reversible_scaling", "TS integration")
+                res = job.integrate_reversible_scaling(scale_energy=True,
+                    return_values=True, fe_start=curve[1][index])
+            finally:
+                job.sweep_start = None
+            temp, fe, ferr = _sort_curve(res)
+            ferr = np.sqrt(ferr**2 + curve[2][index]**2)
+            if index == -1:
+                curve = [np.concatenate((x, y[1:])) for x, y in zip(curve, (temp, fe, ferr))]
+            else:
+                curve = [np.concatenate((y[:-1], x)) for x, y in zip(curve, (temp, fe, ferr))]
+        return curve
+
     def extrapolate_tm(self, arg):
         """
         Extrapolate Tm
@@ -297,9 +463,10 @@ class MeltingTemp:
                 if self.tmin < 0:
                     self.tmin = 0
                 self.tmax = tpred + self.dtemp
-                self.logger.info('Restarting calculation with predicted melting temperature +/- %f'%self.dtemp)
-                #self.logger.info('STATE: Restarting calculation with predicted melting temperature +/- %f'%self.dtemp)
-                self.start_calculation()
+                if not self.extend_calculation():
+                    self.logger.info('Restarting calculation with predicted melting temperature +/- %f'%self.dtemp)
+                    #self.logger.info('STATE: Restarting calculation with predicted melting temperature +/- %f'%self.dtemp)
+                    self.start_calculation()
                 
             else:
                 self.calc_tm = self.solres[0][arg]
@@ -326,21 +493,304 @@ class MeltingTemp:
             self.logger.info('Experimental melting temperature = %.2f K '%(self.calc._melting_temperature))
         self.logger.info('STATE: Tm = %.2f K +/- %.2f K'%(tm, tmerr))
 
-def routine_fe(job):
+def _sort_curve(res):
     """
-    Perform an FE calculation routine
+    Sort the temperature, free energy and error of a F(T) curve by temperature
+    """
+    res = [np.asarray(x, dtype=float) for x in res]
+    order = np.argsort(res[0])
+    return [x[order] for x in res]
+
+def _run_melting_leg(key, job, results):
+    """
+    Run the free energy and reversible scaling calculations for one phase
+    of `MeltingTemp.run_jobs_concurrently`.
+
+    The outcome is put in `results` as a tuple of the phase, a status, the
+    reversible scaling results and the state of the job.
+    """
+    #own process group, so that the MPI processes can be stopped together
+    if hasattr(os, "setsid"):
+        os.setsid()
+    #iterations run in parallel have their own process groups, unwind
+    #on SIGTERM so that `run_iterations` stops them as well
+    signal.signal(signal.SIGTERM, _exit_on_sigterm)
+    #both phases share a logger name, point it to the right folder
+    job.logger = ph.prepare_log(os.path.join(job.simfolder, "calphy.log"),
+        screen=job.log_to_screen)
+    try:
+        job = routine_fe(job)
+        job.logger.info('Starting %s reversible scaling run'%key)
+        run_iterations(job, "reversible_scaling", "TS integration")
+        res = job.integrate_reversible_scaling(scale_energy=True,
+                                           return_values=True)
+    except MeltedError:
+        job.logger.info('Solid phase melted')
+        results.put((key, "melted", None, None))
+        return
+    except SolidifiedError:
+        job.logger.info('Liquid froze')
+        results.put((key, "solidified", None, None))
+        return
+    except Exception:
+        results.put((key, "error", traceback.format_exc(), None))
+        return
+    results.put((key, "done", res, job.get_state()))
+
+
+def _exit_on_sigterm(signum, frame):
+    """
+    Signal handler which exits through the normal exception handling
+    """
+    raise SystemExit(128 + signum)
+
+
+def _stop_process(process):
     """
+    Stop a process started by `MeltingTemp.run_jobs_concurrently`,
+    along with the MPI processes it spawned
+    """
+    if process.is_alive():
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+        except (AttributeError, OSError):
+            process.terminate()
+    process.join()
+
+
+def _run_iteration(job, method, iteration, cores, results):
+    """
+    Run a single iteration for `run_iterations` in a separate process.
+
+    None, or the exception raised, is put in `results` along with
+    the iteration.
+    """
+    #own process group, so that the MPI processes can be stopped together
+    if hasattr(os, "setsid"):
+        os.setsid()
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    #forked processes share the random state used for the velocity seeds
+    np.random.seed()
+    job.cores = cores
+    try:
+        getattr(job, method)(iteration=iteration)
+    except CustomError as e:
+        results.put((iteration, e))
+        return
+    except Exception:
+        results.put((iteration, RuntimeError(traceback.format_exc())))
+        return
+    results.put((iteration, None))
+
+
+def run_averaging(job):
+    """
+    Run the averaging stage of a job
+
+    Parameters
+    ----------
+    job: Phase class
+        job for which the averaging is run
+
+    Returns
+    -------
+    None
+
+    Notes
+    -----
+    The stage is skipped if it was completed before a restart, in which
+    case the averaged state has been read in by the job.
+    """
+    if job.is_stage_complete("averaging"):
+        job.logger.info("Averaging routine was completed before, skipping")
+        return
     ts = time.time()
     job.run_averaging()
     te = (time.time() - ts)
     job.logger.info("Averaging routine finished in %f s"%te)
+    job.complete_stage("averaging")
 
-    #now run integration loops
-    for i in range(job.calc.n_iterations):
+
+def run_iterations(job, method, label):
+    """
+    Run all switching iterations of a job
+
+    Parameters
+    ----------
+    job: Phase class
+        job for which the iterations are run
+
+    method: string
+        name of the method of `job` which runs one iteration,
+        for example `run_integration` or `reversible_scaling`
+
+    label: string
+        name of the iterations used in the log
+
+    Returns
+    -------
+    None
+
+    Notes
+    -----
+    If `n_parallel_iterations` is larger than one, that many iterations
+    are run at the same time in separate processes, and `queue.cores` is
+    split among them. The iterations only share the equilibrated structure
+    and write their data to the simulation folder, from where it is read
+    for the integration.
+    """
+    #cycles completed before a restart are skipped
+    iterations = []
+    for iteration in job.get_iterations():
+        if job.is_stage_complete("%s_%d"%(method, iteration)):
+            job.logger.info("%s cycle %d was completed before, skipping"%(label, iteration))
+        else:
+            iterations.append(iteration)
+    if len(iterations) == 0:
+        return
+
+    n_parallel = min(job.calc.n_parallel_iterations, len(iterations))
+    if (n_parallel == 1) or job.calc.script_mode:
+        for iteration in iterations:
+            ts = time.time()
+            getattr(job, method)(iteration=iteration)
+            te = (time.time() - ts)
+            job.logger.info("%s cycle %d finished in %f s"%(label, iteration, te))
+            job.complete_stage("%s_%d"%(method, iteration))
+        return
+
+    cores = max(1, job.cores//n_parallel)
+    job.logger.info("Running %d %s cycles at a time on %d cores each"%(n_parallel, label, cores))
+    ctx = mp.get_context()
+
+    for start in range(0, len(iterations), n_parallel):
         ts = time.time()
-        job.run_integration(iteration=(i+1))
-        te = (time.time() - ts)
-        job.logger.info("Integration cycle %d finished in %f s"%(i+1, te))
+        results = ctx.Queue()
+        processes = {}
+        for iteration in iterations[start:start+n_parallel]:
+            processes[iteration] = ctx.Process(target=_run_iteration, 
+                args=(job, method, iteration, cores, results))
+            processes[iteration].start()
+
+        finished = []
+        try:
+            while len(finished) < len(processes):
+                try:
+                    iteration, error = results.get(timeout=5)
+                except queue.Empty:
+                    #a process which died without reporting will never report
+                    for iteration, process in processes.items():
+                        if (iteration not in finished) and (not process.is_alive()):
+                            raise RuntimeError("%s cycle %d exited with code %s"%(label, iteration, process.exitcode))
+                    continue
+                if error is not None:
+                    raise error
+                finished.append(iteration)
+                te = (time.time() - ts)
+                job.logger.info("%s cycle %d finished in %f s"%(label, iteration, te))
+                job.complete_stage("%s_%d"%(method, iteration))
+        finally:
+            for process in processes.values():
+                _stop_process(process)
+
+    #the iterations only wrote their data to disk, drop the arrays kept in
+    #memory from earlier runs in this process so that the new files are read
+    job.data.clear()
+
+
+def run_integration_cycles(job, label):
+    """
+    Run the free energy integration cycles of a job
+
+    Parameters
+    ----------
+    job: Phase class
+        job for which the cycles are run
+
+    label: string
+        name of the cycles used in the log
+
+    Returns
+    -------
+    None
+
+    Notes
+    -----
+    If `adaptive_switching` is active, the first cycle is used to find the
+    switching length. It is run with `initial_steps` switching steps, and
+    repeated with a longer switch until the dissipated energy is below
+    `target_dissipation`. Since the dissipation is inversely proportional to
+    the switching length, the required length is estimated from the measured
+    dissipation in each round. The remaining cycles use the shortest length
+    expected to meet the target, which can also be shorter than the first one.
+    """
+    options = job.calc.adaptive_switching
+    if options.active and (not job.calc.script_mode) and (not job.is_stage_complete("run_integration_1")):
+        target = options.target_dissipation
+        steps = int(np.clip(options.initial_steps, options.min_steps, options.max_steps))
+        for count in range(options.max_rounds):
+            job.calc._n_switching_steps = steps
+            ts = time.time()
+            job.run_integration(iteration=1)
+            te = (time.time() - ts)
+            w, q = job.get_dissipation(1)
+            job.logger.info("%s cycle 1 with %d switching steps finished in %f s, work %f eV/atom, dissipation %f eV/atom"%(label,
+                steps, te, w, q))
+
+            #length needed for the target, with a safety margin of 25 percent
+            needed = int(np.ceil(1.25*steps*np.abs(q)/target))
+            needed = int(np.clip(needed, options.min_steps, options.max_steps))
+            if np.abs(q) <= target:
+                steps = min(needed, steps)
+                break
+            if steps >= options.max_steps:
+                job.logger.warning("Dissipation is above the target, but the maximum switching length is reached")
+                break
+            steps = max(needed, steps+1)
+        else:
+            job.logger.warning("Dissipation target not reached within %d rounds, rerun with a higher max_rounds"%options.max_rounds)
+        
+        job.calc._n_switching_steps = steps
+        job.logger.info("Remaining %s cycles use %d switching steps"%(label, steps))
+        job.complete_stage("run_integration_1")
+
+    target = job.calc.target_error
+    if (target is None) or job.calc.script_mode:
+        run_iterations(job, "run_integration", label)
+        return
+
+    #n_iterations is the maximum, add cycles until the error is small enough
+    n_max = job.calc.n_iterations
+    n_parallel = job.calc.n_parallel_iterations
+    if job.n_cycles_run is None:
+        n = min(max(2, n_parallel), n_max)
+    else:
+        #continue from the cycles run before a restart
+        n = min(job.n_cycles_run, n_max)
+    while True:
+        job.n_cycles_run = n
+        run_iterations(job, "run_integration", label)
+        if n > 1:
+            w, err = job.get_error(list(range(1, n+1)))
+            job.logger.info("After %d %s cycles, work is %f eV/atom with standard error %f eV/atom"%(n, label, w, err))
+            if err <= target:
+                job.logger.info("Target error of %f eV/atom reached"%target)
+                break
+        if n == n_max:
+            job.logger.warning("Target error of %f eV/atom not reached within %d cycles"%(target, n_max))
+            break
+        n = min(n + n_parallel, n_max)
+
+
+def routine_fe(job):
+    """
+    Perform an FE calculation routine
+    """
+    run_averaging(job)
+
+    #now run integration loops
+    run_integration_cycles(job, "Integration")
+    job.close_session()
 
     job.thermodynamic_integration()
     job.submit_report()
@@ -354,11 +804,7 @@ def routine_ts(job):
     routine_fe(job)
 
     #now do rev scale steps
-    for i in range(job.calc.n_iterations):
-        ts = time.time()
-        job.reversible_scaling(iteration=(i+1))
-        te = (time.time() - ts)
-        job.logger.info("TS integration cycle %d finished in %f s"%(i+1, te))
+    run_iterations(job, "reversible_scaling", "TS integration")
     
     job.integrate_reversible_scaling(scale_energy=True)
     job.clean_up()
@@ -369,16 +815,9 @@ def routine_only_ts(job):
     """
     Perform sweep without free energy calculation
     """
-    ts = time.time()
-    job.run_averaging()
-    te = (time.time() - ts)
-    job.logger.info("Averaging routine finished in %f s"%te)
+    run_averaging(job)
 
-    for i in range(job.calc.n_iterations):
-        ts = time.time()
-        job.reversible_scaling(iteration=(i+1))
-        te = (time.time() - ts)
-        job.logger.info("TS integration cycle %d finished in %f s"%(i+1, te))
+    run_iterations(job, "reversible_scaling", "TS integration")
     return job
 
 def routine_tscale(job):
@@ -388,11 +827,7 @@ def routine_tscale(job):
     routine_fe(job)
 
     #now do rev scale steps
-    for i in range(job.calc.n_iterations):
-        ts = time.time()
-        job.temperature_scaling(iteration=(i+1))
-        te = (time.time() - ts)
-        job.logger.info("Temperature scaling cycle %d finished in %f s"%(i+1, te))
+    run_iterations(job, "temperature_scaling", "Temperature scaling")
     
     job.integrate_reversible_scaling(scale_energy=False)
     job.clean_up()
@@ -405,11 +840,7 @@ def routine_pscale(job):
     routine_fe(job)
 
     #now do rev scale steps
-    for i in range(job.calc.n_iterations):
-        ts = time.time()
-        job.pressure_scaling(iteration=(i+1))
-        te = (time.time() - ts)
-        job.logger.info("Pressure scaling cycle %d finished in %f s"%(i+1, te))
+    run_iterations(job, "pressure_scaling", "Pressure scaling")
     
     job.integrate_pressure_scaling()
     job.clean_up()
@@ -419,17 +850,10 @@ def routine_alchemy(job):
     """
     Perform an FE calculation routine
     """
-    ts = time.time()
-    job.run_averaging()
-    te = (time.time() - ts)
-    job.logger.info("Averaging routine finished in %f s"%te)
+    run_averaging(job)
 
     #now run integration loops
-    for i in range(job.calc.n_iterations):
-        ts = time.time()
-        job.run_integration(iteration=(i+1))
-        te = (time.time() - ts)
-        job.logger.info("Alchemy integration cycle %d finished in %f s"%(i+1, te))
+    run_integration_cycles(job, "Alchemy integration")
 
     job.thermodynamic_integration()
     job.submit_report()
@@ -504,17 +928,10 @@ def routine_composition_scaling(job):
     #job.calc._totalelements = comp.maxtype
 
     #now start cycle
-    ts = time.time()
-    job.run_averaging()
-    te = (time.time() - ts)
-    job.logger.info("Averaging routine finished in %f s"%te)
+    run_averaging(job)
 
     #now run integration loops
-    for i in range(job.calc.n_iterations):
-        ts = time.time()
-        job.run_integration(iteration=(i+1))
-        te = (time.time() - ts)
-        job.logger.info("Alchemy integration cycle %d finished in %f s"%(i+1, te))
+    run_integration_cycles(job, "Alchemy integration")
 
     flambda_arr, w_arr, q_arr, qerr_arr = job.thermodynamic_integration()
 
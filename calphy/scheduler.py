@@ -24,6 +24,51 @@ sarath.menon@ruhr-uni-bochum.de/yury.lysogorskiy@icams.rub.de
 import subprocess as sub
 import os
 import stat
+import time
+import warnings
+
+
+def _write_array_loop(fout, command, indices, logfiles, pack, taskvar, offset):
+    """
+    Write the loop which maps an array task to the calculations it runs
+
+    Parameters
+    ----------
+    fout : file object
+        open submission script
+
+    command : string
+        command to be run for each calculation. `${index}` is replaced by the
+        shell with the index of the calculation
+
+    indices : list of ints
+        indices of the calculations
+
+    logfiles : list of strings
+        stdout and stderr of each calculation is written to `logfile.out` and `logfile.err`
+
+    pack : int
+        number of calculations run one after the other by each array task
+
+    taskvar : string
+        environment variable which holds the array task index
+
+    offset : int
+        value of `taskvar` for the first task
+
+    Returns
+    -------
+    None
+    """
+    fout.write("indices=(%s)\n" % " ".join([str(x) for x in indices]))
+    fout.write("logfiles=(%s)\n" % " ".join(logfiles))
+    fout.write("start=$(( (%s - %d) * %d ))\n" % (taskvar, offset, pack))
+    fout.write(
+        "for (( i=start; i<start+%d && i<%d; i++ )); do\n" % (pack, len(indices))
+    )
+    fout.write("    index=${indices[$i]}\n")
+    fout.write("    %s > ${logfiles[$i]}.out 2> ${logfiles[$i]}.err\n" % command)
+    fout.write("done\n")
 
 
 class Local:
@@ -78,6 +123,144 @@ class Local:
         return proc
 
 
+class LocalPool:
+    """
+    Bounded executor for local submission scripts
+
+    Parameters
+    ----------
+    max_cores : int, optional
+        total number of cores available on the machine. If None or 0,
+        the number of cores reported by the OS is used.
+
+    poll_interval : float, optional
+        time in seconds between checks for finished calculations. Default 1.0
+
+    Notes
+    -----
+    Each script added to the pool is started only when the cores it requests,
+    `queueoptions["cores"]`, are free. Scripts are packed largest first, and
+    smaller ones are used to fill up the remaining cores. A script requesting
+    more cores than available is run alone on the machine.
+    """
+
+    def __init__(self, max_cores=None, poll_interval=1.0):
+        if (max_cores is None) or (max_cores < 1):
+            max_cores = os.cpu_count()
+        self.max_cores = max_cores
+        self.poll_interval = poll_interval
+        self.jobs = []
+        self.results = []
+        self.peak_cores = 0
+
+    def add(self, scheduler):
+        """
+        Add a Local scheduler, for which the script is already written
+        """
+        self.jobs.append(scheduler)
+
+    def _start(self, job):
+        st = os.stat(job.script)
+        os.chmod(job.script, st.st_mode | stat.S_IEXEC)
+        proc = sub.Popen(
+            [job.script],
+            stdin=sub.DEVNULL,
+            stdout=sub.DEVNULL,
+            stderr=sub.DEVNULL,
+        )
+        return proc
+
+    def run(self):
+        """
+        Run all scripts in the pool and wait for them to finish
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        results : list of dicts
+            one dict per script with keys `script`, `cores`, `returncode` and `time`
+        """
+        pending = sorted(self.jobs, key=lambda x: x.queueoptions["cores"], reverse=True)
+        running = []
+        self.results = []
+        self.peak_cores = 0
+        free = self.max_cores
+        tstart = time.time()
+
+        try:
+            while (len(pending) > 0) or (len(running) > 0):
+                # fill up the free cores
+                waiting = []
+                for job in pending:
+                    cores = job.queueoptions["cores"]
+                    if cores > self.max_cores:
+                        if len(running) > 0:
+                            waiting.append(job)
+                            continue
+                        warnings.warn(
+                            "%s requests %d cores, but only %d are available"
+                            % (job.script, cores, self.max_cores)
+                        )
+                        cores = self.max_cores
+                    if cores > free:
+                        waiting.append(job)
+                        continue
+                    proc = self._start(job)
+                    running.append((job, proc, cores, time.time()))
+                    free -= cores
+                pending = waiting
+                self.peak_cores = max(self.peak_cores, self.max_cores - free)
+
+                # collect finished ones
+                finished = [item for item in running if item[1].poll() is not None]
+                running = [item for item in running if item not in finished]
+                for job, proc, cores, ts in finished:
+                    free += cores
+                    result = {
+                        "script": job.script,
+                        "cores": cores,
+                        "returncode": proc.returncode,
+                        "time": time.time() - ts,
+                    }
+                    self.results.append(result)
+                    if proc.returncode == 0:
+                        print("finished %s in %f s" % (job.script, result["time"]))
+                    else:
+                        print(
+                            "failed %s with exit code %d, see %s.err"
+                            % (job.script, proc.returncode, job.script)
+                        )
+                if len(finished) == 0:
+                    time.sleep(self.poll_interval)
+
+        except KeyboardInterrupt:
+            for job, proc, cores, ts in running:
+                proc.terminate()
+            raise
+
+        te = time.time() - tstart
+        nfailed = len([x for x in self.results if x["returncode"] != 0])
+        used = sum([x["cores"] * x["time"] for x in self.results])
+        if te > 0:
+            throughput = 3600 * len(self.results) / te
+            utilisation = used / (self.max_cores * te)
+        else:
+            throughput = 0
+            utilisation = 0
+        print(
+            "%d calculations finished in %f s, %d failed"
+            % (len(self.results), te, nfailed)
+        )
+        print(
+            "throughput %f calculations/hour, core utilisation %.1f %% of %d cores"
+            % (throughput, 100 * utilisation, self.max_cores)
+        )
+        return self.results
+
+
 class SLURM:
     """
     Slurm class for writing submission script
@@ -96,6 +279,7 @@ class SLURM:
             "cores": cores,
             "hint": "nomultithread",
             "directory": directory,
+            "array": None,
             "options": [],
             "commands": [
                 "uss=$(whoami)",
@@ -110,6 +294,30 @@ class SLURM:
                         self.queueoptions[key] = val
         self.maincommand = ""
 
+    def _write_header(self, fout):
+        fout.write(self.queueoptions["header"])
+        fout.write("\n")
+
+        # write the main header options
+        fout.write("#SBATCH --job-name=%s\n" % self.queueoptions["jobname"])
+        fout.write("#SBATCH --time=%s\n" % self.queueoptions["walltime"])
+        if self.queueoptions["queuename"] is not None:
+            fout.write("#SBATCH --partition=%s\n" % self.queueoptions["queuename"])
+        fout.write("#SBATCH --ntasks=%s\n" % str(self.queueoptions["cores"]))
+        fout.write("#SBATCH --mem-per-cpu=%s\n" % self.queueoptions["memory"])
+        fout.write("#SBATCH --hint=%s\n" % self.queueoptions["hint"])
+        fout.write("#SBATCH --chdir=%s\n" % self.queueoptions["directory"])
+        if self.queueoptions["array"] is not None:
+            fout.write("#SBATCH --array=%s\n" % self.queueoptions["array"])
+
+        # now write extra options
+        for option in self.queueoptions["options"]:
+            fout.write("#SBATCH %s\n" % option)
+
+        # now finally commands
+        for command in self.queueoptions["commands"]:
+            fout.write("%s\n" % command)
+
     def write_script(self, outfile):
         """
         Write the script file
@@ -118,28 +326,44 @@ class SLURM:
         joberr = ".".join([outfile, "err"])
 
         with open(outfile, "w") as fout:
-            fout.write(self.queueoptions["header"])
-            fout.write("\n")
+            self._write_header(fout)
+            fout.write("%s > %s 2> %s\n" % (self.maincommand, jobout, joberr))
 
-            # write the main header options
-            fout.write("#SBATCH --job-name=%s\n" % self.queueoptions["jobname"])
-            fout.write("#SBATCH --time=%s\n" % self.queueoptions["walltime"])
-            if self.queueoptions["queuename"] is not None:
-                fout.write("#SBATCH --partition=%s\n" % self.queueoptions["queuename"])
-            fout.write("#SBATCH --ntasks=%s\n" % str(self.queueoptions["cores"]))
-            fout.write("#SBATCH --mem-per-cpu=%s\n" % self.queueoptions["memory"])
-            fout.write("#SBATCH --hint=%s\n" % self.queueoptions["hint"])
-            fout.write("#SBATCH --chdir=%s\n" % self.queueoptions["directory"])
+        self.script = outfile
 
-            # now write extra options
-            for option in self.queueoptions["options"]:
-                fout.write("#SBATCH %s\n" % option)
+    def write_array_script(self, outfile, command, indices, logfiles, pack=1):
+        """
+        Write a job array script, each array task runs `pack` calculations
 
-            # now finally commands
-            for command in self.queueoptions["commands"]:
-                fout.write("%s\n" % command)
-            fout.write("%s > %s 2> %s\n" % (self.maincommand, jobout, joberr))
+        Parameters
+        ----------
+        outfile : string
+            name of the script file
+
+        command : string
+            command to be run for each calculation, `${index}` is replaced with
+            the index of the calculation
+
+        indices : list of ints
+            indices of the calculations
 
+        logfiles : list of strings
+            stdout and stderr of each calculation is written to `logfile.out` and `logfile.err`
+
+        pack : int, optional
+            number of calculations per array task. Default 1
+
+        Returns
+        -------
+        None
+        """
+        ntasks = (len(indices) + pack - 1) // pack
+        self.queueoptions["array"] = "0-%d" % (ntasks - 1)
+        with open(outfile, "w") as fout:
+            self._write_header(fout)
+            _write_array_loop(
+                fout, command, indices, logfiles, pack, "SLURM_ARRAY_TASK_ID", 0
+            )
         self.script = outfile
 
     def submit(self):
@@ -178,6 +402,7 @@ class SGE:
             "cores": cores,
             "hint": None,
             "directory": directory,
+            "array": None,
             "header": "#!/bin/bash",
         }
         for key, val in options.items():
@@ -186,6 +411,31 @@ class SGE:
                     self.queueoptions[key] = val
         self.maincommand = ""
 
+    def _write_header(self, fout):
+        fout.write(self.queueoptions["header"])
+        fout.write("\n")
+
+        # write the main header options
+        fout.write("#$ -N %s\n" % self.queueoptions["jobname"])
+        fout.write("#$ -l h_rt=%s\n" % self.queueoptions["walltime"])
+        fout.write("#$ -l qname=%s\n" % self.queueoptions["queuename"])
+        fout.write(
+            "#$ -pe %s %s\n"
+            % (self.queueoptions["system"], str(self.queueoptions["cores"]))
+        )
+        fout.write("#$ -l h_vmem=%s\n" % self.queueoptions["memory"])
+        fout.write("#$ -cwd %s\n" % self.queueoptions["directory"])
+        if self.queueoptions["array"] is not None:
+            fout.write("#$ -t %s\n" % self.queueoptions["array"])
+
+        # now write extra options
+        for option in self.queueoptions["options"]:
+            fout.write("#$ %s\n" % option)
+
+        # now finally commands
+        for command in self.queueoptions["commands"]:
+            fout.write("%s\n" % command)
+
     def write_script(self, outfile):
         """
         Write the script file
@@ -194,30 +444,45 @@ class SGE:
         joberr = ".".join([outfile, "err"])
 
         with open(outfile, "w") as fout:
-            fout.write(self.queueoptions["header"])
-            fout.write("\n")
+            self._write_header(fout)
+            fout.write("%s > %s 2> %s\n" % (self.maincommand, jobout, joberr))
 
-            # write the main header options
-            fout.write("#$ -N %s\n" % self.queueoptions["jobname"])
-            fout.write("#$ -l h_rt=%s\n" % self.queueoptions["walltime"])
-            fout.write("#$ -l qname=%s\n" % self.queueoptions["queuename"])
-            fout.write(
-                "#$ -pe %s %s\n"
-                % (self.queueoptions["system"], str(self.queueoptions["cores"]))
-            )
-            fout.write("#$ -l h_vmem=%s\n" % self.queueoptions["memory"])
-            fout.write("#$ -cwd %s\n" % self.queueoptions["directory"])
+        self.script = outfile
 
-            # now write extra options
-            for option in self.queueoptions["options"]:
-                fout.write("#$ %s\n" % option)
+    def write_array_script(self, outfile, command, indices, logfiles, pack=1):
+        """
+        Write a job array script, each array task runs `pack` calculations
 
-            # now finally commands
-            for command in self.queueoptions["commands"]:
-                fout.write("%s\n" % command)
+        Parameters
+        ----------
+        outfile : string
+            name of the script file
 
-            fout.write("%s > %s 2> %s\n" % (self.maincommand, jobout, joberr))
+        command : string
+            command to be run for each calculation, `${index}` is replaced with
+            the index of the calculation
+
+        indices : list of ints
+            indices of the calculations
+
+        logfiles : list of strings
+            stdout and stderr of each calculation is written to `logfile.out` and `logfile.err`
+
+        pack : int, optional
+            number of calculations per array task. Default 1
 
+        Returns
+        -------
+        None
+        """
+        # SGE task ids start from 1
+        ntasks = (len(indices) + pack - 1) // pack
+        self.queueoptions["array"] = "1-%d" % ntasks
+        with open(outfile, "w") as fout:
+            self._write_header(fout)
+            _write_array_loop(
+                fout, command, indices, logfiles, pack, "SGE_TASK_ID", 1
+            )
         self.script = outfile
 
     def submit(self):
@@ -48,6 +48,9 @@ class Solid(cph.Phase):
         base folder for running calculations
 
     """
+    # switching data holds one spring energy per species
+    _spring_reference = True
+
     def __init__(self, calculation=None, simfolder=None, log_to_screen=False):
 
         #call base class
@@ -70,17 +73,21 @@ class Solid(cph.Phase):
         lmp = ph.compute_msd(lmp, self.calc)
         
         if ph.check_if_any_is_none(self.calc.spring_constants):
-            #similar averaging routine
-            laststd = 0.00
+            #only the rows added in each cycle are read, and averaged on their own
+            #so that the initial rise of the msd does not bias later cycles
+            reader = ph.DataFileTail(os.path.join(self.simfolder, "msd.dat"),
+                usecols=[i+1 for i in range(self.calc.n_elements)])
             for i in range(self.calc.md.n_cycles):
                 lmp.command("run              %d"%int(self.calc.md.n_small_steps))
-                k_mean, k_std = self.analyse_spring_constants()
-                self.logger.info("At count %d mean k is %f std is %f"%(i+1, k_mean[0], k_std[0]))
-                if (np.abs(laststd - k_std[0]) < self.calc.tolerance.spring_constant):
+                msd = [ph.RunningAverage() for x in range(self.calc.n_elements)]
+                for average, values in zip(msd, reader.read()):
+                    average.add(values)
+                k_mean, k_err = self.estimate_spring_constants(msd)
+                self.logger.info("At count %d mean k is %f error is %f"%(i+1, k_mean[0], k_err[0]))
+                if (np.max(k_err) < self.calc.tolerance.spring_constant):
                     #now reevaluate spring constants
                     self.assign_spring_constants(k_mean)                    
                     break
-                laststd = k_std[0]
 
         else:
             if not (len(self.calc.spring_constants) == self.calc.n_elements):
@@ -119,6 +126,35 @@ class Solid(cph.Phase):
         return k_mean, k_std
         
 
+    def estimate_spring_constants(self, msd):
+        """
+        Estimate spring constants from running averages of the mean squared displacement
+
+        Parameters
+        ----------
+        msd : list of RunningAverage
+            mean squared displacement of each species
+
+        Returns
+        -------
+        k_mean : list of floats
+            spring constants
+
+        k_err : list of floats
+            statistical errors of the spring constants
+        """
+        k_mean = []
+        k_err = []
+        for average in msd:
+            mean_quant = average.mean
+            if not (mean_quant > 0):
+                mean_quant = 1.00
+            k = 3*kb*self.calc._temperature/mean_quant
+            k_mean.append(k)
+            #propagate the error of the mean msd
+            k_err.append(k*average.error/mean_quant)
+        return k_mean, k_err
+
     def assign_spring_constants(self, k):
         """
         Here the spring constants are finalised, add added to the class
@@ -248,7 +284,7 @@ class Solid(cph.Phase):
 
             #dump snapshot and check if melted
             self.dump_current_snapshot(lmp, "traj.equilibration_stage1.dat")
-            self.check_if_melted(lmp, "traj.equilibration_stage1.dat")
+            self.check_if_melted(lmp)
         
         #run if a constrained lattice is used
         else:
@@ -261,10 +297,19 @@ class Solid(cph.Phase):
 
         #check for melting
         self.dump_current_snapshot(lmp, "traj.equilibration_stage2.dat")
-        self.check_if_melted(lmp, "traj.equilibration_stage2.dat")
+        self.check_if_melted(lmp)
         lmp = ph.write_data(lmp, "conf.equilibration.data")
-        #close object and process traj
-        lmp.close()
+
+        if self.persistent:
+            #remove the msd calculation and keep the object for integration
+            lmp.command("unfix            4")
+            for i in range(self.calc.n_elements):
+                lmp.command("variable         msd%d delete"%(i+1))
+                lmp.command("uncompute        c%d"%(i+1))
+            self.save_session(lmp)
+        else:
+            #close object and process traj
+            lmp.close()
 
 
     def run_minimal_averaging(self):
@@ -370,25 +415,29 @@ class Solid(cph.Phase):
         Run the integration routine where the initial and final systems are connected using
         the lambda parameter. See algorithm 4 in publication.
         """
-        lmp = ph.create_object(self.cores, self.simfolder, self.calc.md.timestep, 
-            self.calc.md.cmdargs, 
-            init_commands=self.calc.md.init_commands,
-            script_mode=self.calc.script_mode)
-
-        #set up potential
-        if self.calc.potential_file is None:
-            lmp.command(f'pair_style {self.calc._pair_style_with_options[0]}')
-        
-        #read in the conf file
-        #conf = os.path.join(self.simfolder, "conf.equilibration.dump")
-        conf = os.path.join(self.simfolder, "conf.equilibration.data")
-        lmp = ph.read_data(lmp, conf)
-
-        if self.calc.potential_file is None:
-            lmp.command(f'pair_coeff {self.calc.pair_coeff[0]}')
+        if self.lmp is not None:
+            #equilibrated state and potential are still in memory
+            lmp = self.restore_session()
         else:
-            lmp.command("include %s"%self.calc.potential_file)
-        lmp = ph.set_mass(lmp, self.calc)
+            lmp = ph.create_object(self.cores, self.simfolder, self.calc.md.timestep, 
+                self.calc.md.cmdargs, 
+                init_commands=self.calc.md.init_commands,
+                script_mode=self.calc.script_mode)
+
+            #set up potential
+            if self.calc.potential_file is None:
+                lmp.command(f'pair_style {self.calc._pair_style_with_options[0]}')
+            
+            #read in the conf file
+            #conf = os.path.join(self.simfolder, "conf.equilibration.dump")
+            conf = os.path.join(self.simfolder, "conf.equilibration.data")
+            lmp = ph.read_data(lmp, conf)
+
+            if self.calc.potential_file is None:
+                lmp.command(f'pair_coeff {self.calc.pair_coeff[0]}')
+            else:
+                lmp.command("include %s"%self.calc.potential_file)
+            lmp = ph.set_mass(lmp, self.calc)
 
         #remap the box to get the correct pressure
         lmp = ph.remap_box(lmp, self.lx, self.ly, self.lz)
@@ -443,16 +492,9 @@ class Solid(cph.Phase):
         lmp.command("run               %d"%self.calc.n_equilibration_steps)
         
         #write out energy
-        str1 = "fix f4 all print 1 \"${dU1} "
-        str2 = []
-        for i in range(self.calc.n_elements):
-            str2.append("${dU%d}"%(i+2))
-
-        str2.append("${lambda}\"")
-        str2 = " ".join(str2)
-        str3 = " screen no file forward_%d.dat"%iteration
-        command = str1 + str2 + str3
-        lmp.command(command)
+        values = ["dU%d"%(i+1) for i in range(self.calc.n_elements+1)]
+        values.append("lambda")
+        self.start_data_collection(lmp, "f4", values, "forward_%d.dat"%iteration)
 
         if self.calc.n_print_steps > 0:
             lmp.command("dump              d1 all custom %d traj.fe.forward_%d.dat id type mass x y z fx fy fz"%(self.calc.n_print_steps,
@@ -473,7 +515,7 @@ class Solid(cph.Phase):
 
         #Forward switching over ts steps
         lmp.command("run               %d"%self.calc._n_switching_steps)
-        lmp.command("unfix             f4")
+        self.stop_data_collection(lmp, "f4", values, "forward_%d.dat"%iteration)
 
         if self.calc.n_print_steps > 0:
             lmp.command("undump           d1")
@@ -486,16 +528,9 @@ class Solid(cph.Phase):
         lmp.command("run               %d"%self.calc.n_equilibration_steps)
 
         #write out energy
-        str1 = "fix f4 all print 1 \"${dU1} "
-        str2 = []
-        for i in range(self.calc.n_elements):
-            str2.append("${dU%d}"%(i+2))
-
-        str2.append("${lambda}\"")
-        str2 = " ".join(str2)
-        str3 = " screen no file backward_%d.dat"%iteration
-        command = str1 + str2 + str3
-        lmp.command(command)
+        values = ["dU%d"%(i+1) for i in range(self.calc.n_elements+1)]
+        values.append("lambda")
+        self.start_data_collection(lmp, "f4", values, "backward_%d.dat"%iteration)
 
         if self.calc.n_print_steps > 0:
             lmp.command("dump              d1 all custom %d traj.fe.backward_%d.dat id type mass x y z fx fy fz"%(self.calc.n_print_steps,
@@ -517,7 +552,7 @@ class Solid(cph.Phase):
 
         #Reverse switching over ts steps
         lmp.command("run               %d"%self.calc._n_switching_steps)
-        lmp.command("unfix             f4")
+        self.stop_data_collection(lmp, "f4", values, "backward_%d.dat"%iteration)
 
         if self.calc.n_print_steps > 0:
             lmp.command("undump           d1")
@@ -527,11 +562,19 @@ class Solid(cph.Phase):
         #    lmp.command("unfix swap2")
 
         #close object
-        if not self.calc.script_mode:
-            lmp.close()
-        else:
+        if self.calc.script_mode:
             file = os.path.join(self.simfolder, 'integration.lmp')
             lmp.write(file)
+        elif self.lmp is not None:
+            #remove the fixes of this stage, the object is used again
+            lmp.command("unfix             f1")
+            for i in range(self.calc.n_elements):
+                lmp.command("unfix             ff%d"%(i+1))
+            lmp.command("unfix             f3")
+            lmp.command("thermo_style      custom step pe")
+            lmp.command("uncompute         Tcm")
+        else:
+            lmp.close()
 
 
     def thermodynamic_integration(self):
@@ -560,7 +603,9 @@ class Solid(cph.Phase):
         w, q, qerr = find_w(self.simfolder, 
             self.calc,
             full=True, 
-            solid=True)
+            solid=True,
+            data=self.data,
+            iterations=self.get_iterations())
         
         self.fref = fe + fcm
         self.feinstein = fe
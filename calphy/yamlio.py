@@ -0,0 +1,108 @@
+"""
+calphy: a Python library and command line interface for automated free
+energy calculations.
+
+Copyright 2021  (c) Sarath Menon^1, Yury Lysogorskiy^2, Ralf Drautz^2
+^1: Max Planck Institut für Eisenforschung, Dusseldorf, Germany
+^2: Ruhr-University Bochum, Bochum, Germany
+
+calphy is published and distributed under the Academic Software License v1.0 (ASL).
+calphy is distributed in the hope that it will be useful for non-commercial academic research,
+but WITHOUT ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+calphy API is published and distributed under the BSD 3-Clause "New" or "Revised" License
+See the LICENSE FILE for more details.
+
+More information about the program can be found in:
+Menon, Sarath, Yury Lysogorskiy, Jutta Rogal, and Ralf Drautz.
+“Automated Free Energy Calculation from Atomistic Simulations.” Physical Review Materials 5(10), 2021
+DOI: 10.1103/PhysRevMaterials.5.103801
+
+For more information contact:
+sarath.menon@ruhr-uni-bochum.de/yury.lysogorskiy@icams.rub.de
+"""
+
+import os
+import json
+import numpy as np
+import yaml
+
+# use the libyaml based loaders and dumpers if available
+try:
+    from yaml import CSafeLoader as SafeLoader, CSafeDumper as SafeDumper
+    from yaml import CDumper as Dumper
+except ImportError:
+    from yaml import SafeLoader, SafeDumper, Dumper
+
+
+def safe_load(stream):
+    """
+    Drop-in replacement of `yaml.safe_load` using libyaml if available
+    """
+    return yaml.load(stream, Loader=SafeLoader)
+
+
+def safe_dump(data, stream=None, **kwargs):
+    """
+    Drop-in replacement of `yaml.safe_dump` using libyaml if available
+    """
+    return yaml.dump(data, stream, Dumper=SafeDumper, **kwargs)
+
+
+def _to_builtin(obj):
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    raise TypeError("Object of type %s is not JSON serializable" % type(obj).__name__)
+
+
+def write_report(report, reportfile):
+    """
+    Write a report as yaml, along with a json sidecar
+
+    Parameters
+    ----------
+    report : dict
+        report to be written
+
+    reportfile : string
+        name of the yaml file, the sidecar has the extension `.json`
+
+    Returns
+    -------
+    None
+    """
+    with open(reportfile, "w") as fout:
+        yaml.dump(report, fout, Dumper=Dumper)
+
+    jsonfile = os.path.splitext(reportfile)[0] + ".json"
+    with open(jsonfile, "w") as fout:
+        json.dump(report, fout, default=_to_builtin)
+
+
+def read_report(reportfile):
+    """
+    Read a report written by `write_report`
+
+    Parameters
+    ----------
+    reportfile : string
+        name of the yaml file
+
+    Returns
+    -------
+    report : dict
+
+    Notes
+    -----
+    The json sidecar is read if it is not older than the yaml file.
+    """
+    jsonfile = os.path.splitext(reportfile)[0] + ".json"
+    if os.path.exists(jsonfile) and (
+        os.path.getmtime(jsonfile) >= os.path.getmtime(reportfile)
+    ):
+        with open(jsonfile, "r") as fin:
+            return json.load(fin)
+
+    with open(reportfile, "r") as fin:
+        return safe_load(fin)
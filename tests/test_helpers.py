@@ -38,3 +38,99 @@ def test_validate_spring_constants():
 	d = [1, np.NaN, 4]
 	e = ch.validate_spring_constants(d)
 	assert e[1] == 1
+
+
+def test_running_average():
+	rng = np.random.default_rng(42)
+	values = rng.normal(size=4096)
+	avg = ch.RunningAverage()
+	for chunk in np.split(values, 16):
+		avg.add(chunk)
+	assert avg.count == 4096
+	assert np.isclose(avg.mean, np.mean(values))
+	assert np.isclose(avg.std, np.std(values))
+	assert np.isclose(avg.error, np.std(values)/np.sqrt(4095), rtol=0.5)
+
+	#correlated series, the error is larger than the naive estimate
+	corr = np.zeros(4096)
+	for i in range(1, 4096):
+		corr[i] = 0.95*corr[i-1] + values[i]
+	avg = ch.RunningAverage()
+	avg.add(corr)
+	assert avg.error > 3*np.std(corr)/np.sqrt(4095)
+
+	assert ch.RunningAverage().error == np.inf
+
+def test_data_file_tail(tmp_path):
+	file = tmp_path / "avg.dat"
+	reader = ch.DataFileTail(str(file), usecols=(1, 2))
+	assert reader.read().shape == (2, 0)
+
+	with open(file, "w") as fout:
+		fout.write("# TimeStep v_a v_b\n10 1.0 2.0\n20 3.0 4.0\n30 5.0")
+	data = reader.read()
+	assert np.allclose(data, [[1.0, 3.0], [2.0, 4.0]])
+
+	#incomplete lines are read once they are finished
+	with open(file, "a") as fout:
+		fout.write(" 6.0\n40 7.0 8.0\n")
+	data = reader.read()
+	assert np.allclose(data, [[5.0, 7.0], [6.0, 8.0]])
+	assert reader.read().shape == (2, 0)
+
+def test_command_batching(tmp_path, monkeypatch):
+	import os
+	import time
+	from lammps import lammps
+
+	class _Lammps(lammps):
+		#every call is one round trip with LammpsLibrary
+		def command(self, cmd):
+			calls.append(1)
+			super().command(cmd)
+
+		def commands_list(self, cmds):
+			calls.append(len(cmds))
+			super().commands_list(cmds)
+
+	def library(cores=1, working_directory=".", cmdargs=None):
+		return _Lammps(cmdargs=["-screen", "none", "-log", "none"])
+
+	pot = os.path.join(os.getcwd(), "tests/Cu01.eam.alloy")
+	monkeypatch.setattr(ch, "LammpsLibrary", library)
+	monkeypatch.chdir(tmp_path)
+
+	def calculation():
+		lmp = ch.create_object(1, str(tmp_path), 0.001)
+		for cmd in ["lattice fcc 3.615", "region box block 0 3 0 3 0 3", "create_box 1 box",
+			"create_atoms 1 box", "pair_style eam/alloy", "pair_coeff * * %s Cu"%pot, "mass 1 63.546",
+			"velocity all create 300 4928", "fix 1 all nve", "variable ve equal pe/atoms",
+			"fix 2 all ave/time 1 1 1 v_ve file ave.dat", "run 10", "unfix 2", "unfix 1"]:
+			lmp.command(cmd)
+		data = np.loadtxt("ave.dat")
+		natoms = lmp.get_natoms()
+		lmp.close()
+		return data, natoms
+
+	#output files are complete, and queries see all commands
+	calls = []
+	data, natoms = calculation()
+	assert len(data) == 11
+	assert natoms == 108
+	assert len(calls) == 3
+	assert sum(calls) == 19
+
+	#many short calculations, one command at a time and batched
+	batch = ch.LammpsBatch
+	ncalls = []
+	times = []
+	for name, wrapper in [("single", lambda lmp: lmp), ("batched", batch)]:
+		monkeypatch.setattr(ch, "LammpsBatch", wrapper)
+		calls = []
+		start = time.perf_counter()
+		for x in range(20):
+			calculation()
+		times.append(time.perf_counter() - start)
+		ncalls.append(len(calls))
+		print("%s: %d calls, %.3f s"%(name, ncalls[-1], times[-1]))
+	assert ncalls[1] < ncalls[0]/5
@@ -8,3 +8,122 @@ def test_ideal_gas():
 def test_uf():
 	a = get_uhlenbeck_ford_fe(1000, 0.07, 50, 2)
 	assert np.abs(a-5.37158083028874) < 1E-5
+
+def test_uf_array():
+	#all branches, including points on the spline grid
+	x = np.concatenate((np.linspace(0.0001, 4.0, 2001), [0.0025, 0.05, 0.1, 0.125, 0.5, 1.0, 2.5, 3.9, 4.0]))
+	for p in [1, 25, 50, 75, 100]:
+		press, fe = find_fe(p, x)
+		scalar = np.array([find_fe(p, xx) for xx in x])
+		assert np.allclose(press, scalar[:,0], rtol=1E-12, atol=0)
+		assert np.allclose(fe, scalar[:,1], rtol=1E-12, atol=0)
+	with pytest.raises(ValueError):
+		find_fe(50, np.array([0.1, 4.1]))
+
+	temp = np.linspace(500, 2000, 7)
+	rho = np.linspace(0.04, 0.1, 5)
+	a = get_uhlenbeck_ford_fe(temp[:,None], rho[None,:], 50, 2)
+	assert a.shape == (7, 5)
+	assert np.isclose(a[0,0], get_uhlenbeck_ford_fe(500, 0.04, 50, 2))
+	assert np.isclose(get_uhlenbeck_ford_fe(np.array([1000]), 0.07, 50, 2)[0], 5.37158083028874)
+
+def test_uf_array_benchmark():
+	import time
+	temp = np.linspace(500, 2000, 100)
+	rho = np.linspace(0.01, 0.15, 100)
+	t = time.perf_counter()
+	scalar = np.array([[get_uhlenbeck_ford_fe(tt, rr, 50, 2) for rr in rho] for tt in temp])
+	tscalar = time.perf_counter() - t
+	t = time.perf_counter()
+	array = get_uhlenbeck_ford_fe(temp[:,None], rho[None,:], 50, 2)
+	tarray = time.perf_counter() - t
+	print("UF free energy on 100x100 grid: scalar %.4f s, array %.4f s, speedup %.1f"%(tscalar, tarray, tscalar/tarray))
+	assert np.allclose(scalar, array, rtol=1E-12, atol=0)
+	assert tarray < tscalar
+
+def test_integrate_rs_in_memory(tmp_path):
+	folder = str(tmp_path)
+	flambda = np.linspace(1, 0.5, 101)
+	data = {}
+	for i in range(1, 3):
+		fdata = np.array([-3.0*flambda + 0.01*i, np.full(101, 1.0), np.full(101, 1200.0), flambda])
+		bdata = np.array([-3.0*flambda[::-1], np.full(101, 1.0), np.full(101, 1200.0), flambda[::-1]])
+		data["ts.forward_%d"%i] = fdata
+		data["ts.backward_%d"%i] = bdata
+		np.savetxt(os.path.join(folder, "ts.forward_%d.dat"%i), fdata.T)
+		np.save(os.path.join(folder, "ts.backward_%d.npy"%i), bdata)
+
+	res1, e1 = integrate_rs(folder, -4.0, 1000, 100, nsims=2, scale_energy=True, return_values=True)
+	res2, e2 = integrate_rs(folder, -4.0, 1000, 100, nsims=2, scale_energy=True, return_values=True, data=data)
+	assert np.allclose(res1, res2)
+	assert np.abs(e1-e2) < 1E-8
+	#arrays held in memory are not modified
+	assert np.allclose(data["ts.forward_1"][0], -3.0*flambda + 0.01)
+
+def test_read_data_binary(tmp_path):
+	filename = os.path.join(str(tmp_path), "forward_1.dat")
+	data = np.random.rand(101, 3)
+	np.savetxt(filename, data)
+	a = read_data(filename)
+	assert os.path.exists(os.path.join(str(tmp_path), "forward_1.npy"))
+	b = read_data(filename)
+	assert isinstance(b, np.memmap)
+	assert np.allclose(a, b)
+	assert np.allclose(b, data.T)
+
+def test_integrate_rs_ragged(tmp_path):
+	folder = str(tmp_path)
+	data = {}
+	for i, n in enumerate([101, 151, 201]):
+		flambda = np.linspace(1, 0.5, n)
+		data["ts.forward_%d"%(i+1)] = np.array([-3.0*flambda, np.zeros(n), np.full(n, 1200.0), flambda])
+		data["ts.backward_%d"%(i+1)] = np.array([-3.0*flambda[::-1], np.zeros(n), np.full(n, 1200.0), flambda[::-1]])
+	(temp, f, werr), ediss = integrate_rs(folder, -4.0, 1000, 100, nsims=3, scale_energy=True, return_values=True, data=data)
+	assert len(temp) == 201
+	assert np.max(werr) < 1E-8
+	assert ediss < 1E-8
+	#integrand is constant, w = -3(lambda-1)/lambda
+	flambda = 1000/temp
+	assert np.allclose(f, -4.0/flambda + 1.5*kb*temp*np.log(flambda) - 3.0*(flambda-1)/flambda)
+
+
+class _Calc:
+	_temperature = 1000
+	element = ["Cu", "Zr"]
+	_element_dict = {"Cu": {"count": 120000, "mass": 63.546}, "Zr": {"count": 80000, "mass": 91.224}}
+
+def _einstein_per_atom(calc, vol, k):
+	#per atom form of the Einstein crystal free energy
+	temp = calc._temperature
+	mass = np.concatenate([np.full(calc._element_dict[x]['count'], calc._element_dict[x]['mass']) for x in calc.element])
+	karr = np.concatenate([np.full(calc._element_dict[x]['count'], k[c]) for c, x in enumerate(calc.element)])
+	natoms = len(mass)
+	beta = 1/(kbJ*temp)
+	mass = (mass/Na)*1E-3
+	karr = karr*(eV2J/1E-20)
+	F_e = kb*temp*np.sum(np.log(((beta**2*karr*hJ**2)/(4*np.pi**2*mass))**1.5))/natoms
+	mu = mass/np.sum(mass)
+	F_cm = kb*temp*np.log(vol*1E-30*(beta/(2*np.pi*np.sum(mu**2/karr)))**1.5)/natoms
+	return F_e, -F_cm
+
+def test_einstein_crystal_species():
+	import time
+	calc = _Calc()
+	k = [1.5, 2.5]
+	t = time.perf_counter()
+	ref = _einstein_per_atom(calc, 16.0, k)
+	tatom = time.perf_counter() - t
+	t = time.perf_counter()
+	res = get_einstein_crystal_fe(calc, 16.0, k, return_contributions=True)
+	tspecies = time.perf_counter() - t
+	print("Einstein crystal, 200000 atoms: per atom %.4f s, per species %.6f s"%(tatom, tspecies))
+	assert np.allclose(res, ref, rtol=1E-10, atol=0)
+	assert np.isclose(get_einstein_crystal_fe(calc, 16.0, k), ref[0] + ref[1])
+
+	#many temperatures and volumes at once
+	temp = np.linspace(300, 1500, 5)
+	vol = np.linspace(15, 17, 3)
+	fe = get_einstein_crystal_fe_array(temp[:,None], vol[None,:], [120000, 80000], [63.546, 91.224], k)
+	assert fe.shape == (5, 3)
+	calc._temperature = temp[1]
+	assert np.isclose(fe[1,2], get_einstein_crystal_fe(calc, vol[2], k))
@@ -0,0 +1,118 @@
+"""
+Test the concurrent run of the solid and liquid phases in melting_temperature mode.
+
+The phases are replaced by light objects, so that only the process handling
+of `MeltingTemp.run_jobs_concurrently` is tested.
+"""
+
+import os
+import time
+import logging
+import numpy as np
+import calphy.routines as routines
+from calphy.routines import MeltingTemp
+from calphy.errors import MeltedError, SolidifiedError
+
+
+class _Calc:
+    n_iterations = 2
+    n_parallel_iterations = 1
+    script_mode = False
+    target_error = None
+
+
+class _Leg:
+    def __init__(self, simfolder, value, error=None, delay=0):
+        self.simfolder = str(simfolder)
+        self.log_to_screen = False
+        self.calc = _Calc()
+        self.value = value
+        self.error = error
+        self.delay = delay
+        self.state = None
+        self.stages = []
+
+    def get_iterations(self):
+        return list(range(1, self.calc.n_iterations+1))
+
+    def is_stage_complete(self, stage):
+        return stage in self.stages
+
+    def complete_stage(self, stage):
+        self.stages.append(stage)
+
+    def reversible_scaling(self, iteration=1):
+        with open(os.path.join(self.simfolder, "pid_%d"%os.getpid()), "w") as fout:
+            fout.write("")
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+
+    def integrate_reversible_scaling(self, scale_energy=True, return_values=True):
+        t = np.linspace(1000, 1200, 5)
+        return t, self.value*np.ones(5), np.zeros(5)
+
+    def get_state(self):
+        return {"fe": self.value}
+
+    def set_state(self, state):
+        self.state = state
+
+
+def _melt(soljob, lqdjob):
+    melt = MeltingTemp.__new__(MeltingTemp)
+    melt.logger = logging.getLogger("test_melting_temperature_concurrent")
+    melt.soljob = soljob
+    melt.lqdjob = lqdjob
+    return melt
+
+
+def test_concurrent_legs(tmp_path, monkeypatch):
+    monkeypatch.setattr(routines, "routine_fe", lambda job: job)
+    melt = _melt(_Leg(tmp_path, -1.0), _Leg(tmp_path, -2.0))
+    returncode = melt.run_jobs_concurrently()
+    assert returncode is None
+    assert np.allclose(melt.solres[1], -1.0)
+    assert np.allclose(melt.lqdres[1], -2.0)
+    assert melt.soljob.state == {"fe": -1.0}
+    assert melt.lqdjob.state == {"fe": -2.0}
+
+
+def test_concurrent_legs_cancel(tmp_path, monkeypatch):
+    monkeypatch.setattr(routines, "routine_fe", lambda job: job)
+
+    #liquid freezes, the slow solid calculation should be stopped
+    melt = _melt(_Leg(tmp_path, -1.0, delay=60), _Leg(tmp_path, -2.0, error=SolidifiedError()))
+    start = time.time()
+    assert melt.run_jobs_concurrently() == 3
+    assert time.time() - start < 30
+
+    melt = _melt(_Leg(tmp_path, -1.0, error=MeltedError()), _Leg(tmp_path, -2.0, delay=60))
+    assert melt.run_jobs_concurrently() == 2
+
+
+def _is_running(pid):
+    try:
+        with open("/proc/%d/stat"%pid) as fin:
+            return fin.read().split(")")[-1].split()[0] != "Z"
+    except OSError:
+        return False
+
+
+def test_concurrent_legs_cancel_parallel_iterations(tmp_path, monkeypatch):
+    monkeypatch.setattr(routines, "routine_fe", lambda job: job)
+
+    #iterations of the solid run in their own processes, they are stopped with the leg
+    soljob = _Leg(tmp_path / "solid", -1.0, delay=60)
+    os.mkdir(soljob.simfolder)
+    soljob.calc.n_parallel_iterations = 2
+    soljob.cores = 2
+    soljob.logger = logging.getLogger("test_melting_temperature_concurrent")
+    melt = _melt(soljob, _Leg(tmp_path, -2.0, delay=2, error=SolidifiedError()))
+    start = time.time()
+    assert melt.run_jobs_concurrently() == 3
+    assert time.time() - start < 30
+    pids = [int(x.split("_")[1]) for x in os.listdir(soljob.simfolder) if x.startswith("pid_")]
+    assert len(pids) == 2
+    time.sleep(1)
+    assert not any(_is_running(pid) for pid in pids)
@@ -0,0 +1,110 @@
+"""
+Test the incremental melting temperature search.
+
+The phases are replaced by light objects with known free energy curves, so
+that only the extension of the curves in `MeltingTemp.find_tm` is tested.
+"""
+
+import logging
+import pytest
+import numpy as np
+from calphy.routines import MeltingTemp
+from calphy.errors import MeltedError
+
+
+class _Calc:
+    n_iterations = 1
+    n_parallel_iterations = 1
+    script_mode = False
+    _temperature = 900
+    _temperature_stop = 1100
+
+
+class _Leg:
+    def __init__(self, f0, slope, melts_above=None):
+        self.calc = _Calc()
+        self.logger = logging.getLogger("test_melting_temperature_incremental")
+        self.f0 = f0
+        self.slope = slope
+        self.melts_above = melts_above
+        self.sweep_start = None
+        self.sweeps = []
+        self.stages = ["reversible_scaling_1"]
+
+    def fe(self, temp):
+        return self.f0 + self.slope*(np.asarray(temp) - 1000)
+
+    def get_iterations(self):
+        return list(range(1, self.calc.n_iterations+1))
+
+    def is_stage_complete(self, stage):
+        return stage in self.stages
+
+    def complete_stage(self, stage):
+        self.stages.append(stage)
+
+    def reversible_scaling(self, iteration=1):
+        self.sweeps.append((self.sweep_start, self.calc._temperature_stop))
+        if (self.melts_above is not None) and (self.calc._temperature_stop > self.melts_above):
+            raise MeltedError()
+
+    def integrate_reversible_scaling(self, scale_energy=True, return_values=True, fe_start=None):
+        #the curve continues from the known free energy at the start
+        assert np.isclose(fe_start, self.fe(self.sweep_start))
+        temp = np.linspace(self.sweep_start, self.calc._temperature_stop, 101)
+        return temp, self.fe(temp), np.zeros(101)
+
+
+def _melt(soljob, lqdjob):
+    melt = MeltingTemp.__new__(MeltingTemp)
+    melt.logger = logging.getLogger("test_melting_temperature_incremental")
+    melt.dtemp = 200
+    melt.attempts = 0
+    melt.maxattempts = 5
+    melt.tmin = 900
+    melt.tmax = 1100
+    melt.soljob = soljob
+    melt.lqdjob = lqdjob
+    temp = np.linspace(900, 1100, 101)
+    melt.solres = [temp, soljob.fe(temp), np.zeros(101)]
+    melt.lqdres = [temp, lqdjob.fe(temp), np.zeros(101)]
+    melt.solcurve = melt.solres
+    melt.lqdcurve = melt.lqdres
+    return melt
+
+
+def test_incremental_search(monkeypatch):
+    #free energies cross at 1500 K, outside of the first range
+    melt = _melt(_Leg(-3.0, -0.0010), _Leg(-2.75, -0.0015))
+    monkeypatch.setattr(melt, "start_calculation", lambda: pytest.fail("calculation restarted"))
+    tm, tmerr = melt.find_tm()
+    assert np.abs(tm - 1500) < 5
+
+    #one sweep per phase, only into the missing range
+    assert np.allclose(melt.soljob.sweeps, [(1100, 1700)], atol=1)
+    assert np.allclose(melt.lqdjob.sweeps, [(1100, 1700)], atol=1)
+    assert melt.solcurve[0][0] == 900
+    assert np.isclose(melt.solcurve[0][-1], 1700, atol=1)
+    assert np.all(np.diff(melt.solcurve[0]) > 0)
+
+    #below the range
+    melt = _melt(_Leg(-3.0, -0.0010), _Leg(-3.1, -0.0015))
+    monkeypatch.setattr(melt, "start_calculation", lambda: pytest.fail("calculation restarted"))
+    tm, tmerr = melt.find_tm()
+    assert np.abs(tm - 800) < 5
+    assert np.allclose(melt.soljob.sweeps, [(900, 600)], atol=1)
+
+
+def test_incremental_search_fallback(monkeypatch):
+    #solid melts while extending, the calculation is started again
+    melt = _melt(_Leg(-3.0, -0.0010, melts_above=1200), _Leg(-2.75, -0.0015))
+    restarted = []
+    def restart():
+        restarted.append((melt.tmin, melt.tmax))
+        temp = np.linspace(melt.tmin, melt.tmax, 101)
+        melt.solres = [temp, melt.soljob.fe(temp), np.zeros(101)]
+        melt.lqdres = [temp, melt.lqdjob.fe(temp), np.zeros(101)]
+    monkeypatch.setattr(melt, "start_calculation", restart)
+    tm, tmerr = melt.find_tm()
+    assert np.allclose(restarted, [(1300, 1700)], atol=1)
+    assert np.abs(tm - 1500) < 5
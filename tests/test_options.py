@@ -1,6 +1,49 @@
 import pytest
-from calphy.input import read_inputfile
+import os
+import shutil
+from calphy.input import read_inputfile, read_calculation
 
 def test_options():
 	options = read_inputfile("tests/input.yaml")
-	assert options[0]._temperature == 1300
\ No newline at end of file
+	assert options[0]._temperature == 1300
+
+def test_read_calculation(tmp_path):
+	infile = os.path.join(tmp_path, "input.yaml")
+	shutil.copy("tests/input.yaml", infile)
+	calc = read_calculation(infile, 0)
+	assert calc._temperature == 1300
+	cachefiles = os.listdir(os.path.join(tmp_path, ".calphy_cache"))
+	assert len(cachefiles) == 1
+
+	#second read comes from the cache
+	cached = read_calculation(infile, 0)
+	assert cached.model_dump() == calc.model_dump()
+	assert cached._temperature == 1300
+
+	#changing the input file gives a new entry
+	with open(infile, "a") as fout:
+		fout.write("\n")
+	_ = read_calculation(infile, 0)
+	assert len(os.listdir(os.path.join(tmp_path, ".calphy_cache"))) == 2
+
+	with pytest.raises(IndexError):
+		read_calculation(infile, 10, cache=False)
+
+def test_read_calculation_referenced_files(tmp_path):
+	potfile = os.path.join(tmp_path, "Cu01.eam.alloy")
+	shutil.copy("tests/Cu01.eam.alloy", potfile)
+	with open("tests/input.yaml", "r") as fin:
+		content = fin.read()
+	infile = os.path.join(tmp_path, "input.yaml")
+	with open(infile, "w") as fout:
+		fout.write(content.replace("tests/Cu01.eam.alloy", potfile))
+	_ = read_calculation(infile, 0)
+	_ = read_calculation(infile, 0)
+	assert len(os.listdir(os.path.join(tmp_path, ".calphy_cache"))) == 1
+
+	#editing the potential in place gives a new entry
+	with open(potfile, "a") as fout:
+		fout.write("\n")
+	_ = read_calculation(infile, 0)
+	assert len(os.listdir(os.path.join(tmp_path, ".calphy_cache"))) == 2
+
@@ -0,0 +1,54 @@
+import os
+import yaml
+import numpy as np
+from calphy.postprocessing import gather_results, ResultIndex
+
+
+def _write_calculation(mainfolder, name, fe=None):
+	folder = os.path.join(mainfolder, name)
+	os.makedirs(folder, exist_ok=True)
+	inp = {"calculations": [{"mode": "fe", "temperature": 1000, "pressure": 0,
+		"reference_phase": "solid", "phase_name": "", "reference_composition": 0.0}]}
+	with open(os.path.join(folder, "input_file.yaml"), "w") as fout:
+		yaml.safe_dump(inp, fout)
+	if fe is not None:
+		rep = {"input": {"element": "Cu", "concentration": "1.0"},
+			"results": {"free_energy": fe}}
+		with open(os.path.join(folder, "report.yaml"), "w") as fout:
+			yaml.safe_dump(rep, fout)
+
+def test_gather_results_index(tmp_path):
+	mainfolder = str(tmp_path)
+	for i in range(4):
+		_write_calculation(mainfolder, "fe-%d"%i, fe=-3.0-i)
+	_write_calculation(mainfolder, "fe-running")
+
+	df = gather_results(mainfolder, n_workers=2)
+	assert len(df) == 5
+	assert os.path.exists(os.path.join(mainfolder, "calphy_index.sqlite"))
+	assert np.isnan(df[df.calculation=="fe-running"].free_energy.values[0])
+
+	#finish one calculation, only this one is parsed again
+	_write_calculation(mainfolder, "fe-running", fe=-2.0)
+	os.utime(os.path.join(mainfolder, "fe-running", "report.yaml"), (1, 1))
+	df2 = gather_results(mainfolder)
+	assert df2[df2.calculation=="fe-running"].free_energy.values[0] == -2.0
+	assert np.allclose(np.sort(df2.free_energy.values), [-6, -5, -4, -3, -2])
+
+	index = ResultIndex(os.path.join(mainfolder, "calphy_index.sqlite"))
+	assert len(index.read()) == 5
+	index.close()
+
+def test_report_sidecar(tmp_path):
+	from calphy.yamlio import write_report, read_report
+	reportfile = os.path.join(str(tmp_path), "report.yaml")
+	report = {"input": {"element": "Cu"}, "results": {"free_energy": np.float64(-3.5)}}
+	write_report(report, reportfile)
+	assert os.path.exists(os.path.join(str(tmp_path), "report.json"))
+	assert read_report(reportfile)["results"]["free_energy"] == -3.5
+
+	#a yaml file edited later takes precedence
+	with open(reportfile, "w") as fout:
+		yaml.safe_dump({"results": {"free_energy": -1.0}}, fout)
+	os.utime(os.path.join(str(tmp_path), "report.json"), (1, 1))
+	assert read_report(reportfile)["results"]["free_energy"] == -1.0
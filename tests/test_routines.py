@@ -0,0 +1,164 @@
+import os
+import logging
+import pytest
+import numpy as np
+from calphy.routines import run_iterations, run_integration_cycles
+from calphy.input import AdaptiveSwitching
+from calphy.errors import MeltedError
+
+
+class _Calc:
+	n_iterations = 4
+	n_parallel_iterations = 2
+	script_mode = False
+	target_error = None
+
+
+class _Job:
+	def __init__(self, simfolder, fail=None):
+		self.simfolder = str(simfolder)
+		self.calc = _Calc()
+		self.cores = 4
+		self.fail = fail
+		self.logger = logging.getLogger("test_routines")
+		self.stages = []
+		self.data = {}
+		self.n_cycles_run = None
+
+	def get_iterations(self):
+		n = self.calc.n_iterations if self.n_cycles_run is None else self.n_cycles_run
+		return list(range(1, n+1))
+
+	def is_stage_complete(self, stage):
+		return stage in self.stages
+
+	def complete_stage(self, stage):
+		self.stages.append(stage)
+
+	def run_integration(self, iteration=1):
+		if iteration == self.fail:
+			raise MeltedError("melted")
+		outfile = os.path.join(self.simfolder, "forward_%d.dat"%iteration)
+		np.savetxt(outfile, [os.getpid(), self.cores, np.random.randint(1, 1000000)])
+
+
+def test_run_iterations_parallel(tmp_path):
+	job = _Job(tmp_path)
+	job.data["forward_1"] = np.zeros(3)
+	run_iterations(job, "run_integration", "Integration")
+	data = np.array([np.loadtxt(os.path.join(tmp_path, "forward_%d.dat"%(i+1))) for i in range(4)])
+	#arrays from earlier runs in this process are not used instead of the new files
+	assert "forward_1" not in job.data
+	#each iteration in its own process, with half the cores
+	assert len(np.unique(data[:,0])) == 4
+	assert np.all(data[:,1] == 2)
+	#and different random seeds
+	assert len(np.unique(data[:,2])) == 4
+	assert job.cores == 4
+
+
+def test_run_iterations_error(tmp_path):
+	job = _Job(tmp_path, fail=2)
+	with pytest.raises(MeltedError):
+		run_iterations(job, "run_integration", "Integration")
+
+
+def test_run_iterations_serial(tmp_path):
+	job = _Job(tmp_path)
+	job.calc.n_parallel_iterations = 1
+	run_iterations(job, "run_integration", "Integration")
+	data = np.array([np.loadtxt(os.path.join(tmp_path, "forward_%d.dat"%(i+1))) for i in range(4)])
+	assert np.all(data[:,0] == os.getpid())
+	assert np.all(data[:,1] == 4)
+
+
+def test_run_iterations_restart(tmp_path):
+	job = _Job(tmp_path)
+	job.stages = ["run_integration_1", "run_integration_3"]
+	run_iterations(job, "run_integration", "Integration")
+	assert not os.path.exists(os.path.join(tmp_path, "forward_1.dat"))
+	assert os.path.exists(os.path.join(tmp_path, "forward_2.dat"))
+	assert not os.path.exists(os.path.join(tmp_path, "forward_3.dat"))
+	assert os.path.exists(os.path.join(tmp_path, "forward_4.dat"))
+	assert sorted(job.stages) == ["run_integration_%d"%(i+1) for i in range(4)]
+
+
+class _AdaptiveJob(_Job):
+	def __init__(self, simfolder, dissipation):
+		super().__init__(simfolder)
+		self.calc.adaptive_switching = AdaptiveSwitching(active=True, target_dissipation=0.001,
+			initial_steps=10000, min_steps=5000, max_steps=200000)
+		self.calc._n_switching_steps = 50000
+		self.dissipation = dissipation
+		self.lengths = {}
+
+	def run_integration(self, iteration=1):
+		self.lengths.setdefault(iteration, []).append(self.calc._n_switching_steps)
+
+	def get_dissipation(self, iteration):
+		#dissipation is inversely proportional to the switching length
+		return -1.0, self.dissipation/self.lengths[iteration][-1]
+
+
+def test_adaptive_switching(tmp_path):
+	#needs 40000 steps for the target
+	job = _AdaptiveJob(tmp_path, 40.0)
+	job.calc.n_parallel_iterations = 1
+	run_integration_cycles(job, "Integration")
+	assert job.lengths[1][0] == 10000
+	assert job.lengths[1][-1] >= 40000
+	assert 40.0/job.lengths[1][-1] <= 0.001
+	assert all(job.lengths[i][0] >= 40000 for i in range(2, 5))
+	assert all(len(job.lengths[i]) == 1 for i in range(2, 5))
+
+	#over converged, the remaining cycles are shortened
+	job = _AdaptiveJob(tmp_path, 1.0)
+	job.calc.n_parallel_iterations = 1
+	run_integration_cycles(job, "Integration")
+	assert job.lengths[1] == [10000]
+	assert all(job.lengths[i] == [5000] for i in range(2, 5))
+
+
+class _ErrorJob(_Job):
+	def __init__(self, simfolder):
+		super().__init__(simfolder)
+		self.calc.n_iterations = 10
+		self.calc.target_error = 0.001
+		self.calc.adaptive_switching = AdaptiveSwitching()
+
+	def get_error(self, iterations):
+		#standard error decreases with the number of cycles
+		return -1.0, 0.003/np.sqrt(len(iterations)-1)
+
+
+def test_target_error(tmp_path):
+	#needs 10 cycles to reach the target
+	job = _ErrorJob(tmp_path)
+	run_integration_cycles(job, "Integration")
+	assert job.n_cycles_run == 10
+	assert job.calc.n_iterations == 10
+	assert all(os.path.exists(os.path.join(tmp_path, "forward_%d.dat"%(i+1))) for i in range(10))
+
+	#stops as soon as the error is small enough, in batches of parallel cycles
+	job = _ErrorJob(tmp_path)
+	job.calc.n_iterations = 20
+	job.calc.target_error = 0.0015
+	run_integration_cycles(job, "Integration")
+	assert job.n_cycles_run == 6
+	assert job.calc.n_iterations == 20
+	assert sorted(job.stages) == sorted(["run_integration_%d"%(i+1) for i in range(6)])
+
+
+def test_target_error_restart(tmp_path):
+	#interrupted after the first batch of four cycles, with two of them done
+	job = _ErrorJob(tmp_path)
+	job.calc.n_parallel_iterations = 1
+	job.n_cycles_run = 4
+	job.stages = ["run_integration_1", "run_integration_2"]
+	run_integration_cycles(job, "Integration")
+	#continues up to the configured maximum, without repeating finished cycles
+	assert job.n_cycles_run == 10
+	assert job.calc.n_iterations == 10
+	assert sorted(job.stages) == sorted(["run_integration_%d"%(i+1) for i in range(10)])
+	assert not os.path.exists(os.path.join(tmp_path, "forward_1.dat"))
+	assert os.path.exists(os.path.join(tmp_path, "forward_10.dat"))
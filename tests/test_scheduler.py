@@ -0,0 +1,54 @@
+import os
+import subprocess
+import pytest
+import calphy.scheduler as pq
+
+
+def _local_job(folder, name, cores, command):
+	job = pq.Local({}, cores=cores, directory=str(folder))
+	job.maincommand = command
+	job.write_script(os.path.join(str(folder), name))
+	return job
+
+def test_local_pool(tmp_path):
+	pool = pq.LocalPool(max_cores=4, poll_interval=0.01)
+	for i in range(4):
+		pool.add(_local_job(tmp_path, "job%d.sub"%i, 2, "sleep 0.2"))
+	pool.add(_local_job(tmp_path, "fail.sub", 1, "exit 3"))
+	results = pool.run()
+
+	assert len(results) == 5
+	assert pool.peak_cores <= 4
+	codes = {os.path.basename(x["script"]): x["returncode"] for x in results}
+	assert codes["fail.sub"] == 3
+	assert codes["job0.sub"] == 0
+
+def test_local_pool_oversized(tmp_path):
+	pool = pq.LocalPool(max_cores=2, poll_interval=0.01)
+	pool.add(_local_job(tmp_path, "big.sub", 8, "true"))
+	with pytest.warns(UserWarning):
+		results = pool.run()
+	assert results[0]["cores"] == 2
+	assert results[0]["returncode"] == 0
+
+def test_job_array(tmp_path):
+	job = pq.SLURM({}, cores=4, directory=str(tmp_path))
+	logfiles = [os.path.join(str(tmp_path), "calc%d.sub"%i) for i in range(5)]
+	script = os.path.join(str(tmp_path), "array.sub")
+	job.write_array_script(script, "echo ${index}", [0, 1, 2, 3, 4], logfiles, pack=2)
+	with open(script, "r") as fin:
+		data = fin.read()
+	assert "#SBATCH --array=0-2" in data
+
+	#last task only gets the remaining calculation
+	env = dict(os.environ, SLURM_ARRAY_TASK_ID="2")
+	subprocess.run(["bash", script], env=env, check=True)
+	assert os.path.exists(logfiles[4]+".out")
+	assert not os.path.exists(logfiles[3]+".out")
+	with open(logfiles[4]+".out", "r") as fin:
+		assert fin.read().strip() == "4"
+
+	job = pq.SGE({}, cores=4, directory=str(tmp_path))
+	job.write_array_script(script, "echo ${index}", [0, 1, 2, 3, 4], logfiles, pack=2)
+	with open(script, "r") as fin:
+		assert "#$ -t 1-3" in fin.read()
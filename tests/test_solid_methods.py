@@ -1,7 +1,8 @@
 import pytest                                                                                                        
-from calphy.input import read_inputfile                                                                              
+from calphy.input import read_inputfile, save_job, load_state
 from calphy.solid import Solid
 from calphy.liquid import Liquid                                                                                       
+from calphy.errors import SolidifiedError
 import os                                                                                                            
 import numpy as np                                                                                                   
                                                                                                                      
@@ -15,3 +16,354 @@ def test_solid_averaging_nose_hoover_finite_pressure():
     sol = Liquid(calculation=calculations[0], simfolder=os.getcwd())
     assert sol.calc.equilibration_control == "nose-hoover"                                                  
 
+
+def test_job_state(tmp_path):
+    calculations = read_inputfile(os.path.join(os.getcwd(), "tests/inp2.yaml"))
+    sol = Solid(calculation=calculations[0], simfolder=str(tmp_path))
+    sol.lx = np.float64(12.3)
+    sol.k = [1.2, np.float64(2.3)]
+    sol.fe = -3.5
+    sol.publications = ["10.1103/PhysRevMaterials.5.103801"]
+    sol.calc._pressure = np.float64(1000.5)
+    save_job(sol)
+
+    state = load_state(os.path.join(tmp_path, "job_state.json"))
+    new = Solid(calculation=calculations[0], simfolder=str(tmp_path))
+    new.set_state(state)
+    assert new.lx == 12.3
+    assert new.k == [1.2, 2.3]
+    assert new.fe == -3.5
+    assert new.publications == ["10.1103/PhysRevMaterials.5.103801"]
+    assert new.rho is None
+    assert new.calc._pressure == 1000.5
+
+    #the number of cycles run for a target error is kept, not the maximum
+    calculations[0].target_error = 0.01
+    calculations[0].n_iterations = 10
+    sol = Solid(calculation=calculations[0], simfolder=str(tmp_path))
+    sol.n_cycles_run = 4
+    new = Solid(calculation=calculations[0], simfolder=str(tmp_path))
+    new.set_state(sol.get_state())
+    assert new.n_cycles_run == 4
+    assert new.calc.n_iterations == 10
+    assert new.get_iterations() == [1, 2, 3, 4]
+
+def test_persistent_session(tmp_path):
+    from lammps import lammps
+    calculations = read_inputfile(os.path.join(os.getcwd(), "tests/inp2.yaml"))
+    sol = Solid(calculation=calculations[0], simfolder=str(tmp_path))
+
+    lmp = lammps(cmdargs=["-screen", "none", "-log", "none"])
+    lmp.command("units metal")
+    lmp.command("atom_style atomic")
+    lmp.command("lattice fcc 4.05")
+    lmp.command("region box block 0 3 0 3 0 3")
+    lmp.command("create_box 1 box")
+    lmp.command("create_atoms 1 box")
+    lmp.command("mass 1 26.98")
+    lmp.command("pair_style lj/cut 4.0")
+    lmp.command("pair_coeff * * 0.4 2.6")
+    lmp.command("velocity all create 800 4928")
+    lmp.command("fix 1 all nve")
+    lmp.command("run 200")
+    natoms = lmp.get_natoms()
+    order = np.argsort(lmp.numpy.extract_atom("id")[:natoms])
+    x0 = np.array(lmp.numpy.extract_atom("x"))[order]
+    v0 = np.array(lmp.numpy.extract_atom("v"))[order]
+    sol.save_session(lmp)
+
+    #move on, and change the box
+    lmp.command("run 500")
+    lmp.command("change_box all x final 0 12.5 y final 0 12.5 z final 0 12.5 remap units box")
+
+    lmp = sol.restore_session()
+    order = np.argsort(lmp.numpy.extract_atom("id")[:natoms])
+    #positions are the same, up to wrapping into the box
+    dx = np.array(lmp.numpy.extract_atom("x"))[order] - x0
+    assert np.allclose(dx - 12.15*np.round(dx/12.15), 0)
+    assert np.allclose(np.array(lmp.numpy.extract_atom("v"))[order], v0)
+    assert np.allclose(lmp.extract_box()[1], [12.15, 12.15, 12.15])
+    sol.close_session()
+    assert sol.lmp is None
+
+def test_streaming_convergence(tmp_path, monkeypatch):
+    from lammps import lammps
+    calculations = read_inputfile(os.path.join(os.getcwd(), "tests/inp2.yaml"))
+    monkeypatch.chdir(tmp_path)
+    sol = Solid(calculation=calculations[0], simfolder=str(tmp_path))
+    sol.calc._pressure = 0.0
+    sol.calc.md.n_small_steps = 1000
+    sol.calc.md.n_cycles = 20
+    sol.calc.tolerance.pressure = 200.0
+    sol.natoms = 108
+
+    lmp = lammps(cmdargs=["-screen", "none", "-log", "none"])
+    lmp.command("units metal")
+    lmp.command("atom_style atomic")
+    lmp.command("lattice fcc 4.05")
+    lmp.command("region box block 0 3 0 3 0 3")
+    lmp.command("create_box 1 box")
+    lmp.command("create_atoms 1 box")
+    lmp.command("mass 1 26.98")
+    lmp.command("pair_style lj/cut 4.0")
+    lmp.command("pair_coeff * * 0.4 2.6")
+    lmp.command("velocity all create 200 4928")
+    for name in ["lx", "ly", "lz"]:
+        lmp.command("variable m%s equal %s"%(name, name))
+    lmp.command("variable mpress equal press")
+
+    #only the new rows of avg.dat and msd.dat are read in each cycle
+    sol.run_iterative_pressure_convergence(lmp)
+    assert sol.lx > 0
+    assert np.isclose(sol.vol, sol.lx*sol.ly*sol.lz)
+    sol.run_iterative_spring_constant_convergence(lmp)
+    assert len(sol.k) == 1
+    assert sol.k[0] > 0
+    lmp.close()
+
+def test_solid_fraction_in_memory(tmp_path, monkeypatch):
+    from lammps import lammps
+    calculations = read_inputfile(os.path.join(os.getcwd(), "tests/inp2.yaml"))
+    monkeypatch.chdir(tmp_path)
+    sol = Solid(calculation=calculations[0], simfolder=str(tmp_path))
+    sol.natoms = 500
+
+    lmp = lammps(cmdargs=["-screen", "none", "-log", "none"])
+    lmp.command("units metal")
+    lmp.command("atom_style atomic")
+    lmp.command("lattice fcc 4.05 origin 0.1 0.1 0.1")
+    lmp.command("region box block 0 5 0 5 0 5")
+    lmp.command("create_box 1 box")
+    lmp.command("create_atoms 1 box")
+    lmp.command("mass 1 26.98")
+    lmp.command("pair_style lj/cut 4.0")
+    lmp.command("pair_coeff * * 0.4 2.6")
+    lmp.command("velocity all create 300 4928")
+    lmp.command("fix 1 all nve")
+    lmp.command("run 100")
+
+    #the same result as analysing a written snapshot
+    sol.dump_current_snapshot(lmp, "traj.dat")
+    fraction = sol.find_solid_fraction(lmp)
+    assert fraction > 0.9
+    assert np.isclose(fraction, sol.find_solid_fraction(lmp, filename="traj.dat"))
+    sol.check_if_melted(lmp)
+
+    #disorder it
+    lmp.command("displace_atoms all random 2.0 2.0 2.0 4928 units box")
+    sol.dump_current_snapshot(lmp, "traj.dat")
+    fraction = sol.find_solid_fraction(lmp)
+    assert fraction < 0.1
+    assert np.isclose(fraction, sol.find_solid_fraction(lmp, filename="traj.dat"))
+    lmp.close()
+
+def test_restart(tmp_path):
+    calculations = read_inputfile(os.path.join(os.getcwd(), "tests/inp2.yaml"))
+    sol = Solid(calculation=calculations[0], simfolder=str(tmp_path))
+    sol.k = [1.2]
+    sol.lx = 12.3
+    sol.complete_stage("averaging")
+    sol.complete_stage("run_integration_1")
+
+    #without restart, nothing is read in
+    new = Solid(calculation=calculations[0], simfolder=str(tmp_path))
+    assert new.stages == []
+    assert new.k is None
+
+    calculations[0].restart = True
+    new = Solid(calculation=calculations[0], simfolder=str(tmp_path))
+    assert new.is_stage_complete("averaging")
+    assert new.is_stage_complete("run_integration_1")
+    assert not new.is_stage_complete("run_integration_2")
+    assert new.k == [1.2]
+    assert new.lx == 12.3
+
+
+class _MeltLammps:
+    """records the melting cycles, the solid fraction drops with temperature"""
+    def __init__(self, tmelt):
+        self.tmelt = tmelt
+        self.temperature = 0
+        self.steps = 0
+
+    def velocity(self, style, temperature, seed):
+        self.temperature = temperature
+
+    def command(self, command):
+        pass
+
+    def run(self, steps):
+        self.steps += steps
+
+    def fraction(self):
+        return float(np.clip((self.tmelt - self.temperature)/500, 0, 1))
+
+    def close(self):
+        pass
+
+def test_melt_structure():
+    calculations = read_inputfile(os.path.join(os.getcwd(), "tests/inp3.yaml"))
+    lqd = Liquid(calculation=calculations[0], simfolder=os.getcwd())
+    thigh = lqd.calc._temperature_high
+
+    #melts at the first cycle, stops after the first chunk
+    lmp = _MeltLammps(0.5*thigh)
+    lqd.find_solid_fraction = lambda lmp: lmp.fraction()
+    lqd.melt_structure(lmp)
+    assert lmp.steps == lqd.calc.md.n_small_steps//5
+
+    #the multiplier is extrapolated, needs fewer cycles than steps of 0.1
+    lmp = _MeltLammps(1.75*thigh)
+    lqd.find_solid_fraction = lambda lmp: lmp.fraction()
+    lqd.melt_structure(lmp)
+    assert lmp.temperature >= 1.75*thigh
+    assert lmp.steps < 7*lqd.calc.md.n_small_steps
+
+    #does not melt at all
+    lmp = _MeltLammps(5*thigh)
+    lqd.find_solid_fraction = lambda lmp: lmp.fraction()
+    with pytest.raises(SolidifiedError):
+        lqd.melt_structure(lmp)
+
+
+def _scaled_lammps(pair_style, pair_coeffs):
+    from lammps import lammps
+    lmp = lammps(cmdargs=["-screen", "none", "-log", "none"])
+    lmp.command("units metal")
+    lmp.command("atom_style atomic")
+    lmp.command("lattice fcc 3.615")
+    lmp.command("region box block 0 5 0 5 0 5")
+    lmp.command("create_box 1 box")
+    lmp.command("create_atoms 1 box")
+    lmp.command("mass 1 63.546")
+    lmp.command("displace_atoms all random 0.05 0.05 0.05 4928")
+    lmp.command("variable flambda equal 0.7")
+    lmp.command("variable fscale equal v_flambda")
+    lmp.command("variable bscale equal v_flambda-1.0")
+    lmp.command("variable one equal 1.0")
+    lmp.command(pair_style)
+    for pc in pair_coeffs:
+        lmp.command(pc)
+    lmp.command("compute tcm all temp/com")
+    lmp.command("velocity all create 600 4928")
+    lmp.command("fix 1 all nve")
+    lmp.command("run 0")
+    return lmp
+
+def test_reversible_scaling_single_evaluation():
+    import time
+    pot = "tests/Cu01.eam.alloy Cu"
+    #previous setup, the potential is evaluated twice, U + (lambda-1)U
+    double = _scaled_lammps("pair_style hybrid/scaled v_one eam/alloy v_bscale eam/alloy",
+        ["pair_coeff * * eam/alloy 1 %s"%pot, "pair_coeff * * eam/alloy 2 %s"%pot])
+    #evaluated once and scaled by lambda
+    single = _scaled_lammps("pair_style hybrid/scaled v_fscale eam/alloy",
+        ["pair_coeff * * eam/alloy %s"%pot])
+
+    #energy and forces seen by the sweep are the same
+    assert np.isclose(single.get_thermo("pe"), double.get_thermo("pe"))
+    natoms = single.get_natoms()
+    assert np.allclose(np.array(single.numpy.extract_atom("f"))[:natoms],
+        np.array(double.numpy.extract_atom("f"))[:natoms])
+
+    times = []
+    for lmp in [double, single]:
+        start = time.perf_counter()
+        lmp.command("run 500")
+        times.append(time.perf_counter() - start)
+    #timing is only reported, it depends on the load of the machine
+    print("reversible scaling, 500 steps: double %.3f s, single %.3f s, speedup %.2fx"%(
+        times[0], times[1], times[0]/times[1]))
+
+    #trajectories stay together
+    assert np.isclose(single.get_thermo("pe"), double.get_thermo("pe"), rtol=1e-6)
+    double.close()
+    single.close()
+
+
+
+def test_warm_started_sweeps(tmp_path, monkeypatch):
+    from lammps import lammps
+    import calphy.helpers as ph
+
+    class _Lammps(lammps):
+        def command(self, cmd):
+            runs.append(cmd)
+            super().command(cmd)
+
+    def create_object(cores, directory, timestep, cmdargs="", init_commands=()):
+        lmp = _Lammps(cmdargs=["-screen", "none", "-log", "none"])
+        for cmd in ["units metal", "boundary p p p", "atom_style atomic", "timestep %f"%timestep]:
+            lmp.command(cmd)
+        return lmp
+
+    calculations = read_inputfile(os.path.join(os.getcwd(), "tests/inp2.yaml"))
+    calculations[0].warm_start_sweeps = True
+    calculations[0].n_decorrelation_steps = 100
+    calculations[0].pair_coeff = ["* * %s Cu"%os.path.join(os.getcwd(), "tests/Cu01.eam.alloy")]
+    monkeypatch.chdir(tmp_path)
+    sol = Solid(calculation=calculations[0], simfolder=str(tmp_path))
+    sol.calc._temperature_stop = 900
+    sol.calc._n_sweep_steps = 100
+    sol.natoms = 108
+    sol.lx = sol.ly = sol.lz = 3*3.615
+
+    runs = []
+    lmp = create_object(1, str(tmp_path), 0.001)
+    for cmd in ["lattice fcc 3.615", "region box block 0 3 0 3 0 3", "create_box 1 box",
+        "create_atoms 1 box", "mass 1 63.546", "velocity all create 800 4928"]:
+        lmp.command(cmd)
+    lmp.command("write_data %s"%os.path.join(tmp_path, "conf.equilibration.data"))
+    lmp.close()
+    monkeypatch.setattr(ph, "create_object", create_object)
+
+    #the first iteration equilibrates and keeps the state
+    runs = []
+    sol.temperature_scaling(iteration=1)
+    assert runs.count("run               1000") == 2
+    conf = os.path.join(tmp_path, "conf.temperature_scaling.data")
+    assert os.path.exists(conf)
+
+    #later ones only decorrelate from it, before the forward sweep
+    runs = []
+    sol.temperature_scaling(iteration=2)
+    assert "read_data %s"%conf in runs
+    assert runs.count("run               1000") == 1
+    assert "run               100" in runs
+    assert os.path.exists(os.path.join(tmp_path, "ts.forward_2.dat"))
+
+    #a new equilibration invalidates it
+    os.utime(conf, (0, 0))
+    assert sol.get_sweep_start("temperature_scaling") is None
+
+
+def test_pressure_convergence_unknown_error(tmp_path, monkeypatch):
+    import calphy.helpers as ph
+    calculations = read_inputfile(os.path.join(os.getcwd(), "tests/inp2.yaml"))
+    sol = Solid(calculation=calculations[0], simfolder=str(tmp_path))
+    sol.calc._pressure = 0.0
+    sol.calc.md.n_cycles = 1
+    sol.natoms = 108
+
+    class _Lammps:
+        def command(self, cmd):
+            pass
+
+        def close(self):
+            pass
+
+    class _Tail:
+        #a single row at the target pressure per cycle, the error is not known
+        def __init__(self, filename, usecols):
+            pass
+
+        def read(self):
+            return np.array([[10.0], [10.0], [10.0], [0.0]])
+
+    monkeypatch.setattr(ph, "DataFileTail", _Tail)
+    with pytest.raises(ValueError):
+        sol.run_iterative_pressure_convergence(_Lammps())
+    sol.calc.md.n_cycles = 5
+    sol.calc.md.n_small_steps = sol.calc.md.n_every_steps*sol.calc.md.n_repeat_steps*2
+    with pytest.raises(ValueError):
+        sol.run_iterative_constrained_pressure_convergence(_Lammps())
@@ -0,0 +1,27 @@
+import os
+import sys
+import json
+import subprocess
+
+#modules that should only be imported when a calculation actually runs
+HEAVY_MODULES = ["pandas", "matplotlib", "mendeleev", "pyscal3", "lammps", "pylammpsmpi", "tqdm"]
+
+#best of three import times has to stay below this, in seconds
+STARTUP_LIMIT = float(os.environ.get("CALPHY_STARTUP_LIMIT", 1.5))
+
+def _import_queuekernel():
+	code = ("import time, sys, json; t = time.perf_counter(); import calphy.queuekernel; "
+		"t = time.perf_counter() - t; "
+		"print(json.dumps({'time': t, 'modules': sorted(m.split('.')[0] for m in sys.modules)}))")
+	out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+	return json.loads(out.stdout.strip().splitlines()[-1])
+
+def test_startup_modules():
+	res = _import_queuekernel()
+	loaded = [m for m in HEAVY_MODULES if m in res["modules"]]
+	assert loaded == []
+
+def test_startup_time():
+	times = [_import_queuekernel()["time"] for x in range(3)]
+	print("import calphy.queuekernel: %.3f s"%min(times))
+	assert min(times) < STARTUP_LIMIT